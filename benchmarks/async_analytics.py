@@ -0,0 +1,171 @@
+"""
+Concurrency benchmark: sync DRF analytics views vs the native async versions.
+
+Drives the ASGI application in-process with many concurrent clients that send
+their request slowly and read the response slowly, optionally adding latency to
+every SQL query to mimic a remote database.
+
+    python benchmarks/async_analytics.py --clients 200 --db-latency-ms 20
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BASE_DIR)
+
+ENDPOINTS = {
+    'sync': '/api/analytics/payment-methods/',
+    'async': '/api/async/analytics/payment-methods/',
+}
+
+
+def setup_django(db_path):
+    os.environ['DATABASE_URL'] = f'sqlite:///{db_path}'
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'dealflow.settings')
+    for key in ('DJANGO_SECRET_KEY', 'STRIPE_SECRET_KEY', 'STRIPE_PUBLISHABLE_KEY'):
+        os.environ.setdefault(key, 'benchmark')
+
+    import django
+    django.setup()
+
+    from django.conf import settings
+    settings.ALLOWED_HOSTS = ['*']
+    settings.USER_AUTH_CACHE_TTL = 3600
+
+    from django.core.management import call_command
+    call_command('migrate', verbosity=0)
+
+
+def seed(payments):
+    from django.contrib.auth.models import User
+    from rest_framework_simplejwt.tokens import RefreshToken
+    from payments.models import Payment, PaymentLink
+
+    user = User.objects.create_user(username='bench', password='bench-password')
+    link = PaymentLink.objects.create(user=user, amount='10.00', currency='USD', description='bench')
+    Payment.objects.bulk_create([
+        Payment(
+            payment_link=link,
+            stripe_payment_id=f'pi_bench_{index}',
+            amount='10.00',
+            currency='USD',
+            status='success' if index % 4 else 'failed',
+            payment_method='card' if index % 3 else 'amazon_pay',
+        )
+        for index in range(payments)
+    ])
+    return str(RefreshToken.for_user(user).access_token)
+
+
+def add_db_latency(latency_ms):
+    from django.db.backends.signals import connection_created
+
+    def delay(execute, sql, params, many, context):
+        time.sleep(latency_ms / 1000)
+        return execute(sql, params, many, context)
+
+    def install(sender, connection, **kwargs):
+        connection.execute_wrappers.append(delay)
+
+    connection_created.connect(install, weak=False)
+
+
+async def slow_client(application, path, token, client_delay):
+    body_chunks = [b'', b'']
+    scope = {
+        'type': 'http',
+        'asgi': {'version': '3.0'},
+        'http_version': '1.1',
+        'method': 'GET',
+        'scheme': 'http',
+        'path': path,
+        'raw_path': path.encode(),
+        'query_string': b'',
+        'root_path': '',
+        'headers': [
+            (b'host', b'127.0.0.1'),
+            (b'authorization', f'Bearer {token}'.encode()),
+        ],
+        'client': ('127.0.0.1', 50000),
+        'server': ('127.0.0.1', 80),
+    }
+    status = []
+    finished = asyncio.Event()
+
+    async def receive():
+        if not body_chunks:
+            # Body fully sent; the server now only listens for a disconnect
+            await finished.wait()
+            return {'type': 'http.disconnect'}
+        # Trickle the (empty) body in to keep the connection open like a slow client
+        await asyncio.sleep(client_delay)
+        chunk = body_chunks.pop()
+        return {'type': 'http.request', 'body': chunk, 'more_body': bool(body_chunks)}
+
+    async def send(message):
+        if message['type'] == 'http.response.start':
+            status.append(message['status'])
+        elif message['type'] == 'http.response.body':
+            await asyncio.sleep(client_delay)
+            if not message.get('more_body'):
+                finished.set()
+
+    started = time.perf_counter()
+    await application(scope, receive, send)
+    return time.perf_counter() - started, status[0]
+
+
+async def run(application, path, token, clients, client_delay):
+    started = time.perf_counter()
+    results = await asyncio.gather(*[
+        slow_client(application, path, token, client_delay) for _ in range(clients)
+    ])
+    elapsed = time.perf_counter() - started
+    latencies = sorted(latency for latency, _ in results)
+    errors = sum(1 for _, status in results if status != 200)
+    return {
+        'elapsed_s': elapsed,
+        'throughput_rps': clients / elapsed,
+        'p50_ms': statistics.median(latencies) * 1000,
+        'p95_ms': latencies[int(len(latencies) * 0.95) - 1] * 1000,
+        'errors': errors,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--clients', type=int, default=100, help="Concurrent clients per round")
+    parser.add_argument('--payments', type=int, default=2000, help="Payments to seed")
+    parser.add_argument('--client-delay-ms', type=float, default=50, help="Client send/receive delay")
+    parser.add_argument('--db-latency-ms', type=float, default=5, help="Latency added to every query")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        setup_django(os.path.join(tmpdir, 'bench.sqlite3'))
+        token = seed(args.payments)
+        if args.db_latency_ms:
+            add_db_latency(args.db_latency_ms)
+
+        from django.core.asgi import get_asgi_application
+        from dealflow.throttlers import AnalyticsUserThrottle
+        AnalyticsUserThrottle.rate = None
+        application = get_asgi_application()
+
+        print(f"{args.clients} clients, client delay {args.client_delay_ms} ms, "
+              f"DB latency {args.db_latency_ms} ms, {args.payments} payments")
+        for name, path in ENDPOINTS.items():
+            # Warm up imports and connections before measuring
+            asyncio.run(run(application, path, token, 5, 0))
+            result = asyncio.run(run(application, path, token, args.clients, args.client_delay_ms / 1000))
+            print(f"{name:>6}: {result['throughput_rps']:8.1f} req/s  "
+                  f"p50 {result['p50_ms']:8.1f} ms  p95 {result['p95_ms']:8.1f} ms  "
+                  f"errors {result['errors']}")
+
+
+if __name__ == '__main__':
+    main()
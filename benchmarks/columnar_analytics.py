@@ -0,0 +1,139 @@
+"""
+Analytics latency: SQL queries vs the in-memory columnar cache.
+
+Seeds one merchant with payments spread over currencies, payment methods,
+statuses and a year of dates, then runs the same filters and summaries both
+ways, checking they return the same data. Uses a temporary SQLite database
+unless DATABASE_URL is set. Needs NumPy.
+
+    python benchmarks/columnar_analytics.py --payments 200000 --repeat 20
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+import warnings
+from datetime import date, datetime, timedelta, timezone
+from decimal import Decimal
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BASE_DIR)
+
+QUERIES = {
+    'all rows': ('analytics', {}),
+    'one currency': ('analytics', {'currency': 'EUR'}),
+    'date range': ('analytics', {'start_date': date(2025, 6, 1), 'end_date': date(2025, 6, 30)}),
+    'amount range': ('analytics', {'start_amount': Decimal('50'), 'end_amount': Decimal('60')}),
+    'method + amount': ('analytics', {'payment_method': 'amazon_pay', 'start_amount': Decimal('95')}),
+    'methods summary': ('methods', None),
+    'currency totals': ('totals', None),
+}
+
+
+def setup_django(db_path):
+    os.environ.setdefault('DATABASE_URL', f'sqlite:///{db_path}')
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'dealflow.settings')
+    for key in ('DJANGO_SECRET_KEY', 'STRIPE_SECRET_KEY', 'STRIPE_PUBLISHABLE_KEY'):
+        os.environ.setdefault(key, 'benchmark')
+
+    import django
+    django.setup()
+
+    from django.core.management import call_command
+    call_command('migrate', verbosity=0)
+
+
+def seed(payments):
+    from django.contrib.auth.models import User
+    from payments.models import Payment, PaymentLink
+
+    rng = random.Random(42)
+    user = User.objects.create_user(username=f'bench-{time.time_ns()}', password='bench-password')
+    links = [
+        PaymentLink.objects.create(user=user, amount_minor=1000, currency='USD', description='bench')
+        for _ in range(20)
+    ]
+    start = datetime(2025, 1, 1, tzinfo=timezone.utc)
+    batch = []
+    for index in range(payments):
+        currency = rng.choice(['USD', 'USD', 'EUR', 'GBP', 'JPY'])
+        batch.append(Payment(
+            payment_link=rng.choice(links),
+            stripe_payment_id=f'pi_bench_{user.pk}_{index}',
+            amount_minor=rng.randrange(100, 20000),
+            currency=currency,
+            status=rng.choice(['success', 'success', 'success', 'failed', 'pending']),
+            payment_method=rng.choice(['card', 'card', 'amazon_pay', 'link', 'us_bank_account']),
+        ))
+        if len(batch) == 5000:
+            Payment.objects.bulk_create(batch)
+            batch = []
+    Payment.objects.bulk_create(batch)
+
+    # The timestamps are automatic, so spread them over the year afterwards. Otherwise every
+    # payment counts as just updated, and each request re-reads them all into the columns
+    seeded = list(Payment.objects.filter(payment_link__user=user).only('id'))
+    for payment in seeded:
+        payment.created_at = payment.updated_at = start + timedelta(seconds=rng.randrange(365 * 24 * 3600))
+    Payment.objects.bulk_update(seeded, ['created_at', 'updated_at'], batch_size=5000)
+    return user
+
+
+def run(user, kind, params):
+    from payments.views import analytics_views
+
+    if kind == 'analytics':
+        return analytics_views.payment_analytics_data(user, params)
+    if kind == 'methods':
+        return analytics_views.payment_methods_data(user)
+    return analytics_views.currency_totals_data(user)
+
+
+def timed(function, repeat):
+    latencies = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = function()
+        latencies.append(time.perf_counter() - started)
+    return result, statistics.median(latencies) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--payments', type=int, default=50000, help="Payments to seed")
+    parser.add_argument('--repeat', type=int, default=10, help="Runs per query; the median is reported")
+    args = parser.parse_args()
+    # The SQL date filters compare dates with a DateTimeField, which warns on every query
+    warnings.simplefilter('ignore', RuntimeWarning)
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        setup_django(os.path.join(tmpdir, 'bench.sqlite3'))
+        from django.test.utils import override_settings
+        from payments.columnar import columnar_cache
+
+        seeding = time.perf_counter()
+        user = seed(args.payments)
+        print(f"Seeded {args.payments} payments in {time.perf_counter() - seeding:.1f} s")
+
+        with override_settings(COLUMNAR_CACHE_USER_IDS=[user.pk]):
+            loading = time.perf_counter()
+            columnar_cache.query(user.pk, 'currency_total_rows')
+            print(f"Loaded columns in {(time.perf_counter() - loading) * 1000:.0f} ms, "
+                  f"{columnar_cache.stats()['bytes'] / 1024 / 1024:.1f} MiB\n")
+
+        print(f"{'query':<18}{'rows':>8}{'sql ms':>10}{'columnar ms':>13}{'speedup':>9}")
+        for name, (kind, params) in QUERIES.items():
+            sql, sql_ms = timed(lambda: run(user, kind, params), args.repeat)
+            with override_settings(COLUMNAR_CACHE_USER_IDS=[user.pk]):
+                columnar, columnar_ms = timed(lambda: run(user, kind, params), args.repeat)
+            # Rows with the same created_at may come back in either order
+            if sorted(map(repr, sql)) != sorted(map(repr, columnar)):
+                raise SystemExit(f"{name}: columnar results differ from SQL")
+            print(f"{name:<18}{len(sql):>8}{sql_ms:>10.1f}{columnar_ms:>13.1f}{sql_ms / columnar_ms:>8.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -5,9 +5,14 @@ set -o errexit
 # Modify this line as needed for your package manager (pip, poetry, etc.)
 pip install -r requirements.txt
 
-# Convert static asset files
-python manage.py collectstatic --no-input
+# Convert static asset files (the full settings include the drf_yasg assets for /api/docs/)
+python manage.py collectstatic --no-input --settings=dealflow.settings
+
+# Precompute the OpenAPI schema served at /api/docs/
+python manage.py generate_openapi_schema --settings=dealflow.settings
 
 # Apply any outstanding database migrations
 python manage.py migrate
 
+# Store the status of links that expired while no sweeper was running
+python manage.py expire_payment_links --purge-after-days 0
@@ -13,4 +13,9 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'dealflow.settings')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+# Imported once Django is set up; the middleware reads settings
+from dealflow.loadshedding import LoadSheddingMiddleware  # noqa: E402
+
+application = LoadSheddingMiddleware(django_application)
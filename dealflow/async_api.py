@@ -0,0 +1,69 @@
+import functools
+import math
+
+from django.http import JsonResponse
+from rest_framework import exceptions
+from rest_framework.utils.encoders import JSONEncoder
+
+from users.authentication import CachedJWTAuthentication
+
+
+def api_response(data, status=200, **kwargs):
+    """
+    JSON response encoded the same way DRF's JSONRenderer encodes it
+    """
+    return JsonResponse(data, status=status, safe=False, encoder=JSONEncoder, **kwargs)
+
+
+def async_api_view(methods=('GET',), throttle_classes=(), authentication_class=CachedJWTAuthentication):
+    """
+    Minimal async replacement for DRF's @api_view + IsAuthenticated + @throttle_classes.
+
+    DRF only runs views synchronously, so under ASGI every DRF view costs a thread
+    hop. This decorator authenticates and throttles with async APIs and leaves the
+    view to return a plain Django response (see api_response).
+    """
+    def decorator(view):
+        @functools.wraps(view)
+        async def wrapper(request, *args, **kwargs):
+            if request.method not in methods:
+                return api_response(
+                    {'detail': f'Method "{request.method}" not allowed.'},
+                    status=405,
+                    headers={'Allow': ', '.join(methods)},
+                )
+
+            authenticator = authentication_class()
+            try:
+                result = await authenticator.aauthenticate(request)
+            except exceptions.APIException as e:
+                return _unauthorized(authenticator, request, e.detail)
+            if result is None:
+                return _unauthorized(
+                    authenticator, request, "Authentication credentials were not provided."
+                )
+            request.user, request.auth = result
+
+            for throttle_class in throttle_classes:
+                throttle = throttle_class()
+                if not await throttle.aallow_request(request, wrapper):
+                    wait = throttle.wait()
+                    headers = {'Retry-After': str(math.ceil(wait))} if wait is not None else {}
+                    return api_response(
+                        {'detail': "Request was throttled."}, status=429, headers=headers
+                    )
+
+            return await view(request, *args, **kwargs)
+
+        wrapper.csrf_exempt = True
+        return wrapper
+
+    return decorator
+
+
+def _unauthorized(authenticator, request, detail):
+    return api_response(
+        {'detail': detail},
+        status=401,
+        headers={'WWW-Authenticate': authenticator.authenticate_header(request)},
+    )
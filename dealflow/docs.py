@@ -1,15 +1,153 @@
-from rest_framework import permissions
-from drf_yasg.views import get_schema_view
-from drf_yasg import openapi
-
-schema_view = get_schema_view(
-    openapi.Info(
-        title="Payment Link Manager API",
-        default_version='v1',
-        description="API for managing payment links and analytics",
-        contact=openapi.Contact(email="thiyagu.nataraj@gmail.com"),
-        license=openapi.License(name="BSD License"),
-    ),
-    public=True,
-    permission_classes=(permissions.AllowAny,),
-)
+import gzip
+import hashlib
+import logging
+import os
+import threading
+
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseNotModified
+from django.shortcuts import render
+from django.urls import reverse
+from django.utils.cache import patch_vary_headers
+from django.views.decorators.http import require_http_methods
+
+logger = logging.getLogger(__name__)
+
+API_INFO = {
+    'title': "Payment Link Manager API",
+    'default_version': 'v1',
+    'description': "API for managing payment links and analytics",
+    'contact_email': "thiyagu.nataraj@gmail.com",
+    'license_name': "BSD License",
+}
+
+
+def _openapi_info():
+    from drf_yasg import openapi
+
+    return openapi.Info(
+        title=API_INFO['title'],
+        default_version=API_INFO['default_version'],
+        description=API_INFO['description'],
+        contact=openapi.Contact(email=API_INFO['contact_email']),
+        license=openapi.License(name=API_INFO['license_name']),
+    )
+
+
+def generate_schema():
+    """
+    Introspect every view and serializer and return the encoded OpenAPI document
+    """
+    from drf_yasg.codecs import OpenAPICodecJson
+    from drf_yasg.generators import OpenAPISchemaGenerator
+
+    generator = OpenAPISchemaGenerator(_openapi_info())
+    schema = generator.get_schema(request=None, public=True)
+    return OpenAPICodecJson(validators=[]).encode(schema)
+
+
+def write_schema(content, path=None):
+    """
+    Write the schema and its gzip variant next to each other, returning the path
+    """
+    path = path or settings.OPENAPI_SCHEMA_PATH
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    for target, data in ((path, content), (f'{path}.gz', gzip.compress(content, mtime=0))):
+        tmp_path = f'{target}.tmp'
+        with open(tmp_path, 'wb') as fh:
+            fh.write(data)
+        os.replace(tmp_path, target)
+    return path
+
+
+class PrecomputedSchema:
+    """
+    In-memory copy of the schema file, reloaded only when the file changes on disk
+    """
+
+    def __init__(self, path=None):
+        self._path = path
+        self._lock = threading.Lock()
+        self._mtime = None
+        self.content = None
+        self.compressed = None
+        self.etag = None
+
+    @property
+    def path(self):
+        return self._path or settings.OPENAPI_SCHEMA_PATH
+
+    def load(self):
+        try:
+            mtime = (self.path, os.stat(self.path).st_mtime_ns)
+        except FileNotFoundError:
+            mtime = None
+
+        if mtime is not None and mtime == self._mtime:
+            return self
+
+        with self._lock:
+            if mtime is None:
+                if self.content is None:
+                    # Nothing was generated at build time; do it once for this process
+                    logger.warning(f"OpenAPI schema missing at {self.path}, generating it")
+                    self._set(generate_schema())
+                    try:
+                        write_schema(self.content, self.path)
+                        self._mtime = (self.path, os.stat(self.path).st_mtime_ns)
+                    except OSError as e:
+                        logger.error(f"Could not persist OpenAPI schema: {str(e)}")
+                return self
+
+            with open(self.path, 'rb') as fh:
+                self._set(fh.read())
+            self._mtime = mtime
+        return self
+
+    def _set(self, content):
+        self.content = content
+        self.compressed = gzip.compress(content, mtime=0)
+        self.etag = hashlib.sha256(content).hexdigest()[:32]
+
+
+precomputed_schema = PrecomputedSchema()
+
+
+def _accepts_gzip(request):
+    return 'gzip' in request.META.get('HTTP_ACCEPT_ENCODING', '')
+
+
+@require_http_methods(["GET", "HEAD"])
+def openapi_schema(request):
+    """
+    Serve the precomputed OpenAPI document with ETag revalidation and gzip
+    """
+    schema = precomputed_schema.load()
+    use_gzip = _accepts_gzip(request)
+    etag = f'"{schema.etag}-gzip"' if use_gzip else f'"{schema.etag}"'
+
+    if etag in request.META.get('HTTP_IF_NONE_MATCH', ''):
+        response = HttpResponseNotModified()
+    else:
+        response = HttpResponse(
+            schema.compressed if use_gzip else schema.content,
+            content_type='application/json',
+        )
+        if use_gzip:
+            response['Content-Encoding'] = 'gzip'
+
+    response['ETag'] = etag
+    response['Cache-Control'] = 'public, max-age=300'
+    patch_vary_headers(response, ('Accept-Encoding',))
+    return response
+
+
+@require_http_methods(["GET"])
+def swagger_ui(request):
+    """
+    Render Swagger UI against the precomputed schema
+    """
+    return render(request, 'dealflow/swagger_ui.html', {
+        'title': API_INFO['title'],
+        'schema_url': reverse('openapi-schema'),
+    })
@@ -0,0 +1,160 @@
+"""
+Adaptive load shedding for the ASGI application.
+
+Each worker process keeps one concurrency limit, adjusted from observed latency
+with AIMD. When a protected request (checkout, webhooks, everything else except
+analytics) takes longer than LOAD_SHED_TARGET_LATENCY to start its response, the
+limit shrinks by LOAD_SHED_BACKOFF, at most once per LOAD_SHED_WINDOW so one
+slow burst isn't counted many times. While requests stay fast and the limit is
+at least half used, it grows by about one per limit's worth of completions.
+
+Priority classes get a share of the limit. A request is admitted while the
+requests in flight are under its class's share, so analytics is refused first,
+then the default class, and checkout and Stripe webhooks last. Refused requests
+get an immediate 503 with Retry-After instead of queueing inside the worker.
+Streaming and operational endpoints are never limited.
+
+Runs on the event loop, so the counters need no locking.
+"""
+import json
+import logging
+import time
+from collections import Counter, namedtuple
+
+from django.conf import settings
+
+from dealflow import metrics
+
+logger = logging.getLogger(__name__)
+
+Priority = namedtuple('Priority', ['name', 'share', 'prefixes'])
+
+# Checked in order; the first matching prefix wins
+PRIORITIES = (
+    # Server-sent events hold a connection for minutes; metrics and health checks must answer under load
+    Priority('exempt', None, ('/api/events/', '/api/metrics/', '/static/')),
+    Priority('critical', 1.0, ('/webhooks/stripe/', '/payment/', '/api/payment/')),
+    Priority('low', 0.5, ('/api/analytics/', '/api/async/analytics/', '/api/search/', '/api/changes/', '/api/docs/')),
+)
+DEFAULT_PRIORITY = Priority('default', 0.8, ())
+
+
+def classify(path):
+    if path == '/':
+        return PRIORITIES[0]
+    for priority in PRIORITIES:
+        if path.startswith(priority.prefixes):
+            return priority
+    return DEFAULT_PRIORITY
+
+
+class AdaptiveLimiter:
+    def __init__(self, initial, minimum, maximum, target_latency, backoff=0.9, window=1.0, clock=time.monotonic):
+        self.limit = float(initial)
+        self.minimum = minimum
+        self.maximum = maximum
+        self.target_latency = target_latency
+        self.backoff = backoff
+        self.window = window
+        self.clock = clock
+        self.in_flight = 0
+        self._last_decrease = float('-inf')
+        self._in_flight = Counter()
+        self._admitted = Counter()
+        self._shed = Counter()
+
+    @classmethod
+    def from_settings(cls):
+        return cls(
+            initial=settings.LOAD_SHED_INITIAL_LIMIT,
+            minimum=settings.LOAD_SHED_MIN_LIMIT,
+            maximum=settings.LOAD_SHED_MAX_LIMIT,
+            target_latency=settings.LOAD_SHED_TARGET_LATENCY,
+            backoff=settings.LOAD_SHED_BACKOFF,
+            window=settings.LOAD_SHED_WINDOW,
+        )
+
+    def try_acquire(self, priority):
+        if self.in_flight >= self.limit * priority.share:
+            self._shed[priority.name] += 1
+            return False
+        self.in_flight += 1
+        self._in_flight[priority.name] += 1
+        self._admitted[priority.name] += 1
+        return True
+
+    def release(self, priority, latency):
+        self.in_flight -= 1
+        self._in_flight[priority.name] -= 1
+        # Analytics is what gets shed, so its latency doesn't steer the limit
+        if priority.name == 'low':
+            return
+
+        if latency > self.target_latency:
+            now = self.clock()
+            if now - self._last_decrease >= self.window and self.limit > self.minimum:
+                self._last_decrease = now
+                self.limit = max(self.minimum, self.limit * self.backoff)
+                logger.warning(f"Load shedding limit lowered to {self.limit:.1f} after a {latency:.2f}s response")
+        elif self.in_flight + 1 >= self.limit / 2:
+            # Only grow while the limit is actually in use, or it drifts up while idle
+            self.limit = min(self.maximum, self.limit + 1 / self.limit)
+
+    def stats(self):
+        return {
+            'limit': round(self.limit, 1),
+            'in_flight': dict(self._in_flight),
+            'admitted': dict(self._admitted),
+            'shed': dict(self._shed),
+        }
+
+
+class LoadSheddingMiddleware:
+    """
+    ASGI middleware; wraps the Django application in dealflow/asgi.py
+    """
+
+    def __init__(self, app, limiter=None):
+        self.app = app
+        self.limiter = limiter or AdaptiveLimiter.from_settings()
+        metrics.register('load_shedding', self.limiter.stats)
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http' or not settings.LOAD_SHED_ENABLED:
+            return await self.app(scope, receive, send)
+
+        priority = classify(scope['path'])
+        if priority.share is None:
+            return await self.app(scope, receive, send)
+        if not self.limiter.try_acquire(priority):
+            return await self.reject(send)
+
+        started = time.monotonic()
+        response_started = None
+
+        async def timed_send(message):
+            nonlocal response_started
+            if message['type'] == 'http.response.start' and response_started is None:
+                response_started = time.monotonic()
+            await send(message)
+
+        try:
+            await self.app(scope, receive, timed_send)
+        finally:
+            self.limiter.release(priority, (response_started or time.monotonic()) - started)
+
+    async def reject(self, send):
+        body = json.dumps({
+            "error": "Server busy",
+            "detail": "Too many requests are in progress, retry shortly."
+        }).encode()
+        await send({
+            'type': 'http.response.start',
+            'status': 503,
+            'headers': [
+                (b'content-type', b'application/json'),
+                (b'content-length', str(len(body)).encode()),
+                (b'retry-after', str(settings.LOAD_SHED_RETRY_AFTER).encode()),
+            ],
+        })
+        await send({'type': 'http.response.body', 'body': body})
@@ -0,0 +1,58 @@
+"""
+Process-local runtime metrics.
+
+Subsystems register a collector returning a JSON-serializable dict; the staff-only
+metrics endpoint reports every collector for the worker process that served it.
+"""
+import logging
+import os
+
+from django.db import connections
+from rest_framework.decorators import api_view, permission_classes
+from rest_framework.permissions import IsAdminUser
+from rest_framework.response import Response
+
+logger = logging.getLogger(__name__)
+
+_collectors = {}
+
+
+def register(name, collector):
+    _collectors[name] = collector
+
+
+def collect():
+    metrics = {'pid': os.getpid()}
+    for name, collector in _collectors.items():
+        try:
+            metrics[name] = collector()
+        except Exception as e:
+            logger.error(f"Error collecting {name} metrics: {str(e)}")
+            metrics[name] = {'error': str(e)}
+    return metrics
+
+
+def database_pool_stats():
+    """
+    psycopg pool counters per database alias: pool size, waiting requests,
+    requests_wait_ms (time spent waiting for a connection) and connections_ms
+    (time spent opening new ones). None for aliases that aren't pooled.
+    """
+    stats = {}
+    for alias in connections:
+        # Only the PostgreSQL backend has a pool, and only when OPTIONS['pool'] is set
+        pool = getattr(connections[alias], 'pool', None)
+        stats[alias] = pool.get_stats() if pool is not None else None
+    return stats
+
+
+register('database_pools', database_pool_stats)
+
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def metrics(request):
+    """
+    Runtime metrics of the worker process that served the request
+    """
+    return Response(collect())
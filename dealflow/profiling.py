@@ -0,0 +1,333 @@
+"""
+On-demand profiling of single requests, for staff.
+
+A staff user adds an X-Dealflow-Profile header, or ?_profile=1, to a request.
+The request then runs under cProfile with every SQL statement timed, and the
+report is saved under PROFILE_DIR. Its id is returned in the X-Profile-Id header.
+GET /api/profiles/<id>/ downloads the JSON report with the slowest functions and
+the queries. GET /api/profiles/<id>/pstats/ downloads the raw profile, for pstats
+or snakeviz.
+
+Requests without the flag only pay for two string lookups. The flag is ignored
+for anyone but staff. A worker profiles one request at a time, since profilers
+can't nest, and a flagged request that arrives meanwhile runs unprofiled. Under
+ASGI the event loop thread is profiled, so the profile also holds any other
+request that ran there meanwhile. A sync view runs in the request's
+thread-sensitive thread, which is profiled too from process_view until the
+response is back; other sync_to_async threads are missed.
+"""
+import cProfile
+import json
+import logging
+import marshal
+import pstats
+import re
+import threading
+import time
+from collections import defaultdict
+from uuid import uuid4
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage
+from django.http import FileResponse
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.decorators import api_view, permission_classes
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework.permissions import IsAdminUser
+from rest_framework.response import Response
+
+from dealflow.querycount import normalize_sql
+from users.authentication import CachedJWTAuthentication
+
+logger = logging.getLogger(__name__)
+
+PROFILE_HEADER = 'HTTP_X_DEALFLOW_PROFILE'
+PROFILE_PARAM = '_profile'
+_PROFILE_ID = re.compile(r'^\d{8}T\d{12}-[0-9a-f]{8}$')
+_profiling = threading.Lock()
+
+
+def profile_requested(request):
+    if PROFILE_HEADER in request.META:
+        return True
+    return PROFILE_PARAM in request.META.get('QUERY_STRING', '') and PROFILE_PARAM in request.GET
+
+
+def profile_storage():
+    return FileSystemStorage(location=settings.PROFILE_DIR)
+
+
+def _is_staff(user):
+    return user is not None and user.is_authenticated and user.is_staff
+
+
+def staff_user(request):
+    """
+    The staff user making the request, from the session or the JWT, else None
+    """
+    user = getattr(request, 'user', None)
+    if _is_staff(user):
+        return user
+    try:
+        authenticated = CachedJWTAuthentication().authenticate(request)
+    except AuthenticationFailed:
+        return None
+    return authenticated[0] if authenticated and _is_staff(authenticated[0]) else None
+
+
+async def astaff_user(request):
+    user = await request.auser() if hasattr(request, 'auser') else None
+    if _is_staff(user):
+        return user
+    try:
+        authenticated = await CachedJWTAuthentication().aauthenticate(request)
+    except AuthenticationFailed:
+        return None
+    return authenticated[0] if authenticated and _is_staff(authenticated[0]) else None
+
+
+class RequestProfile:
+    def __init__(self, request, user):
+        self.request = request
+        self.user = user
+        self.profiler = cProfile.Profile()
+        self.thread_profiler = None
+        self.tracker = getattr(request, 'query_tracker', None)
+
+    def start(self):
+        if self.tracker is not None:
+            self.tracker.queries = []
+        self.started = time.perf_counter()
+        self.profiler.enable()
+
+    def start_thread(self):
+        """
+        Also profile the calling thread, until stop_thread is called from it
+        """
+        self.thread_profiler = cProfile.Profile()
+        self.thread_profiler.enable()
+
+    def stop_thread(self):
+        if self.thread_profiler is not None:
+            self.thread_profiler.disable()
+
+    def stats(self):
+        stats = pstats.Stats(self.profiler)
+        if self.thread_profiler is not None:
+            stats.add(self.thread_profiler)
+        return stats
+
+    def stop(self, response):
+        self.profiler.disable()
+        duration = time.perf_counter() - self.started
+        try:
+            stats = self.stats()
+            profile_id = save_profile(self.report(response, duration, stats), stats)
+        except Exception as e:
+            logger.error(f"Error saving profile of {self.request.method} {self.request.path}: {str(e)}")
+            return
+        response['X-Profile-Id'] = profile_id
+        logger.info(f"Profiled {self.request.method} {self.request.path} for user {self.user.pk} as {profile_id}")
+
+    def report(self, response, duration, stats):
+        queries = self.tracker.queries if self.tracker is not None else []
+        return {
+            'method': self.request.method,
+            'path': self.request.get_full_path(),
+            'user_id': self.user.pk,
+            'status': response.status_code,
+            'created_at': timezone.now().isoformat(),
+            'duration_ms': round(duration * 1000, 2),
+            'sql': sql_report(queries),
+            'functions': function_report(stats, settings.PROFILE_TOP_FUNCTIONS),
+        }
+
+
+def sql_report(queries):
+    """
+    Every statement in order with its duration, and the statements grouped by
+    shape with the slowest group first
+    """
+    groups = defaultdict(lambda: {'count': 0, 'duration_ms': 0.0})
+    for sql, duration in queries:
+        group = groups[normalize_sql(sql)]
+        group['count'] += 1
+        group['duration_ms'] += duration * 1000
+    return {
+        'count': len(queries),
+        'duration_ms': round(sum(duration for _, duration in queries) * 1000, 2),
+        'queries': [{'sql': sql, 'duration_ms': round(duration * 1000, 3)} for sql, duration in queries],
+        'by_statement': sorted(
+            ({'sql': sql, 'count': group['count'], 'duration_ms': round(group['duration_ms'], 3)}
+             for sql, group in groups.items()),
+            key=lambda group: -group['duration_ms'],
+        ),
+    }
+
+
+def function_report(stats, limit):
+    rows = sorted(stats.stats.items(), key=lambda item: -item[1][3])[:limit]
+    return [
+        {
+            'function': f"{filename}:{line}({name})",
+            'calls': calls,
+            'own_ms': round(own * 1000, 3),
+            'cumulative_ms': round(cumulative * 1000, 3),
+        }
+        for (filename, line, name), (_, calls, own, cumulative, _) in rows
+    ]
+
+
+def save_profile(report, stats):
+    """
+    Write the report and raw profile, and drop the oldest beyond PROFILE_KEEP
+    """
+    storage = profile_storage()
+    profile_id = f"{timezone.now():%Y%m%dT%H%M%S%f}-{uuid4().hex[:8]}"
+    report = {'id': profile_id, **report}
+    # What pstats.Stats.dump_stats writes, so the file loads in pstats and snakeviz
+    storage.save(f"{profile_id}.prof", ContentFile(marshal.dumps(stats.stats)))
+    storage.save(f"{profile_id}.json", ContentFile(json.dumps(report, indent=2).encode()))
+
+    for stale in saved_profile_ids(storage)[settings.PROFILE_KEEP:]:
+        storage.delete(f"{stale}.prof")
+        storage.delete(f"{stale}.json")
+    return profile_id
+
+
+def saved_profile_ids(storage):
+    """
+    Newest first; ids start with their creation time
+    """
+    if not storage.exists(''):
+        return []
+    _, files = storage.listdir('')
+    return sorted((name[:-5] for name in files if name.endswith('.json')), reverse=True)
+
+
+class ProfilingMiddleware:
+    """
+    Goes after AuthenticationMiddleware, so session-authenticated staff are known,
+    and inside QueryTrackingMiddleware, whose tracker times the queries
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+            # Async, so Django doesn't hop to a thread to call it for every request
+            self.process_view = self.aprocess_view
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not profile_requested(request) or not settings.PROFILE_ENABLED:
+            return self.get_response(request)
+        user = staff_user(request)
+        if user is None or not _profiling.acquire(blocking=False):
+            return self.get_response(request)
+
+        try:
+            profile = RequestProfile(request, user)
+            profile.start()
+            try:
+                response = self.get_response(request)
+            except BaseException:
+                profile.profiler.disable()
+                raise
+            profile.stop(response)
+            return response
+        finally:
+            _profiling.release()
+
+    async def __acall__(self, request):
+        if not profile_requested(request) or not settings.PROFILE_ENABLED:
+            return await self.get_response(request)
+        user = await astaff_user(request)
+        if user is None or not _profiling.acquire(blocking=False):
+            return await self.get_response(request)
+
+        try:
+            profile = request.request_profile = RequestProfile(request, user)
+            profile.start()
+            try:
+                response = await self.get_response(request)
+            except BaseException:
+                profile.profiler.disable()
+                raise
+            finally:
+                # Thread-sensitive, so this runs in the thread that ran a sync view
+                await sync_to_async(profile.stop_thread)()
+            profile.stop(response)
+            return response
+        finally:
+            _profiling.release()
+
+    async def aprocess_view(self, request, view_func, view_args, view_kwargs):
+        profile = getattr(request, 'request_profile', None)
+        if profile is not None and not iscoroutinefunction(view_func):
+            # Django runs the view in the request's thread-sensitive thread, which this runs in too
+            await sync_to_async(profile.start_thread)()
+        return None
+
+
+def _not_found():
+    return Response({
+        "error": "Profile not found",
+        "detail": "It may have been replaced by newer profiles."
+    }, status=status.HTTP_404_NOT_FOUND)
+
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def profile_list(request):
+    """
+    Reports saved by this server, newest first
+    """
+    storage = profile_storage()
+    profiles = []
+    for profile_id in saved_profile_ids(storage):
+        try:
+            with storage.open(f"{profile_id}.json") as report_file:
+                report = json.load(report_file)
+        except FileNotFoundError:
+            # Pruned by a concurrent save
+            continue
+        profiles.append({
+            **{key: report[key] for key in ('id', 'method', 'path', 'user_id', 'status', 'created_at', 'duration_ms')},
+            'query_count': report['sql']['count'],
+            'sql_ms': report['sql']['duration_ms'],
+        })
+    return Response(profiles)
+
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def profile_report(request, profile_id):
+    """
+    Download a profile's JSON report
+    """
+    return _download(profile_id, 'json')
+
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def profile_pstats(request, profile_id):
+    """
+    Download a profile in pstats format
+    """
+    return _download(profile_id, 'prof')
+
+
+def _download(profile_id, extension):
+    storage = profile_storage()
+    name = f"{profile_id}.{extension}"
+    if not _PROFILE_ID.match(profile_id) or not storage.exists(name):
+        return _not_found()
+    return FileResponse(storage.open(name), as_attachment=True, filename=name)
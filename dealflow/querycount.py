@@ -0,0 +1,166 @@
+"""
+Per-request SQL tracking: N+1 detection and declared query budgets.
+
+Every database connection gets an execute wrapper that reports to the tracker of
+the current request (a context variable, so it follows async views into their
+sync_to_async threads). QueryTrackingMiddleware logs queries that repeat with
+only their parameters changing, with the stack that issued them, and logs views
+that run more queries than their @query_budget. QueryBudgetTestMixin makes the
+same budgets fail tests.
+"""
+import contextvars
+import logging
+import re
+import time
+import traceback
+from collections import Counter
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+
+logger = logging.getLogger(__name__)
+
+_current_tracker = contextvars.ContextVar('query_tracker', default=None)
+
+_IN_LIST = re.compile(r'\bIN \((?:%s, )*%s\)')
+_LITERALS = re.compile(r"'(?:[^']|'')*'|\b\d+\b")
+# Frames from these paths say nothing about which of our code issued the query
+_LIBRARY_PATHS = ('/django/', '/rest_framework/', '/asgiref/', '/site-packages/', '/dealflow/querycount.py')
+
+
+def normalize_sql(sql):
+    """
+    Collapse parameters, literals and IN lists so queries that differ only in their values compare equal
+    """
+    return _LITERALS.sub('?', _IN_LIST.sub('IN (...)', sql))
+
+
+def query_budget(max_queries):
+    """
+    Declare the most queries a view may run per request, whatever the amount of data.
+    Apply it above @api_view / @async_api_view so it marks the view Django resolves to.
+    """
+    def decorator(view):
+        view.query_budget = max_queries
+        return view
+    return decorator
+
+
+def get_query_budget(view):
+    return getattr(view, 'query_budget', None)
+
+
+class QueryTracker:
+    def __init__(self, repeat_threshold):
+        self.repeat_threshold = repeat_threshold
+        self.count = 0
+        self.duration = 0.0
+        self.repeats = Counter()
+        self.stacks = {}
+        # Set to a list to keep every (sql, duration), as request profiling does
+        self.queries = None
+
+    def record(self, sql, duration):
+        self.count += 1
+        self.duration += duration
+        if self.queries is not None:
+            self.queries.append((sql, duration))
+        key = normalize_sql(sql)
+        self.repeats[key] += 1
+        if self.repeats[key] == self.repeat_threshold:
+            # Only the first offending call pays for a stack walk
+            self.stacks[key] = ''.join(traceback.format_list([
+                frame for frame in traceback.extract_stack()
+                if not any(path in frame.filename for path in _LIBRARY_PATHS)
+            ]))
+
+    def repeated_queries(self):
+        return [(sql, count, self.stacks[sql]) for sql, count in self.repeats.items() if sql in self.stacks]
+
+
+def track_query(execute, sql, params, many, context):
+    tracker = _current_tracker.get()
+    if tracker is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        tracker.record(sql, time.perf_counter() - started)
+
+
+def install_query_tracking(sender, connection, **kwargs):
+    if track_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(track_query)
+
+
+class QueryTrackingMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+        connection_created.connect(install_query_tracking, dispatch_uid='dealflow.querycount')
+        for connection in connections.all(initialized_only=True):
+            install_query_tracking(None, connection)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        token = self._start(request)
+        try:
+            return self.get_response(request)
+        finally:
+            self._finish(request, token)
+
+    async def __acall__(self, request):
+        token = self._start(request)
+        try:
+            return await self.get_response(request)
+        finally:
+            self._finish(request, token)
+
+    def _start(self, request):
+        request.query_tracker = QueryTracker(settings.QUERY_REPEAT_THRESHOLD)
+        return _current_tracker.set(request.query_tracker)
+
+    def _finish(self, request, token):
+        _current_tracker.reset(token)
+        tracker = request.query_tracker
+        for sql, count, stack in tracker.repeated_queries():
+            logger.warning(f"Query repeated {count} times in {request.method} {request.path}: {sql}\n{stack}")
+
+        match = getattr(request, 'resolver_match', None)
+        budget = get_query_budget(match.func) if match else None
+        if budget is not None and tracker.count > budget:
+            logger.warning(
+                f"{request.method} {request.path} ran {tracker.count} queries, "
+                f"over its budget of {budget}"
+            )
+
+
+class QueryBudgetTestMixin:
+    """
+    TestCase mixin: assertWithinQueryBudget(make_request) fails when the view
+    that served the request ran more queries than its @query_budget
+    """
+
+    def assertWithinQueryBudget(self, make_request):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+
+        with CaptureQueriesContext(connection) as queries:
+            response = make_request()
+        view = response.resolver_match.func
+        budget = get_query_budget(view)
+        self.assertIsNotNone(budget, f"{response.resolver_match.view_name} has no @query_budget")
+        if len(queries) > budget:
+            self.fail(
+                f"{response.resolver_match.view_name} ran {len(queries)} queries, over its budget of {budget}:\n"
+                + '\n'.join(query['sql'] for query in queries.captured_queries)
+            )
+        return response
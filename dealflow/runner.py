@@ -0,0 +1,19 @@
+from django.conf import settings
+from django.test.runner import DiscoverRunner
+
+
+class TestRunner(DiscoverRunner):
+    """
+    Turns the write-behind funnel counters off, so counts recorded by one test
+    are never flushed by a later test's request, or at exit once the test
+    database is gone. Tests of the funnel turn them back on.
+    """
+
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self._funnel_enabled = settings.FUNNEL_ENABLED
+        settings.FUNNEL_ENABLED = False
+
+    def teardown_test_environment(self, **kwargs):
+        settings.FUNNEL_ENABLED = self._funnel_enabled
+        super().teardown_test_environment(**kwargs)
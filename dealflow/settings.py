@@ -14,18 +14,15 @@ import os
 from pathlib import Path
 import environ
 import dj_database_url
+from corsheaders.defaults import default_headers
 
 
-from pathlib import Path
-
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
 # Initialize environ
 env = environ.Env()
-environ.Env.read_env()
 
-print(os.path.join(BASE_DIR, '.env'))
 # Take environment variables from .env file
 environ.Env.read_env(os.path.join(BASE_DIR, '.env'))
 
@@ -55,6 +52,7 @@ INSTALLED_APPS = [
     'rest_framework_simplejwt',
     'corsheaders',
     'payments',
+    'users',
     'drf_yasg',
     'django_extensions',
 ]
@@ -62,6 +60,7 @@ INSTALLED_APPS = [
 MIDDLEWARE = [
     'whitenoise.middleware.WhiteNoiseMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    'dealflow.querycount.QueryTrackingMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -69,6 +68,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'dealflow.profiling.ProfilingMiddleware',
 ]
 
 ROOT_URLCONF = 'dealflow.urls'
@@ -76,7 +76,7 @@ ROOT_URLCONF = 'dealflow.urls'
 TEMPLATES = [
     {
         'BACKEND': 'django.template.backends.django.DjangoTemplates',
-        'DIRS': [],
+        'DIRS': [os.path.join(BASE_DIR, 'dealflow', 'templates')],
         'APP_DIRS': True,
         'OPTIONS': {
             'context_processors': [
@@ -102,6 +102,29 @@ DATABASES = {
     )
 }
 
+# Under the uvicorn workers sync code runs in executor threads, so persistent
+# per-thread connections are opened and closed far more often than conn_max_age
+# suggests. On Postgres each worker process shares one psycopg connection pool
+# instead; size it so WEB_CONCURRENCY * DB_POOL_MAX_SIZE stays under the
+# server's max_connections.
+DB_POOL_ENABLED = env.bool('DB_POOL_ENABLED', default=True)
+if DB_POOL_ENABLED and DATABASES['default']['ENGINE'] == 'django.db.backends.postgresql':
+    # Django hands pooled connections back on request_finished; it refuses pools with persistent connections
+    DATABASES['default']['CONN_MAX_AGE'] = 0
+    from psycopg_pool import ConnectionPool
+
+    DATABASES['default'].setdefault('OPTIONS', {})['pool'] = {
+        'min_size': env.int('DB_POOL_MIN_SIZE', default=2),
+        'max_size': env.int('DB_POOL_MAX_SIZE', default=10),
+        # Seconds a request waits for a free connection before failing
+        'timeout': env.float('DB_POOL_TIMEOUT', default=10),
+        'max_lifetime': env.float('DB_POOL_MAX_LIFETIME', default=1800),
+        'max_idle': env.float('DB_POOL_MAX_IDLE', default=300),
+        'name': 'dealflow',
+        # Test each connection as it is handed out, so ones dropped by the server are replaced
+        'check': ConnectionPool.check_connection,
+    }
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
@@ -147,7 +170,7 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'users.authentication.CachedJWTAuthentication',
 
     ],
     'DEFAULT_PERMISSION_CLASSES': [
@@ -163,6 +186,17 @@ REST_FRAMEWORK = {
 STRIPE_SECRET_KEY = env('STRIPE_SECRET_KEY')
 STRIPE_PUBLISHABLE_KEY = env('STRIPE_PUBLISHABLE_KEY')
 STRIPE_WEBHOOK_SECRET = env('STRIPE_WEBHOOK_SECRET', default='')
+STRIPE_API_BASE = env('STRIPE_API_BASE', default='https://api.stripe.com')
+
+# Stripe gateway (payments/gateway.py): timeouts in seconds, retries apply to reads only
+STRIPE_CONNECT_TIMEOUT = env.float('STRIPE_CONNECT_TIMEOUT', default=2)
+STRIPE_CREATE_TIMEOUT = env.float('STRIPE_CREATE_TIMEOUT', default=10)
+STRIPE_RETRIEVE_TIMEOUT = env.float('STRIPE_RETRIEVE_TIMEOUT', default=5)
+STRIPE_MAX_RETRIES = env.int('STRIPE_MAX_RETRIES', default=2)
+STRIPE_RETRY_BASE_DELAY = env.float('STRIPE_RETRY_BASE_DELAY', default=0.25)
+STRIPE_RETRY_MAX_DELAY = env.float('STRIPE_RETRY_MAX_DELAY', default=2)
+STRIPE_BREAKER_FAILURE_THRESHOLD = env.int('STRIPE_BREAKER_FAILURE_THRESHOLD', default=5)
+STRIPE_BREAKER_RESET_TIMEOUT = env.float('STRIPE_BREAKER_RESET_TIMEOUT', default=30)
 
 
 SIMPLE_JWT = {
@@ -174,9 +208,122 @@ SIMPLE_JWT = {
     'AUTH_HEADER_TYPES': ('Bearer',),
 }
 
+# Seconds a worker trusts its cached copy of a user's active/staff flags
+USER_AUTH_CACHE_TTL = env.int('USER_AUTH_CACHE_TTL', default=60)
+
+# Checkout funnel counters are written to the database at most this often
+# (seconds) per worker, or sooner once this many events are pending
+FUNNEL_FLUSH_INTERVAL = env.int('FUNNEL_FLUSH_INTERVAL', default=10)
+FUNNEL_FLUSH_MAX_PENDING = env.int('FUNNEL_FLUSH_MAX_PENDING', default=1000)
+FUNNEL_ENABLED = env.bool('FUNNEL_ENABLED', default=True)
+
+# Turns the funnel counters off while tests run
+TEST_RUNNER = 'dealflow.runner.TestRunner'
+
+# Changes feed: rows updated in the last CHANGES_FEED_LAG seconds are held back
+# until every transaction that could have written them has committed
+CHANGES_FEED_LAG = env.int('CHANGES_FEED_LAG', default=5)
+CHANGES_FEED_MAX_LIMIT = env.int('CHANGES_FEED_MAX_LIMIT', default=10000)
+
+# Live payment events (SSE). The in-process broker only reaches streams held by
+# the worker that handled the webhook; point EVENT_BROKER at a shared broker
+# when running several workers.
+EVENT_BROKER = env('EVENT_BROKER', default='payments.events.InProcessBroker')
+EVENT_STREAM_MAX_CONNECTIONS_PER_USER = env.int('EVENT_STREAM_MAX_CONNECTIONS_PER_USER', default=5)
+# Events buffered per connection before a slow client is told to resync
+EVENT_STREAM_QUEUE_SIZE = env.int('EVENT_STREAM_QUEUE_SIZE', default=100)
+EVENT_STREAM_HEARTBEAT = env.int('EVENT_STREAM_HEARTBEAT', default=15)
+EVENT_STREAM_RETRY_MS = env.int('EVENT_STREAM_RETRY_MS', default=3000)
+
+# expire_payment_links deletes expired links with no payments this many days after they expired; 0 keeps them
+PAYMENT_LINK_PURGE_AFTER_DAYS = env.int('PAYMENT_LINK_PURGE_AFTER_DAYS', default=90)
+
+# Deepest result (page * page_size) the search endpoint pages to
+SEARCH_MAX_RESULTS = env.int('SEARCH_MAX_RESULTS', default=1000)
+
+# Email; the send_notifications worker sends payment notifications through this backend
+EMAIL_BACKEND = env('EMAIL_BACKEND', default='django.core.mail.backends.smtp.EmailBackend')
+EMAIL_HOST = env('EMAIL_HOST', default='localhost')
+EMAIL_PORT = env.int('EMAIL_PORT', default=25)
+EMAIL_HOST_USER = env('EMAIL_HOST_USER', default='')
+EMAIL_HOST_PASSWORD = env('EMAIL_HOST_PASSWORD', default='')
+EMAIL_USE_TLS = env.bool('EMAIL_USE_TLS', default=False)
+EMAIL_TIMEOUT = env.int('EMAIL_TIMEOUT', default=10)
+DEFAULT_FROM_EMAIL = env('DEFAULT_FROM_EMAIL', default='payments@dealflow.local')
+# Where the file-based backend writes emails, for local testing
+EMAIL_FILE_PATH = env('EMAIL_FILE_PATH', default=os.path.join(BASE_DIR, 'sent_emails'))
+
+# Notification outbox worker (payments/notifications.py); delays and lease in seconds
+NOTIFICATION_BATCH_SIZE = env.int('NOTIFICATION_BATCH_SIZE', default=100)
+NOTIFICATION_MAX_ATTEMPTS = env.int('NOTIFICATION_MAX_ATTEMPTS', default=8)
+NOTIFICATION_RETRY_BASE_DELAY = env.int('NOTIFICATION_RETRY_BASE_DELAY', default=30)
+NOTIFICATION_RETRY_MAX_DELAY = env.int('NOTIFICATION_RETRY_MAX_DELAY', default=3600)
+NOTIFICATION_LEASE = env.int('NOTIFICATION_LEASE', default=300)
+
+# Merchant webhook delivery (payments/merchant_webhooks.py); timeouts, delays and lease in seconds
+WEBHOOK_DELIVERY_WORKERS = env.int('WEBHOOK_DELIVERY_WORKERS', default=16)
+WEBHOOK_BATCH_SIZE = env.int('WEBHOOK_BATCH_SIZE', default=200)
+# Most deliveries one endpoint gets per claim, so a backlog for one merchant can't fill a batch
+WEBHOOK_MAX_PER_ENDPOINT = env.int('WEBHOOK_MAX_PER_ENDPOINT', default=20)
+WEBHOOK_CONNECT_TIMEOUT = env.float('WEBHOOK_CONNECT_TIMEOUT', default=3)
+WEBHOOK_TIMEOUT = env.float('WEBHOOK_TIMEOUT', default=5)
+WEBHOOK_MAX_ATTEMPTS = env.int('WEBHOOK_MAX_ATTEMPTS', default=10)
+WEBHOOK_RETRY_BASE_DELAY = env.int('WEBHOOK_RETRY_BASE_DELAY', default=30)
+WEBHOOK_RETRY_MAX_DELAY = env.int('WEBHOOK_RETRY_MAX_DELAY', default=6 * 3600)
+WEBHOOK_LEASE = env.int('WEBHOOK_LEASE', default=300)
+WEBHOOK_MAX_ENDPOINTS_PER_USER = env.int('WEBHOOK_MAX_ENDPOINTS_PER_USER', default=10)
+# Deliver to loopback and private addresses; only for local development
+WEBHOOK_ALLOW_PRIVATE_NETWORKS = env.bool('WEBHOOK_ALLOW_PRIVATE_NETWORKS', default=DEBUG)
+
+# How long a stored Idempotency-Key response is replayed, and how long a request may hold its key (seconds)
+IDEMPOTENCY_KEY_TTL = env.int('IDEMPOTENCY_KEY_TTL', default=24 * 3600)
+IDEMPOTENCY_LOCK_TIMEOUT = env.int('IDEMPOTENCY_LOCK_TIMEOUT', default=60)
+
+# Adaptive load shedding in the ASGI app (dealflow/loadshedding.py); the limit is
+# concurrent requests per worker process, latencies and window in seconds
+LOAD_SHED_ENABLED = env.bool('LOAD_SHED_ENABLED', default=True)
+LOAD_SHED_INITIAL_LIMIT = env.int('LOAD_SHED_INITIAL_LIMIT', default=32)
+LOAD_SHED_MIN_LIMIT = env.int('LOAD_SHED_MIN_LIMIT', default=4)
+LOAD_SHED_MAX_LIMIT = env.int('LOAD_SHED_MAX_LIMIT', default=256)
+LOAD_SHED_TARGET_LATENCY = env.float('LOAD_SHED_TARGET_LATENCY', default=0.5)
+LOAD_SHED_BACKOFF = env.float('LOAD_SHED_BACKOFF', default=0.9)
+LOAD_SHED_WINDOW = env.float('LOAD_SHED_WINDOW', default=1.0)
+LOAD_SHED_RETRY_AFTER = env.int('LOAD_SHED_RETRY_AFTER', default=2)
+
+# Single-flight coalescing (dealflow/singleflight.py). Shared mode coordinates worker
+# processes through SINGLEFLIGHT_CACHE, which must then be a cache they all reach;
+# the timeout (seconds) bounds both the leader's lock and how long others wait
+SINGLEFLIGHT_SHARED = env.bool('SINGLEFLIGHT_SHARED', default=False)
+SINGLEFLIGHT_CACHE = env('SINGLEFLIGHT_CACHE', default='default')
+SINGLEFLIGHT_SHARED_TIMEOUT = env.int('SINGLEFLIGHT_SHARED_TIMEOUT', default=10)
+SINGLEFLIGHT_POLL_INTERVAL = env.float('SINGLEFLIGHT_POLL_INTERVAL', default=0.05)
+
+# Staff request profiling (dealflow/profiling.py): reports are written to PROFILE_DIR
+# and only the newest PROFILE_KEEP are kept
+PROFILE_ENABLED = env.bool('PROFILE_ENABLED', default=True)
+PROFILE_DIR = env('PROFILE_DIR', default=os.path.join(BASE_DIR, 'profiles'))
+PROFILE_KEEP = env.int('PROFILE_KEEP', default=50)
+PROFILE_TOP_FUNCTIONS = env.int('PROFILE_TOP_FUNCTIONS', default=50)
+
+# In-memory columnar analytics (payments/columnar.py, needs NumPy) for these user ids,
+# with at most COLUMNAR_CACHE_MAX_BYTES of columns per worker process, refreshed from
+# the database at most every COLUMNAR_CACHE_REFRESH_INTERVAL seconds
+COLUMNAR_CACHE_USER_IDS = env.list('COLUMNAR_CACHE_USER_IDS', cast=int, default=[])
+COLUMNAR_CACHE_MAX_BYTES = env.int('COLUMNAR_CACHE_MAX_BYTES', default=256 * 1024 * 1024)
+COLUMNAR_CACHE_REFRESH_INTERVAL = env.float('COLUMNAR_CACHE_REFRESH_INTERVAL', default=1.0)
+
+# Log a request's query, with its stack, once it runs this many times with only the parameters changing
+QUERY_REPEAT_THRESHOLD = env.int('QUERY_REPEAT_THRESHOLD', default=5)
+
 STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')
 STATIC_URL = '/static/'
 
+# Precomputed by `manage.py generate_openapi_schema` in build.sh
+OPENAPI_SCHEMA_PATH = env('OPENAPI_SCHEMA_PATH', default=os.path.join(BASE_DIR, 'openapi', 'openapi.json'))
+
 CORS_ALLOW_ALL_ORIGINS = True  # Only for development! Configure properly for production
 CORS_ALLOW_CREDENTIALS = True
+# Browser clients send Idempotency-Key when creating payment links
+CORS_ALLOW_HEADERS = (*default_headers, 'idempotency-key', 'x-dealflow-profile')
+CORS_EXPOSE_HEADERS = ['x-profile-id']
 
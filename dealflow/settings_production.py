@@ -0,0 +1,16 @@
+"""
+Production settings for dealflow.
+
+Select with DJANGO_SETTINGS_MODULE=dealflow.settings_production. This profile
+drops the development-only apps so that a cold worker imports as little as
+possible before serving its first request. Build steps that need those apps
+(collectstatic, generate_openapi_schema) run with dealflow.settings instead.
+"""
+from dealflow.settings import *  # noqa: F401,F403
+from dealflow.settings import INSTALLED_APPS
+
+DEBUG = False
+
+DEVELOPMENT_APPS = ['drf_yasg', 'django_extensions']
+
+INSTALLED_APPS = [app for app in INSTALLED_APPS if app not in DEVELOPMENT_APPS]
@@ -0,0 +1,263 @@
+"""
+Single-flight: concurrent calls with the same key share one execution.
+
+The first caller for a key runs the function. Callers that arrive while it is
+running wait for it and get the same result, or the same exception. Once the
+call returns the key is free again, so nothing is cached: a later call runs the
+function afresh. Threads and asyncio tasks are coalesced separately, each
+within the current worker process. An async call runs in a task of its own,
+so a cancelled caller leaves it running for the others; it is cancelled
+once every caller has been.
+
+With shared=True (or SINGLEFLIGHT_SHARED), the leader across worker processes is
+whoever adds a lock key to the SINGLEFLIGHT_CACHE cache. The leader writes its
+result to the cache for the waiters in other processes. This only helps when
+that cache is shared between processes (Redis, Memcached or the database cache),
+and results must be picklable. Waiters give up and run the function themselves
+after SINGLEFLIGHT_SHARED_TIMEOUT seconds.
+
+Results are handed to every waiter as the same object, so callers must not
+mutate them.
+"""
+import asyncio
+import hashlib
+import logging
+import threading
+import time
+from collections import Counter
+from functools import wraps
+from inspect import iscoroutinefunction
+from uuid import uuid4
+
+from django.conf import settings
+from django.core.cache import caches
+
+from dealflow import metrics
+
+logger = logging.getLogger(__name__)
+
+_MISSING = object()
+_groups = {}
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class _Flight:
+    def __init__(self):
+        self.task = None
+        self.waiters = 0
+
+
+class Group:
+    def __init__(self, name, shared=None):
+        self.name = name
+        self.shared = shared
+        self._lock = threading.Lock()
+        # key -> _Call for threads; (event loop, key) -> _Flight for tasks
+        self._calls = {}
+        self._flights = {}
+        self._counters = Counter()
+        _groups[name] = self
+
+    def is_shared(self):
+        return settings.SINGLEFLIGHT_SHARED if self.shared is None else self.shared
+
+    def do(self, key, fn, *args, **kwargs):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+            self._counters['calls'] += 1
+
+        if not leader:
+            self._counters['coalesced'] += 1
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            if self.is_shared():
+                call.result = self._run_shared(key, fn, args, kwargs)
+            else:
+                self._counters['executions'] += 1
+                call.result = fn(*args, **kwargs)
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+    async def ado(self, key, fn, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        flight_key = (loop, key)
+        self._counters['calls'] += 1
+        flight = self._flights.get(flight_key)
+        if flight is None:
+            flight = self._flights[flight_key] = _Flight()
+            # A task of its own, so cancelling the caller that started it leaves it to the others
+            flight.task = loop.create_task(self._acall(flight_key, flight, key, fn, args, kwargs))
+            flight.task.add_done_callback(_retrieve_exception)
+        else:
+            self._counters['coalesced'] += 1
+
+        flight.waiters += 1
+        try:
+            # Shielded so a caller's cancellation, such as a client disconnecting, doesn't cancel the call
+            return await asyncio.shield(flight.task)
+        finally:
+            flight.waiters -= 1
+            if not flight.waiters and not flight.task.done():
+                # Every caller has gone; a later call starts afresh
+                self._forget(flight_key, flight)
+                flight.task.cancel()
+
+    async def _acall(self, flight_key, flight, key, fn, args, kwargs):
+        try:
+            if self.is_shared():
+                return await self._arun_shared(key, fn, args, kwargs)
+            self._counters['executions'] += 1
+            return await fn(*args, **kwargs)
+        finally:
+            self._forget(flight_key, flight)
+
+    def _forget(self, flight_key, flight):
+        if self._flights.get(flight_key) is flight:
+            del self._flights[flight_key]
+
+    def _shared_keys(self, key):
+        digest = hashlib.sha256(repr(key).encode()).hexdigest()
+        prefix = f"singleflight:{self.name}:{digest}"
+        return f"{prefix}:lock", f"{prefix}:result"
+
+    def _run_shared(self, key, fn, args, kwargs):
+        cache = caches[settings.SINGLEFLIGHT_CACHE]
+        lock_key, result_key = self._shared_keys(key)
+        token = uuid4().hex
+        timeout = settings.SINGLEFLIGHT_SHARED_TIMEOUT
+        if cache.add(lock_key, token, timeout=timeout):
+            try:
+                self._counters['executions'] += 1
+                result = fn(*args, **kwargs)
+                # Tagged with the flight's token so waiters never take an older flight's result
+                cache.set(result_key, (token, result), timeout=timeout)
+                return result
+            finally:
+                cache.delete(lock_key)
+
+        leader_token = cache.get(lock_key)
+        deadline = time.monotonic() + timeout
+        while leader_token is not None and time.monotonic() < deadline:
+            found = cache.get(result_key, _MISSING)
+            if found is not _MISSING and found[0] == leader_token:
+                self._counters['shared_hits'] += 1
+                return found[1]
+            if cache.get(lock_key) != leader_token:
+                break
+            time.sleep(settings.SINGLEFLIGHT_POLL_INTERVAL)
+
+        # The leader finished without a result for us, failed, or is too slow
+        if leader_token is not None and time.monotonic() >= deadline:
+            logger.warning(f"Gave up waiting on another worker for {self.name}")
+        self._counters['executions'] += 1
+        return fn(*args, **kwargs)
+
+    async def _arun_shared(self, key, fn, args, kwargs):
+        cache = caches[settings.SINGLEFLIGHT_CACHE]
+        lock_key, result_key = self._shared_keys(key)
+        token = uuid4().hex
+        timeout = settings.SINGLEFLIGHT_SHARED_TIMEOUT
+        if await cache.aadd(lock_key, token, timeout=timeout):
+            try:
+                self._counters['executions'] += 1
+                result = await fn(*args, **kwargs)
+                await cache.aset(result_key, (token, result), timeout=timeout)
+                return result
+            finally:
+                await cache.adelete(lock_key)
+
+        leader_token = await cache.aget(lock_key)
+        deadline = time.monotonic() + timeout
+        while leader_token is not None and time.monotonic() < deadline:
+            found = await cache.aget(result_key, _MISSING)
+            if found is not _MISSING and found[0] == leader_token:
+                self._counters['shared_hits'] += 1
+                return found[1]
+            if await cache.aget(lock_key) != leader_token:
+                break
+            await asyncio.sleep(settings.SINGLEFLIGHT_POLL_INTERVAL)
+
+        if leader_token is not None and time.monotonic() >= deadline:
+            logger.warning(f"Gave up waiting on another worker for {self.name}")
+        self._counters['executions'] += 1
+        return await fn(*args, **kwargs)
+
+    def stats(self):
+        return {
+            'calls': self._counters['calls'],
+            'executions': self._counters['executions'],
+            'coalesced': self._counters['coalesced'],
+            'shared_hits': self._counters['shared_hits'],
+            'in_flight': len(self._calls) + len(self._flights),
+        }
+
+
+def _retrieve_exception(task):
+    # So an exception nobody waited for isn't reported as unhandled
+    if not task.cancelled():
+        task.exception()
+
+
+def single_flight(key, name=None, shared=None):
+    """
+    Coalesce concurrent calls of the decorated function (sync or async) that map
+    to the same key(*args, **kwargs). Returning None from `key` opts a call out.
+    """
+    def decorator(fn):
+        group = Group(name or f"{fn.__module__}.{fn.__qualname__}", shared)
+
+        if iscoroutinefunction(fn):
+            @wraps(fn)
+            async def async_wrapper(*args, **kwargs):
+                flight_key = key(*args, **kwargs)
+                if flight_key is None:
+                    return await fn(*args, **kwargs)
+                return await group.ado(flight_key, fn, *args, **kwargs)
+
+            async_wrapper.single_flight = group
+            return async_wrapper
+
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            flight_key = key(*args, **kwargs)
+            if flight_key is None:
+                return fn(*args, **kwargs)
+            return group.do(flight_key, fn, *args, **kwargs)
+
+        wrapper.single_flight = group
+        return wrapper
+
+    return decorator
+
+
+def freeze(params):
+    """
+    Hashable form of a dict of validated query parameters, for use in keys
+    """
+    return tuple(sorted(params.items()))
+
+
+def single_flight_stats():
+    return {name: group.stats() for name, group in _groups.items()}
+
+
+metrics.register('single_flight', single_flight_stats)
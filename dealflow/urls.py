@@ -20,7 +20,7 @@ from django.conf.urls.static import static
 from django.conf import settings
 
 from payments.views import analytics_views, payment_views, stripe_webhooks
-from .docs import schema_view
+from . import docs, metrics, profiling
 
 urlpatterns = [
     path('admin/', admin.site.urls),
@@ -29,6 +29,11 @@ urlpatterns = [
     path('payment/completed/', payment_views.payment_completed, name='payment-success'),
     path('payment/<str:payment_id>/', payment_views.payment_page, name='payment-page'),
     path('webhooks/stripe/', stripe_webhooks.stripe_webhook, name='stripe-webhook'),
-    path('api/docs/', schema_view.with_ui('swagger', cache_timeout=0), name='schema-swagger-ui'),
+    path('api/docs/', docs.swagger_ui, name='schema-swagger-ui'),
+    path('api/docs/openapi.json', docs.openapi_schema, name='openapi-schema'),
+    path('api/metrics/', metrics.metrics, name='metrics'),
+    path('api/profiles/', profiling.profile_list, name='profile-list'),
+    path('api/profiles/<str:profile_id>/', profiling.profile_report, name='profile-report'),
+    path('api/profiles/<str:profile_id>/pstats/', profiling.profile_pstats, name='profile-pstats'),
     path('', analytics_views.health_check, name='health-check'),
 ]+ static(settings.STATIC_URL, document_root=settings.STATIC_ROOT)
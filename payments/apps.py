@@ -1,6 +1,16 @@
 from django.apps import AppConfig
+from django.core.signals import request_finished
 
 
 class PaymentsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'payments'
+
+    def ready(self):
+        from django.db import close_old_connections
+        from payments.funnel import funnel_counters
+        # Runs after the response is sent, so flushing never delays a client, and ahead of
+        # close_old_connections, so the flush uses the request's connection before it goes back to the pool
+        request_finished.disconnect(close_old_connections)
+        request_finished.connect(funnel_counters.flush_if_due, dispatch_uid='payments.funnel.flush')
+        request_finished.connect(close_old_connections)
@@ -0,0 +1,387 @@
+"""
+In-memory columnar copy of a merchant's payments, for the analytics endpoints.
+
+For the merchants in COLUMNAR_CACHE_USER_IDS, payment analytics, the payment
+methods summary and the currency totals are answered from NumPy arrays instead
+of SQL. Ids, amounts in minor units and creation times (microseconds since the
+epoch) are int64 columns. Currency, payment method, status and payment link are
+codes into per-merchant dictionaries. Filters become boolean masks and
+group-bys become bincounts.
+
+A merchant's columns are loaded by its first request. Later requests first
+re-read the rows updated since the previous refresh, going back CHANGES_FEED_LAG
+seconds further for transactions that committed late, at most once every
+COLUMNAR_CACHE_REFRESH_INTERVAL seconds. So webhook writes show up within that
+interval in every worker. Like the changes feed, this relies on writes going
+through save(). Deleted payments are not removed.
+
+Each worker process keeps at most COLUMNAR_CACHE_MAX_BYTES of columns, evicting
+the least recently used merchant beyond that. A merchant too large for the
+whole budget is served from SQL.
+"""
+import logging
+import threading
+import time
+from collections import Counter, OrderedDict
+from datetime import datetime, timedelta, timezone as dt_timezone
+from decimal import ROUND_CEILING, ROUND_FLOOR
+from itertools import islice
+
+import numpy as np
+from django.conf import settings
+from django.utils import timezone
+
+from dealflow import metrics
+from payments.currency import from_minor_units, minor_units_by_exponent
+from payments.models import Payment
+
+logger = logging.getLogger(__name__)
+
+EPOCH = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+LOAD_CHUNK_SIZE = 10000
+
+# Selected in this order; the last four are dictionary-encoded
+SOURCE_COLUMNS = ('id', 'amount_minor', 'created_at', 'currency', 'payment_method', 'status', 'payment_link__unique_id')
+DTYPES = {
+    'id': np.int64,
+    'amount_minor': np.int64,
+    'created_at': np.int64,
+    'currency': np.int16,
+    'payment_method': np.int32,
+    'status': np.int8,
+    'payment_link__unique_id': np.int32,
+}
+ENCODED = ('currency', 'payment_method', 'status', 'payment_link__unique_id')
+
+
+def to_micros(value):
+    return (value - EPOCH) // timedelta(microseconds=1)
+
+
+def from_micros(value):
+    return EPOCH + timedelta(microseconds=int(value))
+
+
+def day_start(value):
+    """
+    A date filter's bound, as Django compares a date with a DateTimeField: midnight in the default time zone
+    """
+    return timezone.make_aware(datetime.combine(value, datetime.min.time()), timezone.get_default_timezone())
+
+
+class Dictionary:
+    """
+    Codes for the distinct values of a text column, in order of first appearance
+    """
+
+    def __init__(self):
+        self.values = []
+        self.codes = {}
+
+    def encode(self, value):
+        code = self.codes.get(value)
+        if code is None:
+            code = self.codes[value] = len(self.values)
+            self.values.append(value)
+        return code
+
+    def decode(self, codes):
+        return np.array(self.values, dtype=object)[codes].tolist() if len(codes) else []
+
+
+class MerchantColumns:
+    """
+    One merchant's payments as arrays sorted by id, filled up to `size` with room to grow
+    """
+
+    def __init__(self, user_id):
+        self.user_id = user_id
+        self.reset()
+        self.refreshed = None
+        self.lock = threading.Lock()
+
+    def reset(self):
+        self.size = 0
+        self.arrays = {name: np.empty(0, dtype) for name, dtype in DTYPES.items()}
+        self.dictionaries = {name: Dictionary() for name in ENCODED}
+        self.synced_at = None
+
+    @property
+    def nbytes(self):
+        return sum(array.nbytes for array in self.arrays.values())
+
+    def column(self, name):
+        return self.arrays[name][:self.size]
+
+    def refresh(self):
+        now = time.monotonic()
+        if self.refreshed is not None and now - self.refreshed < settings.COLUMNAR_CACHE_REFRESH_INTERVAL:
+            return
+
+        started = timezone.now()
+        payments = Payment.objects.filter(payment_link__user_id=self.user_id)
+        if self.synced_at is None:
+            payments = payments.order_by('id')
+        else:
+            since = self.synced_at - timedelta(seconds=settings.CHANGES_FEED_LAG)
+            payments = payments.filter(updated_at__gte=since).order_by()
+
+        rows = payments.values_list(*SOURCE_COLUMNS).iterator(chunk_size=LOAD_CHUNK_SIZE)
+        try:
+            while chunk := list(islice(rows, LOAD_CHUNK_SIZE)):
+                self.apply(chunk)
+        except BaseException:
+            # A partial delta is still newer than what it replaced and is read again next time;
+            # a partial first load would answer with missing payments, so start over
+            if self.synced_at is None:
+                self.reset()
+            raise
+        self.synced_at = started
+        self.refreshed = now
+
+    def apply(self, rows):
+        """
+        Upsert rows of SOURCE_COLUMNS by id
+        """
+        values = dict(zip(SOURCE_COLUMNS, zip(*rows)))
+        values['created_at'] = [to_micros(created_at) for created_at in values['created_at']]
+        for name in ENCODED:
+            values[name] = [self.dictionaries[name].encode(value) for value in values[name]]
+        new = {name: np.array(values[name], dtype) for name, dtype in DTYPES.items()}
+
+        ids = self.column('id')
+        positions = np.searchsorted(ids, new['id'])
+        found = positions < self.size
+        found[found] = ids[positions[found]] == new['id'][found]
+        for name, array in self.arrays.items():
+            array[positions[found]] = new[name][found]
+
+        order = np.argsort(new['id'][~found], kind='stable')
+        self._append({name: column[~found][order] for name, column in new.items()})
+
+    def _append(self, new):
+        count = len(new['id'])
+        if not count:
+            return
+        start, end = self.size, self.size + count
+        if end > len(self.arrays['id']):
+            capacity = max(end, 2 * len(self.arrays['id']), 1024)
+            for name, array in self.arrays.items():
+                grown = np.empty(capacity, array.dtype)
+                grown[:start] = array[:start]
+                self.arrays[name] = grown
+        for name, array in self.arrays.items():
+            array[start:end] = new[name]
+        self.size = end
+
+        # Ids mostly arrive in order; one that committed late means a full re-sort
+        if start and self.arrays['id'][start - 1] > self.arrays['id'][start]:
+            order = np.argsort(self.column('id'), kind='stable')
+            for name, array in self.arrays.items():
+                array[:end] = array[:end][order]
+
+    def equals(self, name, value):
+        code = self.dictionaries[name].codes.get(value)
+        if code is None:
+            return np.zeros(self.size, dtype=bool)
+        return self.column(name) == code
+
+    def amount_in_range(self, start_amount, end_amount, currencies):
+        """
+        Same rows as analytics_views.amount_range_q: bounds scaled by each row's currency exponent
+        """
+        dictionary = self.dictionaries['currency']
+        allowed = np.zeros(len(dictionary.values), dtype=bool)
+        lows = np.full(len(dictionary.values), np.iinfo(np.int64).min, dtype=np.int64)
+        highs = np.full(len(dictionary.values), np.iinfo(np.int64).max, dtype=np.int64)
+        for exponent, codes in minor_units_by_exponent(currencies).items():
+            for currency in codes:
+                code = dictionary.codes.get(currency)
+                if code is None:
+                    continue
+                allowed[code] = True
+                if start_amount is not None:
+                    lows[code] = int(start_amount.scaleb(exponent).to_integral_value(ROUND_CEILING))
+                if end_amount is not None:
+                    highs[code] = int(end_amount.scaleb(exponent).to_integral_value(ROUND_FLOOR))
+
+        currency = self.column('currency')
+        amounts = self.column('amount_minor')
+        return allowed[currency] & (amounts >= lows[currency]) & (amounts <= highs[currency])
+
+    def mask(self, validated_data):
+        """
+        Same rows as analytics_views.filter_payments
+        """
+        mask = np.ones(self.size, dtype=bool)
+        if validated_data.get('start_date'):
+            mask &= self.column('created_at') >= to_micros(day_start(validated_data['start_date']))
+        if validated_data.get('end_date'):
+            mask &= self.column('created_at') <= to_micros(day_start(validated_data['end_date']))
+        if validated_data.get('currency'):
+            mask &= self.equals('currency', validated_data['currency'])
+        if validated_data.get('payment_method'):
+            mask &= self.equals('payment_method', validated_data['payment_method'])
+        if validated_data.get('start_amount') or validated_data.get('end_amount'):
+            mask &= self.amount_in_range(
+                validated_data.get('start_amount') or None,
+                validated_data.get('end_amount') or None,
+                [validated_data['currency']] if validated_data.get('currency') else None,
+            )
+        return mask
+
+    def analytics(self, validated_data, fields):
+        """
+        payment_analytics rows for validated_data, newest first, already presented
+        """
+        selected = np.flatnonzero(self.mask(validated_data))
+        # lexsort's last key is the primary one
+        order = selected[np.lexsort((-self.column('id')[selected], -self.column('created_at')[selected]))]
+
+        currencies = self.dictionaries['currency'].decode(self.column('currency')[order])
+        columns = {}
+        for field in fields:
+            if field == 'amount':
+                amounts = self.column('amount_minor')[order].tolist()
+                columns[field] = [from_minor_units(amount, currency) for amount, currency in zip(amounts, currencies)]
+            elif field == 'currency':
+                columns[field] = currencies
+            elif field == 'created_at':
+                columns[field] = [from_micros(created_at) for created_at in self.column('created_at')[order]]
+            elif field in ENCODED:
+                columns[field] = self.dictionaries[field].decode(self.column(field)[order])
+            else:
+                columns[field] = self.column(field)[order].tolist()
+        return [dict(zip(fields, row)) for row in zip(*(columns[field] for field in fields))]
+
+    def _group(self, mask, *names):
+        """
+        Group the masked rows by the given encoded columns: each group's codes, its
+        row count and its amount_minor total. Totals are summed as float64, exact
+        below 2**53 minor units.
+        """
+        keys = np.zeros(int(mask.sum()), dtype=np.int64)
+        for name in names:
+            keys = keys * len(self.dictionaries[name].values) + self.column(name)[mask]
+        groups, inverse = np.unique(keys, return_inverse=True)
+        counts = np.bincount(inverse, minlength=len(groups))
+        totals = np.bincount(inverse, weights=self.column('amount_minor')[mask], minlength=len(groups))
+
+        codes = {}
+        remaining = groups
+        for name in reversed(names):
+            size = len(self.dictionaries[name].values)
+            codes[name] = remaining % size if size else remaining
+            remaining = remaining // size if size else remaining
+        return codes, inverse, counts, totals.astype(np.int64)
+
+    def status_mask(self, status):
+        return self.equals('status', status)
+
+    def payment_method_rows(self):
+        """
+        Same rows as analytics_views.payment_methods_queryset
+        """
+        codes, inverse, counts, totals = self._group(np.ones(self.size, dtype=bool), 'payment_method', 'currency')
+        successes = np.bincount(inverse, weights=self.status_mask('success'), minlength=len(counts))
+        failures = np.bincount(inverse, weights=self.status_mask('failed'), minlength=len(counts))
+        methods = self.dictionaries['payment_method'].decode(codes['payment_method'])
+        currencies = self.dictionaries['currency'].decode(codes['currency'])
+        return [
+            {
+                'payment_method': methods[index],
+                'currency': currencies[index],
+                'count': int(counts[index]),
+                'total_amount_minor': int(totals[index]),
+                'success_count': int(successes[index]),
+                'failed_count': int(failures[index]),
+            }
+            for index in range(len(counts))
+        ]
+
+    def currency_total_rows(self):
+        """
+        Same rows as analytics_views.currency_totals_queryset
+        """
+        codes, _, counts, totals = self._group(self.status_mask('success'), 'currency')
+        currencies = self.dictionaries['currency'].decode(codes['currency'])
+        return [
+            {'currency': currencies[index], 'count': int(counts[index]), 'total_amount_minor': int(totals[index])}
+            for index in range(len(counts))
+        ]
+
+
+class ColumnarCache:
+    def __init__(self, max_bytes=None):
+        self._max_bytes = max_bytes
+        self._merchants = OrderedDict()
+        self._too_large = set()
+        self._lock = threading.Lock()
+        self._counters = Counter()
+
+    @property
+    def max_bytes(self):
+        return self._max_bytes if self._max_bytes is not None else settings.COLUMNAR_CACHE_MAX_BYTES
+
+    def query(self, user_id, method, *args):
+        """
+        Refresh the merchant's columns and call MerchantColumns.<method>(*args);
+        None when the merchant is too large to keep
+        """
+        with self._lock:
+            if user_id in self._too_large:
+                return None
+            columns = self._merchants.get(user_id)
+            if columns is None:
+                columns = self._merchants[user_id] = MerchantColumns(user_id)
+                self._counters['loads'] += 1
+            else:
+                self._counters['hits'] += 1
+            self._merchants.move_to_end(user_id)
+
+        with columns.lock:
+            columns.refresh()
+            result = getattr(columns, method)(*args)
+        self._evict(user_id, columns)
+        return result
+
+    def _evict(self, user_id, columns):
+        with self._lock:
+            if columns.nbytes > self.max_bytes:
+                logger.warning(
+                    f"Payments of user {user_id} take {columns.nbytes} bytes, over COLUMNAR_CACHE_MAX_BYTES; using SQL"
+                )
+                self._merchants.pop(user_id, None)
+                self._too_large.add(user_id)
+                return
+            total = sum(merchant.nbytes for merchant in self._merchants.values())
+            while total > self.max_bytes:
+                _, evicted = self._merchants.popitem(last=False)
+                total -= evicted.nbytes
+                self._counters['evictions'] += 1
+
+    def clear(self):
+        with self._lock:
+            self._merchants.clear()
+            self._too_large.clear()
+            self._counters.clear()
+
+    def stats(self):
+        with self._lock:
+            merchants = {
+                user_id: {'payments': columns.size, 'bytes': columns.nbytes}
+                for user_id, columns in self._merchants.items()
+            }
+        return {
+            'merchants': merchants,
+            'bytes': sum(merchant['bytes'] for merchant in merchants.values()),
+            'max_bytes': self.max_bytes,
+            'too_large': sorted(self._too_large),
+            'loads': self._counters['loads'],
+            'hits': self._counters['hits'],
+            'evictions': self._counters['evictions'],
+        }
+
+
+columnar_cache = ColumnarCache()
+metrics.register('columnar_cache', columnar_cache.stats)
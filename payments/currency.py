@@ -0,0 +1,54 @@
+from decimal import Decimal
+
+# ISO 4217 minor-unit exponents for the currencies we accept
+CURRENCY_EXPONENTS = {
+    'USD': 2,
+    'EUR': 2,
+    'GBP': 2,
+    'INR': 2,
+    'AUD': 2,
+    'CAD': 2,
+    'CHF': 2,
+    'JPY': 0,
+    'NZD': 2,
+    'SGD': 2,
+}
+
+SUPPORTED_CURRENCIES = list(CURRENCY_EXPONENTS)
+
+DEFAULT_EXPONENT = 2
+
+
+def currency_exponent(currency):
+    return CURRENCY_EXPONENTS.get((currency or '').upper(), DEFAULT_EXPONENT)
+
+
+def to_minor_units(amount, currency):
+    """
+    Convert a major-unit amount (e.g. Decimal('12.34') USD) to integer minor units (1234).
+    Raises ValueError if the amount is more precise than the currency allows.
+    """
+    value = Decimal(str(amount)).scaleb(currency_exponent(currency))
+    if value != value.to_integral_value():
+        raise ValueError(f"{amount} has more decimal places than {currency} allows")
+    return int(value)
+
+
+def from_minor_units(minor_units, currency):
+    """
+    Convert integer minor units back to a Decimal in major units, e.g. 1234 USD -> Decimal('12.34')
+    """
+    if minor_units is None:
+        return None
+    return Decimal(int(minor_units)).scaleb(-currency_exponent(currency))
+
+
+def minor_units_by_exponent(currencies=None):
+    """
+    Group currency codes by exponent, so that amount filters can be pushed into SQL
+    as one minor-unit comparison per exponent
+    """
+    groups = {}
+    for currency in currencies or SUPPORTED_CURRENCIES:
+        groups.setdefault(currency_exponent(currency), []).append(currency.upper())
+    return groups
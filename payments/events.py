@@ -0,0 +1,141 @@
+"""
+Payment status events for live dashboards.
+
+Webhook handlers publish a merchant's payment status changes once their
+transaction commits; the SSE endpoint subscribes to them. The broker class is
+settings.EVENT_BROKER. The default InProcessBroker only fans out inside one
+worker process, so with several workers swap in a broker backed by a shared
+channel exposing the same subscribe()/publish() interface.
+"""
+import asyncio
+import logging
+import threading
+from functools import lru_cache
+
+from django.conf import settings
+from django.db import transaction
+from django.utils.module_loading import import_string
+
+from payments.currency import from_minor_units
+
+logger = logging.getLogger(__name__)
+
+# Queued in place of the events a subscriber was too slow to receive
+OVERFLOW = object()
+
+
+class TooManySubscriptions(Exception):
+    pass
+
+
+class Subscription:
+    """
+    One SSE connection's bounded queue, owned by the event loop that created it
+    """
+
+    def __init__(self, broker, user_id, maxsize):
+        self.broker = broker
+        self.user_id = user_id
+        self.overflowed = False
+        self._loop = asyncio.get_running_loop()
+        self._queue = asyncio.Queue(maxsize=maxsize)
+
+    def push(self, event):
+        """
+        Thread-safe: publishers run in request threads, not on the subscriber's loop
+        """
+        try:
+            self._loop.call_soon_threadsafe(self._deliver, event)
+        except RuntimeError:
+            # The subscriber's loop has already shut down
+            self.close()
+
+    def _deliver(self, event):
+        if self.overflowed:
+            return
+        if self._queue.full():
+            # Don't let a slow client buffer without limit; it has to resync instead
+            self.overflowed = True
+            while not self._queue.empty():
+                self._queue.get_nowait()
+            self._queue.put_nowait(OVERFLOW)
+            return
+        self._queue.put_nowait(event)
+
+    async def get(self):
+        return await self._queue.get()
+
+    def close(self):
+        self.broker.unsubscribe(self)
+
+
+class InProcessBroker:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscriptions = {}
+
+    def subscribe(self, user_id):
+        """
+        Must be called on the event loop that will read the subscription
+        """
+        with self._lock:
+            subscriptions = self._subscriptions.setdefault(user_id, set())
+            if len(subscriptions) >= settings.EVENT_STREAM_MAX_CONNECTIONS_PER_USER:
+                raise TooManySubscriptions(f"User {user_id} already has {len(subscriptions)} event streams")
+            subscription = Subscription(self, user_id, settings.EVENT_STREAM_QUEUE_SIZE)
+            subscriptions.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscriptions = self._subscriptions.get(subscription.user_id, set())
+            subscriptions.discard(subscription)
+            if not subscriptions:
+                self._subscriptions.pop(subscription.user_id, None)
+
+    def publish(self, user_id, event):
+        with self._lock:
+            subscriptions = list(self._subscriptions.get(user_id, ()))
+        for subscription in subscriptions:
+            subscription.push(event)
+
+
+@lru_cache(maxsize=None)
+def get_broker():
+    return import_string(settings.EVENT_BROKER)()
+
+
+def payment_event(payment, previous_status):
+    """
+    The event describing a payment's status change; also the data of merchant webhooks
+    """
+    # upsert_payment loads the link with the payment
+    return {
+        'type': 'payment.status',
+        'stripe_payment_id': payment.stripe_payment_id,
+        'payment_link': payment.payment_link.unique_id,
+        'status': payment.status,
+        'previous_status': previous_status,
+        'amount': from_minor_units(payment.amount_minor, payment.currency),
+        'currency': payment.currency,
+        'updated_at': payment.updated_at,
+    }
+
+
+def publish_payment_event(payment, previous_status):
+    """
+    Publish a payment's status change to its merchant after the current transaction commits
+    """
+    if payment is None or payment.status == previous_status:
+        return
+
+    user_id = payment.payment_link.user_id
+    event = payment_event(payment, previous_status)
+
+    def publish():
+        try:
+            get_broker().publish(user_id, event)
+        except Exception as e:
+            logger.error(f"Error publishing payment event: {str(e)}")
+
+    transaction.on_commit(publish)
@@ -0,0 +1,132 @@
+"""
+Write-behind checkout funnel counters.
+
+Each worker counts page views, intent creations, successes and failures per
+payment link in memory and adds them to PaymentLinkFunnel with one batched
+UPSERT at most every FUNNEL_FLUSH_INTERVAL seconds. Flushing runs on
+request_finished, after the response has been sent, and at interpreter exit.
+A crashed worker therefore loses at most one interval's worth of counts, or
+FUNNEL_FLUSH_MAX_PENDING events, whichever comes first. Nothing is counted while
+FUNNEL_ENABLED is off, which the test runner does.
+"""
+import atexit
+import logging
+import threading
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+
+from payments.models import PaymentLink, PaymentLinkFunnel
+
+logger = logging.getLogger(__name__)
+
+STAGES = ('page_views', 'intents_created', 'successes', 'failures')
+
+UPSERT_BATCH_SIZE = 500
+
+
+def upsert_funnel_counts(counts):
+    """
+    Add {payment_link_id: Counter(stage=n)} to the stored totals.
+    INSERT ... ON CONFLICT DO UPDATE is supported by both PostgreSQL and SQLite.
+    """
+    table = connection.ops.quote_name(PaymentLinkFunnel._meta.db_table)
+    columns = ['payment_link_id', *STAGES, 'updated_at']
+    updates = ', '.join(
+        f'{stage} = {table}.{stage} + EXCLUDED.{stage}' for stage in STAGES
+    ) + ', updated_at = EXCLUDED.updated_at'
+    now = timezone.now()
+
+    if not counts:
+        return
+    rows = [
+        [link_id, *(stages.get(stage, 0) for stage in STAGES), now]
+        for link_id, stages in counts.items()
+    ]
+    with transaction.atomic():
+        with connection.cursor() as cursor:
+            for start in range(0, len(rows), UPSERT_BATCH_SIZE):
+                batch = rows[start:start + UPSERT_BATCH_SIZE]
+                placeholders = ', '.join(['(' + ', '.join(['%s'] * len(columns)) + ')'] * len(batch))
+                cursor.execute(
+                    f'INSERT INTO {table} ({", ".join(columns)}) VALUES {placeholders} '
+                    f'ON CONFLICT (payment_link_id) DO UPDATE SET {updates}',
+                    [value for row in batch for value in row],
+                )
+
+
+class FunnelCounters:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counts = {}
+        self._pending = 0
+        self._last_flush = time.monotonic()
+
+    def record(self, payment_link_id, stage, count=1):
+        if stage not in STAGES:
+            raise ValueError(f"Unknown funnel stage: {stage}")
+        if not settings.FUNNEL_ENABLED:
+            return
+        with self._lock:
+            self._counts.setdefault(payment_link_id, Counter())[stage] += count
+            self._pending += count
+
+    def flush_due(self):
+        return self._pending and (
+            self._pending >= settings.FUNNEL_FLUSH_MAX_PENDING
+            or time.monotonic() - self._last_flush >= settings.FUNNEL_FLUSH_INTERVAL
+        )
+
+    def flush_if_due(self, **kwargs):
+        if self.flush_due():
+            self.flush()
+
+    def flush(self):
+        with self._lock:
+            counts, self._counts = self._counts, {}
+            self._pending = 0
+            self._last_flush = time.monotonic()
+        if not counts:
+            return
+
+        try:
+            # Foreign keys are checked at commit, so drop links deleted since they were counted
+            existing = set(PaymentLink.objects.filter(pk__in=counts).values_list('pk', flat=True))
+            upsert_funnel_counts({link_id: c for link_id, c in counts.items() if link_id in existing})
+        except Exception as e:
+            logger.error(f"Error flushing funnel counters: {str(e)}")
+            self._restore(counts)
+
+    def clear(self):
+        """
+        Drop pending counts without writing them
+        """
+        with self._lock:
+            self._counts = {}
+            self._pending = 0
+
+    def _restore(self, counts):
+        with self._lock:
+            for link_id, stages in counts.items():
+                if self._pending >= settings.FUNNEL_FLUSH_MAX_PENDING:
+                    # Bound memory while the database is unavailable
+                    logger.warning("Dropping funnel counts, too many pending")
+                    break
+                self._counts.setdefault(link_id, Counter()).update(stages)
+                self._pending += sum(stages.values())
+
+
+funnel_counters = FunnelCounters()
+
+record = funnel_counters.record
+
+
+@atexit.register
+def _flush_at_exit():
+    try:
+        funnel_counters.flush()
+    except Exception:
+        pass
@@ -0,0 +1,197 @@
+"""
+Stripe API calls with per-operation timeouts, retries and a circuit breaker.
+
+Every operation has its own HTTP timeout. Reads are retried with jittered
+exponential backoff when Stripe is unreachable, rate limiting or returning 5xx;
+creating a PaymentIntent is never retried, so a slow Stripe can't make us charge
+twice. After STRIPE_BREAKER_FAILURE_THRESHOLD consecutive failures the breaker
+opens and calls raise StripeUnavailable without touching the network. After
+STRIPE_BREAKER_RESET_TIMEOUT seconds one trial call decides whether it closes
+again. The breaker and the counters are per worker process. Concurrent
+retrievals of the same object share one request.
+"""
+import logging
+import random
+import threading
+import time
+from collections import Counter
+from functools import lru_cache
+
+from django.conf import settings
+
+from dealflow import metrics
+from dealflow.singleflight import single_flight
+from payments.utils import get_stripe
+
+logger = logging.getLogger(__name__)
+
+
+class StripeUnavailable(Exception):
+    """
+    Stripe timed out, is failing, or the circuit breaker is open
+    """
+
+
+class CircuitBreaker:
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, failure_threshold, reset_timeout, clock=time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.clock = clock
+        self.state = self.CLOSED
+        self.failures = 0
+        self._opened_at = None
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    def allow(self):
+        with self._lock:
+            if self.state == self.OPEN and self.clock() - self._opened_at >= self.reset_timeout:
+                self.state = self.HALF_OPEN
+                self._trial_in_flight = False
+            if self.state == self.HALF_OPEN:
+                # Let exactly one caller find out whether Stripe has recovered
+                if self._trial_in_flight:
+                    return False
+                self._trial_in_flight = True
+            return self.state != self.OPEN
+
+    def record_success(self):
+        with self._lock:
+            if self.state != self.CLOSED:
+                logger.info("Stripe circuit breaker closed")
+            self.state = self.CLOSED
+            self.failures = 0
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN or (self.state == self.CLOSED and self.failures >= self.failure_threshold):
+                logger.error(f"Stripe circuit breaker opened after {self.failures} consecutive failures")
+                self.state = self.OPEN
+                self._opened_at = self.clock()
+                self._trial_in_flight = False
+
+
+def is_transient(error):
+    """
+    Errors that say Stripe is unhealthy, rather than that the request was refused
+    """
+    stripe = get_stripe()
+    if isinstance(error, (stripe.APIConnectionError, stripe.RateLimitError)):
+        return True
+    return (error.http_status or 0) >= 500
+
+
+@lru_cache(maxsize=None)
+def stripe_client(api_key, api_base, timeout):
+    stripe = get_stripe()
+    return stripe.StripeClient(
+        api_key,
+        base_addresses={'api': api_base},
+        # Retries are decided here, per operation
+        max_network_retries=0,
+        http_client=stripe.RequestsClient(timeout=(settings.STRIPE_CONNECT_TIMEOUT, timeout)),
+    )
+
+
+class StripeGateway:
+    def __init__(self, failure_threshold=None, reset_timeout=None):
+        self.breaker = CircuitBreaker(
+            failure_threshold or settings.STRIPE_BREAKER_FAILURE_THRESHOLD,
+            reset_timeout or settings.STRIPE_BREAKER_RESET_TIMEOUT,
+        )
+        self._counters = {}
+        self._lock = threading.Lock()
+
+    def create_payment_intent(self, **params):
+        return self._call(
+            'payment_intents.create', settings.STRIPE_CREATE_TIMEOUT, False,
+            lambda client: client.v1.payment_intents.create(params=params),
+        )
+
+    # Webhook retries and status polls often look up the same object at once
+    @single_flight(key=lambda gateway, payment_intent_id: (id(gateway), payment_intent_id), shared=False)
+    def retrieve_payment_intent(self, payment_intent_id):
+        return self._call(
+            'payment_intents.retrieve', settings.STRIPE_RETRIEVE_TIMEOUT, True,
+            lambda client: client.v1.payment_intents.retrieve(payment_intent_id),
+        )
+
+    @single_flight(key=lambda gateway, charge_id: (id(gateway), charge_id), shared=False)
+    def retrieve_charge(self, charge_id):
+        return self._call(
+            'charges.retrieve', settings.STRIPE_RETRIEVE_TIMEOUT, True,
+            lambda client: client.v1.charges.retrieve(charge_id),
+        )
+
+    def _count(self, operation, **increments):
+        with self._lock:
+            self._counters.setdefault(operation, Counter()).update(increments)
+
+    def _call(self, operation, timeout, idempotent, request):
+        stripe = get_stripe()
+        client = stripe_client(settings.STRIPE_SECRET_KEY, settings.STRIPE_API_BASE, timeout)
+        attempts = 1 + (settings.STRIPE_MAX_RETRIES if idempotent else 0)
+
+        for attempt in range(attempts):
+            if not self.breaker.allow():
+                self._count(operation, short_circuited=1)
+                raise StripeUnavailable(f"Stripe circuit breaker is open, skipped {operation}")
+            if attempt:
+                self._count(operation, retries=1)
+
+            started = time.perf_counter()
+            try:
+                result = request(client)
+            except stripe.StripeError as e:
+                self._count(operation, calls=1, total_ms=(time.perf_counter() - started) * 1000)
+                if not is_transient(e):
+                    # Stripe answered; a declined card doesn't mean it's degraded
+                    self.breaker.record_success()
+                    self._count(operation, errors=1)
+                    raise
+                self.breaker.record_failure()
+                self._count(operation, failures=1)
+                logger.warning(f"Stripe {operation} failed (attempt {attempt + 1} of {attempts}): {str(e)}")
+                retryable = (e.headers or {}).get('stripe-should-retry') != 'false'
+                if attempt + 1 == attempts or not retryable:
+                    raise StripeUnavailable(f"Stripe {operation} failed: {str(e)}") from e
+                time.sleep(self._backoff(attempt))
+                continue
+            except BaseException as e:
+                # Anything else, e.g. a network error the SDK didn't wrap, counts as a failure, so a
+                # half-open trial always settles the breaker instead of leaving it waiting forever
+                self._count(operation, calls=1, failures=1, total_ms=(time.perf_counter() - started) * 1000)
+                self.breaker.record_failure()
+                logger.warning(f"Stripe {operation} failed unexpectedly: {e!r}")
+                raise
+
+            self._count(operation, calls=1, successes=1, total_ms=(time.perf_counter() - started) * 1000)
+            self.breaker.record_success()
+            return result
+
+    def _backoff(self, attempt):
+        # Full jitter, so workers that failed together don't retry together
+        cap = min(settings.STRIPE_RETRY_MAX_DELAY, settings.STRIPE_RETRY_BASE_DELAY * 2 ** attempt)
+        return random.uniform(0, cap)
+
+    def stats(self):
+        with self._lock:
+            operations = {operation: dict(counters) for operation, counters in self._counters.items()}
+        return {
+            'breaker': {'state': self.breaker.state, 'consecutive_failures': self.breaker.failures},
+            'operations': operations,
+        }
+
+
+@lru_cache(maxsize=None)
+def get_gateway():
+    return StripeGateway()
+
+
+metrics.register('stripe', lambda: get_gateway().stats())
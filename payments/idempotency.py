@@ -0,0 +1,151 @@
+"""
+Idempotency-Key support for POST endpoints that create things.
+
+The first request with a key inserts an IdempotencyKey row. The unique
+(user, key) constraint works as the lock: a duplicate that arrives while the
+first one is still running gets a 409 and retries. When the first request
+finishes, its response is stored on the row, and repeats within
+IDEMPOTENCY_KEY_TTL get that response back without running the view again.
+A key sent with a different request body is rejected.
+
+5xx responses aren't stored, so a retry runs the request again. If the worker
+dies mid-request, the row is taken over once it has been locked for
+IDEMPOTENCY_LOCK_TIMEOUT seconds. A request that was only slow then leaves the
+row alone: it stores or releases the row only while it still holds the lock. Expired rows are removed by
+purge_idempotency_keys.
+"""
+import hashlib
+import json
+import logging
+from datetime import timedelta
+from functools import wraps
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.http import JsonResponse
+from django.utils import timezone
+
+from payments.models import IdempotencyKey
+
+logger = logging.getLogger(__name__)
+
+IDEMPOTENCY_HEADER = 'Idempotency-Key'
+
+
+def request_fingerprint(request):
+    digest = hashlib.sha256(f"{request.method} {request.path}\n".encode())
+    digest.update(request.body)
+    return digest.hexdigest()
+
+
+def in_progress():
+    response = JsonResponse({
+        "error": "Request in progress",
+        "detail": f"A request with this {IDEMPOTENCY_HEADER} is still being processed, retry shortly."
+    }, status=409)
+    response['Retry-After'] = '1'
+    return response
+
+
+def replay(record):
+    response = JsonResponse(record.response_body, status=record.response_status, safe=False)
+    response['Idempotent-Replayed'] = 'true'
+    return response
+
+
+def acquire(user, key, request_hash):
+    """
+    Returns (record, None) when this request should run and (None, response) when
+    `response` should be returned instead
+    """
+    now = timezone.now()
+    ttl = timedelta(seconds=settings.IDEMPOTENCY_KEY_TTL)
+    try:
+        with transaction.atomic():
+            record = IdempotencyKey.objects.create(
+                user=user, key=key, request_hash=request_hash, locked_at=now, expires_at=now + ttl
+            )
+        return record, None
+    except IntegrityError:
+        pass
+
+    record = IdempotencyKey.objects.filter(user=user, key=key).first()
+    if record is None:
+        # The request holding the key failed and let it go; the client's retry will claim it
+        return None, in_progress()
+
+    expired = record.expires_at <= now
+    if not expired and record.request_hash != request_hash:
+        return None, JsonResponse({
+            "error": "Idempotency key reused",
+            "detail": f"This {IDEMPOTENCY_HEADER} was already used for a different request."
+        }, status=422)
+
+    stale = record.response_status is None and record.locked_at <= now - timedelta(seconds=settings.IDEMPOTENCY_LOCK_TIMEOUT)
+    if expired or stale:
+        # Compare-and-set on the old lock, so only one of several retries takes the key over
+        taken = IdempotencyKey.objects.filter(
+            pk=record.pk, locked_at=record.locked_at, expires_at=record.expires_at
+        ).update(request_hash=request_hash, locked_at=now, response_status=None, response_body=None, expires_at=now + ttl)
+        if not taken:
+            return None, in_progress()
+        record.locked_at = now
+        return record, None
+
+    if record.response_status is None:
+        return None, in_progress()
+    return None, replay(record)
+
+
+def _held(record):
+    """
+    The row while it is still locked by this request. A request that outlived
+    IDEMPOTENCY_LOCK_TIMEOUT may have lost it to a retry, whose row it mustn't touch.
+    """
+    return IdempotencyKey.objects.filter(pk=record.pk, locked_at=record.locked_at)
+
+
+def release(record):
+    if not _held(record).delete()[0]:
+        logger.warning(f"Idempotency key {record.key} was taken over by another request")
+
+
+def complete(record, response):
+    if response.status_code >= 500:
+        # Let the client's retry run the request again
+        release(record)
+        return
+    body = response.data if hasattr(response, 'data') else json.loads(response.content)
+    stored = _held(record).update(locked_at=None, response_status=response.status_code, response_body=body)
+    if not stored:
+        logger.warning(f"Idempotency key {record.key} was taken over by another request")
+
+
+def idempotent(view):
+    """
+    Honour the Idempotency-Key header on an authenticated view that returns JSON.
+    Goes below @api_view so the user is authenticated and permissions are checked first.
+    """
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        key = request.headers.get(IDEMPOTENCY_HEADER)
+        if key is None:
+            return view(request, *args, **kwargs)
+        if not 0 < len(key) <= 255:
+            return JsonResponse({
+                "error": f"Invalid {IDEMPOTENCY_HEADER}",
+                "detail": "Keys must be between 1 and 255 characters."
+            }, status=400)
+
+        record, response = acquire(request.user, key, request_fingerprint(request))
+        if response is not None:
+            return response
+        try:
+            response = view(request, *args, **kwargs)
+        except Exception:
+            release(record)
+            raise
+        complete(record, response)
+        return response
+
+    return wrapper
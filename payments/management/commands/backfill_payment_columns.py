@@ -0,0 +1,91 @@
+import json
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from payments.models import Payment
+
+UPDATE_FIELDS = ['card_brand', 'card_last4', 'failure_code', 'decline_code', 'metadata', 'updated_at']
+
+
+def _as_dict(value):
+    if isinstance(value, str):
+        try:
+            value = json.loads(value)
+        except ValueError:
+            return {}
+    return value if isinstance(value, dict) else {}
+
+
+def extract_columns(metadata):
+    """
+    Parse the card and failure fields out of metadata written by older webhook handlers
+    """
+    details = _as_dict(metadata.get('payment_method_details'))
+    # Card details were stored either flat or nested under the payment method type
+    card = _as_dict(details.get('card')) or details
+    error = _as_dict(metadata.get('error'))
+    return {
+        'card_brand': card.get('brand'),
+        'card_last4': card.get('last4'),
+        'failure_code': metadata.get('failure_code') or error.get('code'),
+        'decline_code': error.get('decline_code'),
+    }
+
+
+class Command(BaseCommand):
+    help = "Fill card brand/last4 and failure/decline code columns from existing Payment metadata"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=1000)
+        parser.add_argument(
+            '--sleep',
+            type=float,
+            default=0,
+            help="Seconds to pause between chunks to limit load on the database",
+        )
+
+    def handle(self, *args, **options):
+        pending = Payment.objects.filter(
+            Q(card_brand__isnull=True) & Q(card_last4__isnull=True)
+            & Q(failure_code__isnull=True) & Q(decline_code__isnull=True)
+        ).only('id', 'metadata', 'updated_at').order_by('pk')
+
+        last_pk = 0
+        scanned = updated = 0
+        while True:
+            chunk = list(pending.filter(pk__gt=last_pk)[:options['chunk_size']])
+            if not chunk:
+                break
+            last_pk = chunk[-1].pk
+            scanned += len(chunk)
+
+            changed = []
+            now = timezone.now()
+            for payment in chunk:
+                metadata = payment.metadata if isinstance(payment.metadata, dict) else {}
+                columns = extract_columns(metadata)
+                if not any(columns.values()):
+                    continue
+                for field, value in columns.items():
+                    setattr(payment, field, value)
+                # Store details as JSON instead of a JSON-encoded string
+                if isinstance(metadata.get('payment_method_details'), str):
+                    metadata['payment_method_details'] = _as_dict(metadata['payment_method_details'])
+                # bulk_update skips auto_now; bump it so the changes feed picks the row up
+                payment.updated_at = now
+                changed.append(payment)
+
+            if changed:
+                with transaction.atomic():
+                    Payment.objects.bulk_update(changed, UPDATE_FIELDS)
+                updated += len(changed)
+
+            self.stdout.write(f"Scanned {scanned} payments, updated {updated}")
+            if options['sleep']:
+                time.sleep(options['sleep'])
+
+        self.stdout.write(self.style.SUCCESS(f"Backfill complete: {updated} of {scanned} payments updated"))
@@ -0,0 +1,50 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from payments.merchant_webhooks import DeliveryEngine
+
+
+class Command(BaseCommand):
+    help = "Deliver queued merchant webhooks, sending to many endpoints concurrently"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=None, help="Endpoints delivered to at once")
+        parser.add_argument('--batch-size', type=int, default=None)
+        parser.add_argument(
+            '--interval',
+            type=float,
+            default=1,
+            help="Seconds to wait before polling again once nothing is due",
+        )
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help="Exit once nothing is due and nothing is in flight instead of polling",
+        )
+
+    def handle(self, *args, **options):
+        engine = DeliveryEngine(workers=options['workers'], batch_size=options['batch_size'])
+        try:
+            while True:
+                claimed = engine.poll()
+                if claimed:
+                    self.stdout.write(f"Claimed {claimed} webhook deliveries")
+                    continue
+                if engine.busy:
+                    # Pick up finished queues promptly; their endpoints may have more due
+                    engine.wait(timeout=options['interval'])
+                    continue
+                if options['once']:
+                    break
+                # Long-running worker: drop connections the database may have timed out
+                close_old_connections()
+                time.sleep(options['interval'])
+        finally:
+            engine.shutdown()
+
+        stats = engine.stats()
+        self.stdout.write(self.style.SUCCESS(
+            f"Delivered {stats['delivered']} webhooks, {stats['failed']} failed, {stats['dead']} dead-lettered"
+        ))
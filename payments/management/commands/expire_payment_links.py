@@ -0,0 +1,75 @@
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db.models import Exists, OuterRef
+from django.utils import timezone
+
+from payments.models import Payment, PaymentLink
+
+
+def chunks(queryset, chunk_size):
+    """
+    Yield lists of ids from `queryset` until it's empty. Each chunk must drop out
+    of the queryset once processed, or this never ends.
+    """
+    while True:
+        ids = list(queryset.values_list('id', flat=True)[:chunk_size])
+        if not ids:
+            return
+        yield ids
+
+
+class Command(BaseCommand):
+    help = (
+        "Mark payment links past their expiration date as expired, and delete expired links "
+        "that were never paid once they are older than PAYMENT_LINK_PURGE_AFTER_DAYS"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=500)
+        parser.add_argument(
+            '--sleep',
+            type=float,
+            default=0,
+            help="Seconds to pause between chunks to limit load on the database",
+        )
+        parser.add_argument(
+            '--purge-after-days',
+            type=int,
+            default=settings.PAYMENT_LINK_PURGE_AFTER_DAYS,
+            help="Delete unpaid links this many days after they expired; 0 keeps them",
+        )
+
+    def pause(self, options):
+        if options['sleep']:
+            time.sleep(options['sleep'])
+
+    def handle(self, *args, **options):
+        today = timezone.localdate()
+
+        # Each chunk is its own autocommitted UPDATE, so row locks last one statement
+        expired = 0
+        overdue = PaymentLink.objects.filter(status='active', expiration_date__lt=today)
+        for ids in chunks(overdue, options['chunk_size']):
+            # Bump updated_at so the changes feed reports the new status
+            expired += overdue.filter(id__in=ids).update(status='expired', updated_at=timezone.now())
+            self.stdout.write(f"Expired {expired} payment links")
+            self.pause(options)
+
+        purged = 0
+        if options['purge_after_days'] > 0:
+            cutoff = today - timedelta(days=options['purge_after_days'])
+            unpaid = PaymentLink.objects.filter(
+                status='expired',
+                expiration_date__lt=cutoff,
+            ).filter(~Exists(Payment.objects.filter(payment_link=OuterRef('pk'))))
+            for ids in chunks(unpaid, options['chunk_size']):
+                # Re-checked at delete time, in case a late webhook recorded a payment
+                _, deleted = unpaid.filter(id__in=ids).delete()
+                purged += deleted.get('payments.PaymentLink', 0)
+                self.stdout.write(f"Deleted {purged} unpaid expired payment links")
+                self.pause(options)
+
+        self.stdout.write(self.style.SUCCESS(f"Expired {expired} payment links, deleted {purged}"))
@@ -0,0 +1,19 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from dealflow.docs import generate_schema, write_schema
+
+
+class Command(BaseCommand):
+    help = "Generate the OpenAPI schema served at /api/docs/ (run at build time)"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--output',
+            default=None,
+            help="Where to write the schema (default: OPENAPI_SCHEMA_PATH)",
+        )
+
+    def handle(self, *args, **options):
+        path = write_schema(generate_schema(), options['output'] or settings.OPENAPI_SCHEMA_PATH)
+        self.stdout.write(self.style.SUCCESS(f"Wrote OpenAPI schema to {path}"))
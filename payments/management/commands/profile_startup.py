@@ -0,0 +1,112 @@
+import json
+import os
+import subprocess
+import sys
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+# Runs in a fresh interpreter so nothing is already imported
+STARTUP_SCRIPT = """
+import json, sys, time
+started = time.perf_counter()
+import django
+django.setup()
+setup_done = time.perf_counter()
+from django.core.handlers.wsgi import WSGIHandler
+application = WSGIHandler()
+status = []
+environ = {
+    'REQUEST_METHOD': 'GET', 'PATH_INFO': sys.argv[1], 'QUERY_STRING': '',
+    'SERVER_NAME': '127.0.0.1', 'SERVER_PORT': '80', 'HTTP_HOST': '127.0.0.1',
+    'wsgi.url_scheme': 'http', 'wsgi.input': __import__('io').BytesIO(),
+    'wsgi.errors': sys.stderr,
+}
+body = b''.join(application(environ, lambda s, h, e=None: status.append(s)))
+finished = time.perf_counter()
+print(json.dumps({
+    'setup_ms': (setup_done - started) * 1000,
+    'first_response_ms': (finished - started) * 1000,
+    'status': status[0] if status else None,
+}))
+"""
+
+
+def parse_importtime(stderr):
+    """
+    Fold `python -X importtime` output into cumulative microseconds per top-level module
+    """
+    modules = {}
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative_us, name = line[len('import time:'):].split('|')
+        # Names are indented two spaces per nesting level after the separator space
+        if name.startswith('   '):
+            # Nested import, already counted in its parent's cumulative time
+            continue
+        name = name.strip()
+        modules[name] = modules.get(name, 0) + int(cumulative_us)
+    return modules
+
+
+class Command(BaseCommand):
+    help = "Report per-module import time and total time to first response for a cold worker"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--path', default='/', help="Request path for the first response")
+        parser.add_argument('--limit', type=int, default=20, help="Number of modules to show")
+        parser.add_argument('--json', action='store_true', help="Print a JSON report")
+        parser.add_argument(
+            '--max-ms',
+            type=float,
+            default=None,
+            help="Exit with an error if time to first response exceeds this",
+        )
+
+    def handle(self, *args, **options):
+        env = dict(os.environ, DJANGO_SETTINGS_MODULE=settings.SETTINGS_MODULE)
+        spawned = time.perf_counter()
+        result = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-c', STARTUP_SCRIPT, options['path']],
+            capture_output=True,
+            text=True,
+            env=env,
+            cwd=settings.BASE_DIR,
+        )
+        wall_ms = (time.perf_counter() - spawned) * 1000
+        if result.returncode != 0:
+            raise CommandError(f"Startup probe failed:\n{result.stderr[-2000:]}")
+
+        timings = json.loads(result.stdout.strip().splitlines()[-1])
+        modules = sorted(parse_importtime(result.stderr).items(), key=lambda item: -item[1])
+        report = {
+            'settings': settings.SETTINGS_MODULE,
+            'path': options['path'],
+            'status': timings['status'],
+            'process_wall_ms': round(wall_ms, 1),
+            'setup_ms': round(timings['setup_ms'], 1),
+            'first_response_ms': round(timings['first_response_ms'], 1),
+            'modules': [
+                {'module': name, 'cumulative_ms': round(us / 1000, 1)}
+                for name, us in modules[:options['limit']]
+            ],
+        }
+
+        if options['json']:
+            self.stdout.write(json.dumps(report, indent=2))
+        else:
+            self.stdout.write(f"Settings:            {report['settings']}")
+            self.stdout.write(f"First request:       GET {report['path']} -> {report['status']}")
+            self.stdout.write(f"django.setup():      {report['setup_ms']} ms")
+            self.stdout.write(f"Time to response:    {report['first_response_ms']} ms")
+            self.stdout.write(f"Process wall time:   {report['process_wall_ms']} ms")
+            self.stdout.write("\nSlowest top-level imports:")
+            for row in report['modules']:
+                self.stdout.write(f"  {row['cumulative_ms']:>8.1f} ms  {row['module']}")
+
+        if options['max_ms'] is not None and report['first_response_ms'] > options['max_ms']:
+            raise CommandError(
+                f"Time to first response {report['first_response_ms']} ms exceeds {options['max_ms']} ms"
+            )
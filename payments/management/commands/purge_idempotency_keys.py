@@ -0,0 +1,34 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from payments.management.commands.expire_payment_links import chunks
+from payments.models import IdempotencyKey
+
+
+class Command(BaseCommand):
+    help = "Delete Idempotency-Key records whose replay window has passed"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=1000)
+        parser.add_argument(
+            '--sleep',
+            type=float,
+            default=0,
+            help="Seconds to pause between chunks to limit load on the database",
+        )
+
+    def handle(self, *args, **options):
+        expired = IdempotencyKey.objects.filter(expires_at__lt=timezone.now())
+
+        purged = 0
+        for ids in chunks(expired, options['chunk_size']):
+            # Re-checked at delete time, in case a retry took the key over meanwhile
+            _, deleted = expired.filter(id__in=ids).delete()
+            purged += deleted.get('payments.IdempotencyKey', 0)
+            self.stdout.write(f"Deleted {purged} idempotency keys")
+            if options['sleep']:
+                time.sleep(options['sleep'])
+
+        self.stdout.write(self.style.SUCCESS(f"Deleted {purged} expired idempotency keys"))
@@ -0,0 +1,74 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, Max, Q, Sum
+
+from payments.models import Payment, PaymentLink
+
+COUNTER_FIELDS = ['success_count', 'failed_count', 'collected_amount_minor', 'last_payment_at']
+
+
+class Command(BaseCommand):
+    help = "Recompute the payment counters on payment links from their payments, and fix any that drifted"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=500)
+        parser.add_argument(
+            '--sleep',
+            type=float,
+            default=0,
+            help="Seconds to pause between chunks to limit load on the database",
+        )
+
+    def handle(self, *args, **options):
+        checked = corrected = 0
+        last_id = 0
+        while True:
+            with transaction.atomic():
+                # Locking the links first makes a concurrent webhook's counter UPDATE wait
+                # for this chunk, then apply on top of the recomputed values
+                links = list(
+                    PaymentLink.objects.select_for_update()
+                    .filter(id__gt=last_id)
+                    .order_by('id')
+                    .only('id', *COUNTER_FIELDS)[:options['chunk_size']]
+                )
+                if not links:
+                    break
+                last_id = links[-1].id
+
+                totals = {
+                    row['payment_link_id']: row
+                    for row in Payment.objects.filter(payment_link__in=links)
+                    .values('payment_link_id')
+                    .annotate(
+                        success_count=Count('id', filter=Q(status='success')),
+                        failed_count=Count('id', filter=Q(status='failed')),
+                        collected_amount_minor=Sum('amount_minor', filter=Q(status='success')),
+                        last_payment_at=Max('created_at', filter=Q(status='success')),
+                    )
+                    .order_by()
+                }
+                drifted = []
+                for link in links:
+                    row = totals.get(link.id, {})
+                    expected = {
+                        'success_count': row.get('success_count', 0),
+                        'failed_count': row.get('failed_count', 0),
+                        'collected_amount_minor': row.get('collected_amount_minor') or 0,
+                        'last_payment_at': row.get('last_payment_at'),
+                    }
+                    if any(getattr(link, field) != value for field, value in expected.items()):
+                        for field, value in expected.items():
+                            setattr(link, field, value)
+                        drifted.append(link)
+                PaymentLink.objects.bulk_update(drifted, COUNTER_FIELDS)
+
+            checked += len(links)
+            corrected += len(drifted)
+            self.stdout.write(f"Checked {checked} payment links, corrected {corrected}")
+            if options['sleep']:
+                time.sleep(options['sleep'])
+
+        self.stdout.write(self.style.SUCCESS(f"Checked {checked} payment links, corrected {corrected}"))
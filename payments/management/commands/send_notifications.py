@@ -0,0 +1,36 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from payments.notifications import dispatch
+
+
+class Command(BaseCommand):
+    help = "Send queued notification emails from the outbox, in batches over one mail connection"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=None)
+        parser.add_argument(
+            '--interval',
+            type=float,
+            default=5,
+            help="Seconds to wait before polling again once nothing is due",
+        )
+        parser.add_argument('--once', action='store_true', help="Exit once nothing is due instead of polling")
+
+    def handle(self, *args, **options):
+        processed = 0
+        while True:
+            claimed = dispatch(options['batch_size'])
+            processed += claimed
+            if claimed:
+                self.stdout.write(f"Processed {claimed} notifications")
+                continue
+            if options['once']:
+                break
+            # Long-running worker: drop connections the database may have timed out
+            close_old_connections()
+            time.sleep(options['interval'])
+
+        self.stdout.write(self.style.SUCCESS(f"Processed {processed} notifications"))
@@ -0,0 +1,355 @@
+"""
+Outbound webhooks: signed payment events POSTed to merchant endpoints.
+
+upsert_payment queues one WebhookDelivery per active endpoint in the transaction
+that changes the payment, like the notification outbox. The deliver_webhooks
+command runs a DeliveryEngine, which leases due deliveries and gives each
+endpoint's batch to a pool thread as one queue, sent in order over that
+endpoint's own keep-alive session. A slow endpoint only holds up its own queue.
+After a failure the rest of its queue waits for the retry, with jittered
+exponential backoff, until WEBHOOK_MAX_ATTEMPTS dead-letters the delivery.
+
+Pool threads only do HTTP; claims and outcomes are written by the engine's thread.
+"""
+import hashlib
+import hmac
+import ipaddress
+import json
+import logging
+import random
+import socket
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ALL_COMPLETED, FIRST_COMPLETED, ThreadPoolExecutor, wait
+from datetime import timedelta
+from itertools import groupby
+from urllib.parse import urlsplit
+from uuid import uuid4
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from urllib3.exceptions import NewConnectionError
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.db.models import Count, Min, Q
+from django.utils import timezone
+
+from dealflow import metrics
+from payments.events import payment_event
+from payments.models import WebhookDelivery, WebhookEndpoint
+
+logger = logging.getLogger(__name__)
+
+EVENT_TYPES = {
+    'success': 'payment.succeeded',
+    'failed': 'payment.failed',
+    'pending': 'payment.pending',
+}
+SIGNATURE_HEADER = 'Dealflow-Signature'
+
+
+def enqueue_payment_webhooks(payment, previous_status):
+    """
+    Call inside the transaction that changed the payment
+    """
+    if payment.status == previous_status:
+        return
+    endpoint_ids = list(
+        WebhookEndpoint.objects.filter(user_id=payment.payment_link.user_id, is_active=True).values_list('id', flat=True)
+    )
+    if not endpoint_ids:
+        return
+
+    event_id = f"evt_{uuid4().hex}"
+    event_type = EVENT_TYPES.get(payment.status, 'payment.updated')
+    # Stored as it will be sent: amounts as decimal strings, dates in ISO 8601
+    payload = json.loads(DjangoJSONEncoder().encode({
+        'id': event_id,
+        'type': event_type,
+        'created': timezone.now(),
+        'data': payment_event(payment, previous_status),
+    }))
+    WebhookDelivery.objects.bulk_create([
+        WebhookDelivery(endpoint_id=endpoint_id, event_id=event_id, event_type=event_type, payload=payload)
+        for endpoint_id in endpoint_ids
+    ])
+
+
+def sign(secret, timestamp, body):
+    return hmac.new(secret.encode(), f"{timestamp}.".encode() + body, hashlib.sha256).hexdigest()
+
+
+def signature_header(secret, body, timestamp=None):
+    timestamp = int(time.time()) if timestamp is None else timestamp
+    return f"t={timestamp},v1={sign(secret, timestamp, body)}"
+
+
+def verify_signature(secret, body, header, tolerance=300):
+    """
+    What a receiver does with the Dealflow-Signature header; True if it is valid and recent
+    """
+    try:
+        parts = dict(part.split('=', 1) for part in header.split(','))
+        timestamp = int(parts['t'])
+    except (ValueError, KeyError):
+        return False
+    if abs(time.time() - timestamp) > tolerance:
+        return False
+    return hmac.compare_digest(parts.get('v1', ''), sign(secret, timestamp, body))
+
+
+def is_public_address(address):
+    return ipaddress.ip_address(address.split('%')[0]).is_global
+
+
+def is_allowed_destination(url):
+    """
+    Refuse loopback, private and link-local addresses unless explicitly allowed,
+    and hostnames that don't resolve. The answer can change before the request
+    connects, so PublicAddressAdapter checks the address actually connected to.
+    """
+    if settings.WEBHOOK_ALLOW_PRIVATE_NETWORKS:
+        return True
+    try:
+        addresses = {info[4][0] for info in socket.getaddrinfo(urlsplit(url).hostname, None)}
+    except (socket.gaierror, UnicodeError):
+        return False
+    return all(is_public_address(address) for address in addresses)
+
+
+class PublicAddressConnectionMixin:
+    def _new_conn(self):
+        sock = super()._new_conn()
+        address = sock.getpeername()[0]
+        if not is_public_address(address):
+            sock.close()
+            raise NewConnectionError(self, f"Refused to connect to non-public address {address}")
+        return sock
+
+
+class PublicHTTPConnection(PublicAddressConnectionMixin, HTTPConnection):
+    pass
+
+
+class PublicHTTPSConnection(PublicAddressConnectionMixin, HTTPSConnection):
+    pass
+
+
+class PublicHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = PublicHTTPConnection
+
+
+class PublicHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = PublicHTTPSConnection
+
+
+class PublicAddressAdapter(HTTPAdapter):
+    """
+    Only connects to public addresses, whatever DNS answers at connect time
+    (DNS rebinding)
+    """
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            'http': PublicHTTPConnectionPool,
+            'https': PublicHTTPSConnectionPool,
+        }
+
+
+def webhook_session():
+    session = requests.Session()
+    if not settings.WEBHOOK_ALLOW_PRIVATE_NETWORKS:
+        # Connect directly: through a proxy, the address checked would be the proxy's
+        session.trust_env = False
+        session.mount('http://', PublicAddressAdapter())
+        session.mount('https://', PublicAddressAdapter())
+    return session
+
+
+def retry_delay(attempts):
+    delay = min(settings.WEBHOOK_RETRY_MAX_DELAY, settings.WEBHOOK_RETRY_BASE_DELAY * 2 ** (attempts - 1))
+    return timedelta(seconds=delay * random.uniform(0.5, 1.0))
+
+
+def claim(batch_size, per_endpoint, exclude_endpoints=()):
+    """
+    Lease up to batch_size due deliveries, at most per_endpoint of them for any one endpoint
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        candidates = list(
+            WebhookDelivery.objects.select_for_update(skip_locked=True)
+            .filter(status='pending', next_attempt_at__lte=now)
+            .exclude(endpoint_id__in=exclude_endpoints)
+            .order_by('next_attempt_at', 'id')
+            .values_list('id', 'endpoint_id')[:batch_size]
+        )
+        taken = Counter()
+        ids = []
+        for delivery_id, endpoint_id in candidates:
+            if taken[endpoint_id] < per_endpoint:
+                taken[endpoint_id] += 1
+                ids.append(delivery_id)
+        WebhookDelivery.objects.filter(id__in=ids).update(
+            next_attempt_at=now + timedelta(seconds=settings.WEBHOOK_LEASE)
+        )
+    return list(WebhookDelivery.objects.filter(id__in=ids).select_related('endpoint').order_by('endpoint_id', 'id'))
+
+
+class DeliveryEngine:
+    def __init__(self, workers=None, batch_size=None, per_endpoint=None):
+        self.batch_size = batch_size or settings.WEBHOOK_BATCH_SIZE
+        self.per_endpoint = per_endpoint or settings.WEBHOOK_MAX_PER_ENDPOINT
+        self._executor = ThreadPoolExecutor(
+            max_workers=workers or settings.WEBHOOK_DELIVERY_WORKERS, thread_name_prefix='webhook-delivery'
+        )
+        # endpoint_id -> Future of its queue; one queue per endpoint at a time
+        self._in_flight = {}
+        # endpoint_id -> requests.Session; only the thread running that endpoint's queue uses it
+        self._sessions = {}
+        self._sessions_lock = threading.Lock()
+        self._counters = Counter()
+
+    @property
+    def busy(self):
+        return bool(self._in_flight)
+
+    def poll(self):
+        """
+        Record finished queues, then hand newly due deliveries to idle endpoints.
+        Returns how many deliveries were claimed.
+        """
+        self._collect()
+        deliveries = claim(self.batch_size, self.per_endpoint, list(self._in_flight))
+        for endpoint_id, queue in groupby(deliveries, key=lambda delivery: delivery.endpoint_id):
+            self._in_flight[endpoint_id] = self._executor.submit(self._send_queue, list(queue))
+        return len(deliveries)
+
+    def wait(self, timeout=None):
+        """
+        Block until some queue finishes (or all, with timeout=None), then record it
+        """
+        futures = list(self._in_flight.values())
+        if futures:
+            wait(futures, timeout=timeout, return_when=FIRST_COMPLETED if timeout is not None else ALL_COMPLETED)
+        self._collect()
+
+    def shutdown(self):
+        self.wait()
+        self._executor.shutdown()
+        for session in self._sessions.values():
+            session.close()
+
+    def stats(self):
+        stats = {key: self._counters[key] for key in ('attempts', 'delivered', 'failed', 'dead', 'total_ms')}
+        return {**stats, 'endpoints_in_flight': len(self._in_flight)}
+
+    def _session(self, endpoint_id):
+        with self._sessions_lock:
+            if endpoint_id not in self._sessions:
+                self._sessions[endpoint_id] = webhook_session()
+            return self._sessions[endpoint_id]
+
+    def _send_queue(self, deliveries):
+        """
+        Runs on a pool thread: send in order, stopping at the first failure.
+        Returns (outcomes, unsent deliveries).
+        """
+        outcomes = []
+        for index, delivery in enumerate(deliveries):
+            outcome = self._send(delivery)
+            outcomes.append(outcome)
+            if outcome[2]:
+                return outcomes, deliveries[index + 1:]
+        return outcomes, []
+
+    def _send(self, delivery):
+        endpoint = delivery.endpoint
+        body = json.dumps(delivery.payload, separators=(',', ':')).encode()
+        started = time.perf_counter()
+        if not is_allowed_destination(endpoint.url):
+            return delivery, None, "Destination is not a public address", 0.0, True
+        try:
+            response = self._session(endpoint.id).post(
+                endpoint.url,
+                data=body,
+                headers={
+                    'Content-Type': 'application/json',
+                    'User-Agent': 'Dealflow-Webhooks/1.0',
+                    SIGNATURE_HEADER: signature_header(endpoint.secret, body),
+                    'Dealflow-Event-Id': delivery.event_id,
+                    'Dealflow-Event-Type': delivery.event_type,
+                },
+                timeout=(settings.WEBHOOK_CONNECT_TIMEOUT, settings.WEBHOOK_TIMEOUT),
+                allow_redirects=False,
+            )
+            status_code = response.status_code
+            error = '' if 200 <= status_code < 300 else f"HTTP {status_code}"
+        except requests.RequestException as e:
+            status_code = None
+            error = str(e)
+        return delivery, status_code, error, (time.perf_counter() - started) * 1000, False
+
+    def _collect(self):
+        for endpoint_id, future in list(self._in_flight.items()):
+            if not future.done():
+                continue
+            del self._in_flight[endpoint_id]
+            try:
+                outcomes, unsent = future.result()
+            except Exception as e:
+                # The leases run out and the deliveries are claimed again
+                logger.error(f"Error delivering webhooks to endpoint {endpoint_id}: {str(e)}")
+                continue
+            for outcome in outcomes:
+                self._record(*outcome)
+            if unsent:
+                # Keep the endpoint's remaining events behind the one that just failed
+                retry_at = outcomes[-1][0].next_attempt_at
+                WebhookDelivery.objects.filter(id__in=[delivery.id for delivery in unsent]).update(next_attempt_at=retry_at)
+
+    def _record(self, delivery, status_code, error, duration_ms, dead):
+        now = timezone.now()
+        delivery.attempts += 1
+        delivery.last_status_code = status_code
+        delivery.last_error = error[:1000]
+        self._counters['attempts'] += 1
+        self._counters['total_ms'] += round(duration_ms)
+        if not error:
+            delivery.status = 'delivered'
+            delivery.delivered_at = now
+            self._counters['delivered'] += 1
+        elif dead or delivery.attempts >= settings.WEBHOOK_MAX_ATTEMPTS:
+            logger.warning(f"Dead-lettered webhook delivery {delivery.id} after {delivery.attempts} attempts: {error}")
+            delivery.status = 'dead'
+            self._counters['dead'] += 1
+        else:
+            delivery.next_attempt_at = now + retry_delay(delivery.attempts)
+            self._counters['failed'] += 1
+        # Not save(): the endpoint, and its deliveries with it, may have been deleted meanwhile
+        WebhookDelivery.objects.filter(pk=delivery.pk).update(**{
+            field: getattr(delivery, field)
+            for field in ('attempts', 'last_status_code', 'last_error', 'status', 'delivered_at', 'next_attempt_at')
+        })
+
+
+def delivery_backlog():
+    """
+    Queue depth across all engines, read from the database
+    """
+    backlog = WebhookDelivery.objects.aggregate(
+        pending=Count('id', filter=Q(status='pending')),
+        dead=Count('id', filter=Q(status='dead')),
+        oldest_pending=Min('created_at', filter=Q(status='pending')),
+    )
+    oldest = backlog.pop('oldest_pending')
+    backlog['oldest_pending_seconds'] = (timezone.now() - oldest).total_seconds() if oldest else 0
+    return backlog
+
+
+metrics.register('webhook_deliveries', delivery_backlog)
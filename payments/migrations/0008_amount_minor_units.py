@@ -0,0 +1,39 @@
+# Generated by Django 5.1.2 on 2026-10-19 09:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('payments', '0007_remove_paymentlink_status'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='paymentlink',
+            name='amount_minor',
+            field=models.BigIntegerField(null=True),
+        ),
+        migrations.AddField(
+            model_name='payment',
+            name='amount_minor',
+            field=models.BigIntegerField(null=True),
+        ),
+        migrations.AddField(
+            model_name='payment',
+            name='dispute_amount_minor',
+            field=models.BigIntegerField(blank=True, null=True),
+        ),
+        # Nullable so the migration can be reversed once 0010 drops the columns
+        migrations.AlterField(
+            model_name='paymentlink',
+            name='amount',
+            field=models.DecimalField(decimal_places=2, max_digits=10, null=True),
+        ),
+        migrations.AlterField(
+            model_name='payment',
+            name='amount',
+            field=models.DecimalField(decimal_places=2, max_digits=10, null=True),
+        ),
+    ]
@@ -0,0 +1,80 @@
+from decimal import Decimal, ROUND_HALF_UP
+
+from django.db import migrations, transaction
+
+CHUNK_SIZE = 1000
+
+# Frozen from payments.currency: every supported currency except these has exponent 2
+CURRENCY_EXPONENTS = {'JPY': 0}
+DEFAULT_EXPONENT = 2
+
+AMOUNT_FIELDS = {
+    'PaymentLink': [('amount', 'amount_minor')],
+    'Payment': [('amount', 'amount_minor'), ('dispute_amount', 'dispute_amount_minor')],
+}
+
+
+def exponent(currency):
+    return CURRENCY_EXPONENTS.get((currency or '').upper(), DEFAULT_EXPONENT)
+
+
+def to_minor(amount, currency):
+    if amount is None:
+        return None
+    return int(Decimal(amount).scaleb(exponent(currency)).quantize(Decimal('1'), rounding=ROUND_HALF_UP))
+
+
+def to_major(minor, currency):
+    if minor is None:
+        return None
+    return Decimal(minor).scaleb(-exponent(currency))
+
+
+def copy_in_chunks(apps, schema_editor, convert, forwards):
+    """
+    Walk each table in primary-key order, committing every CHUNK_SIZE rows so
+    no long transaction holds locks on the whole table
+    """
+    db_alias = schema_editor.connection.alias
+    for model_name, pairs in AMOUNT_FIELDS.items():
+        model = apps.get_model('payments', model_name)
+        targets = [minor if forwards else major for major, minor in pairs]
+        last_pk = 0
+        while True:
+            with transaction.atomic(using=db_alias):
+                rows = list(
+                    model.objects.using(db_alias)
+                    .filter(pk__gt=last_pk)
+                    .order_by('pk')[:CHUNK_SIZE]
+                )
+                if not rows:
+                    break
+                for row in rows:
+                    for major, minor in pairs:
+                        if forwards:
+                            setattr(row, minor, convert(getattr(row, major), row.currency))
+                        else:
+                            setattr(row, major, convert(getattr(row, minor), row.currency))
+                model.objects.using(db_alias).bulk_update(rows, targets)
+            last_pk = rows[-1].pk
+
+
+def forwards(apps, schema_editor):
+    copy_in_chunks(apps, schema_editor, to_minor, forwards=True)
+
+
+def backwards(apps, schema_editor):
+    copy_in_chunks(apps, schema_editor, to_major, forwards=False)
+
+
+class Migration(migrations.Migration):
+    # Each chunk commits on its own
+    atomic = False
+
+    dependencies = [
+        ('payments', '0008_amount_minor_units'),
+    ]
+
+    operations = [
+        migrations.RunPython(forwards, backwards),
+    ]
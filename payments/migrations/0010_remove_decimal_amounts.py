@@ -0,0 +1,35 @@
+# Generated by Django 5.1.2 on 2026-10-19 09:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('payments', '0009_backfill_amount_minor_units'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='paymentlink',
+            name='amount',
+        ),
+        migrations.RemoveField(
+            model_name='payment',
+            name='amount',
+        ),
+        migrations.RemoveField(
+            model_name='payment',
+            name='dispute_amount',
+        ),
+        migrations.AlterField(
+            model_name='paymentlink',
+            name='amount_minor',
+            field=models.BigIntegerField(),
+        ),
+        migrations.AlterField(
+            model_name='payment',
+            name='amount_minor',
+            field=models.BigIntegerField(),
+        ),
+    ]
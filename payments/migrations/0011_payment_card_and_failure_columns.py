@@ -0,0 +1,37 @@
+# Generated by Django 5.2.18 on 2026-10-19 17:46
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('payments', '0010_remove_decimal_amounts'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='payment',
+            name='card_brand',
+            field=models.CharField(blank=True, db_index=True, max_length=32, null=True),
+        ),
+        migrations.AddField(
+            model_name='payment',
+            name='card_last4',
+            field=models.CharField(blank=True, db_index=True, max_length=4, null=True),
+        ),
+        migrations.AddField(
+            model_name='payment',
+            name='decline_code',
+            field=models.CharField(blank=True, max_length=64, null=True),
+        ),
+        migrations.AddField(
+            model_name='payment',
+            name='failure_code',
+            field=models.CharField(blank=True, max_length=64, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='payment',
+            index=models.Index(condition=models.Q(('status', 'failed')), fields=['payment_link', 'decline_code', 'failure_code', 'card_brand'], name='payment_failure_idx'),
+        ),
+    ]
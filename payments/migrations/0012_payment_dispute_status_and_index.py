@@ -0,0 +1,22 @@
+# Generated by Django 5.2.18 on 2026-10-19 17:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('payments', '0011_payment_card_and_failure_columns'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='payment',
+            name='dispute_status',
+            field=models.CharField(blank=True, max_length=32, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='payment',
+            index=models.Index(condition=models.Q(('is_disputed', True)), fields=['payment_link', 'dispute_created_at'], name='payment_disputed_idx'),
+        ),
+    ]
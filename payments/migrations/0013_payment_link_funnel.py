@@ -0,0 +1,25 @@
+# Generated by Django 5.2.18 on 2026-10-19 17:50
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('payments', '0012_payment_dispute_status_and_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PaymentLinkFunnel',
+            fields=[
+                ('payment_link', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='funnel', serialize=False, to='payments.paymentlink')),
+                ('page_views', models.PositiveBigIntegerField(default=0)),
+                ('intents_created', models.PositiveBigIntegerField(default=0)),
+                ('successes', models.PositiveBigIntegerField(default=0)),
+                ('failures', models.PositiveBigIntegerField(default=0)),
+                ('updated_at', models.DateTimeField()),
+            ],
+        ),
+    ]
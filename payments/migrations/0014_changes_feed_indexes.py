@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-19 17:57
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('payments', '0013_payment_link_funnel'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='payment',
+            index=models.Index(fields=['updated_at', 'id'], name='payment_changes_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='paymentlink',
+            index=models.Index(fields=['user', 'updated_at', 'id'], name='paymentlink_changes_idx'),
+        ),
+    ]
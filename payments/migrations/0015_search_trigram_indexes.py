@@ -0,0 +1,44 @@
+from django.contrib.postgres.operations import TrigramExtension
+from django.db import migrations
+
+# (index, table, column); GIN trigram indexes serving the %> filters in payments.views.search_views
+SEARCH_INDEXES = [
+    ('paymentlink_unique_id_trgm', 'payments_paymentlink', 'unique_id'),
+    ('paymentlink_description_trgm', 'payments_paymentlink', 'description'),
+    ('payment_stripe_id_trgm', 'payments_payment', 'stripe_payment_id'),
+    ('payment_customer_email_trgm', 'payments_payment', 'customer_email'),
+    ('payment_customer_name_trgm', 'payments_payment', 'customer_name'),
+]
+
+
+def create_search_indexes(apps, schema_editor):
+    # Other databases search with LIKE and have nothing to index
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for name, table, column in SEARCH_INDEXES:
+        # CONCURRENTLY, so building them doesn't block writes to large tables
+        schema_editor.execute(
+            f'CREATE INDEX CONCURRENTLY IF NOT EXISTS {name} ON {table} USING gin ({column} gin_trgm_ops)'
+        )
+
+
+def drop_search_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for name, _, _ in SEARCH_INDEXES:
+        schema_editor.execute(f'DROP INDEX CONCURRENTLY IF EXISTS {name}')
+
+
+class Migration(migrations.Migration):
+    # CREATE INDEX CONCURRENTLY can't run inside a transaction
+    atomic = False
+
+    dependencies = [
+        ('payments', '0014_changes_feed_indexes'),
+    ]
+
+    operations = [
+        # No-op on databases other than PostgreSQL
+        TrigramExtension(),
+        migrations.RunPython(create_search_indexes, drop_search_indexes),
+    ]
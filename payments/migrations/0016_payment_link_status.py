@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-19 18:11
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('payments', '0015_search_trigram_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='paymentlink',
+            name='status',
+            field=models.CharField(choices=[('active', 'Active'), ('completed', 'Completed'), ('expired', 'Expired')], default='active', max_length=10),
+        ),
+        migrations.AddIndex(
+            model_name='paymentlink',
+            index=models.Index(condition=models.Q(('status', 'active')), fields=['user', '-created_at'], name='paymentlink_active_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='paymentlink',
+            index=models.Index(condition=models.Q(('expiration_date__isnull', False), ('status', 'active')), fields=['expiration_date'], name='paymentlink_active_expiry_idx'),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-19 18:29
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('payments', '0019_idempotency_keys'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='paymentlink',
+            name='collected_amount_minor',
+            field=models.BigIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='paymentlink',
+            name='failed_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='paymentlink',
+            name='last_payment_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='paymentlink',
+            name='success_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
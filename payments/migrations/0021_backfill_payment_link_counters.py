@@ -0,0 +1,63 @@
+from django.db import migrations, transaction
+from django.db.models import Count, Max, Q, Sum
+
+CHUNK_SIZE = 1000
+
+COUNTER_FIELDS = ['success_count', 'failed_count', 'collected_amount_minor', 'last_payment_at']
+
+
+def backfill_counters(apps, schema_editor):
+    """
+    The same aggregation as reconcile_payment_link_counters, so payments made
+    before the counters existed are counted, and moving one between statuses
+    never takes a counter below zero
+    """
+    db_alias = schema_editor.connection.alias
+    PaymentLink = apps.get_model('payments', 'PaymentLink')
+    Payment = apps.get_model('payments', 'Payment')
+    last_pk = 0
+    while True:
+        with transaction.atomic(using=db_alias):
+            links = list(
+                PaymentLink.objects.using(db_alias)
+                .select_for_update()
+                .filter(pk__gt=last_pk)
+                .order_by('pk')
+                .only('pk', *COUNTER_FIELDS)[:CHUNK_SIZE]
+            )
+            if not links:
+                break
+            totals = {
+                row['payment_link_id']: row
+                for row in Payment.objects.using(db_alias)
+                .filter(payment_link__in=links)
+                .values('payment_link_id')
+                .annotate(
+                    success_count=Count('id', filter=Q(status='success')),
+                    failed_count=Count('id', filter=Q(status='failed')),
+                    collected_amount_minor=Sum('amount_minor', filter=Q(status='success')),
+                    last_payment_at=Max('created_at', filter=Q(status='success')),
+                )
+                .order_by()
+            }
+            for link in links:
+                row = totals.get(link.pk, {})
+                link.success_count = row.get('success_count', 0)
+                link.failed_count = row.get('failed_count', 0)
+                link.collected_amount_minor = row.get('collected_amount_minor') or 0
+                link.last_payment_at = row.get('last_payment_at')
+            PaymentLink.objects.using(db_alias).bulk_update(links, COUNTER_FIELDS)
+        last_pk = links[-1].pk
+
+
+class Migration(migrations.Migration):
+    # Each chunk commits on its own
+    atomic = False
+
+    dependencies = [
+        ('payments', '0020_payment_link_counters'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 5.2.18 on 2026-10-19 19:28
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('payments', '0021_backfill_payment_link_counters'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='payment',
+            index=models.Index(fields=['payment_link', 'updated_at', 'id'], name='payment_changes_by_link_idx'),
+        ),
+        migrations.RemoveIndex(
+            model_name='payment',
+            name='payment_changes_idx',
+        ),
+    ]
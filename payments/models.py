@@ -1,8 +1,34 @@
 from django.db import models
 from django.contrib.auth.models import User
 from django.urls import reverse
+from django.utils import timezone
 from django.utils.crypto import get_random_string
 
+from payments.currency import from_minor_units, to_minor_units
+
+
+def minor_unit_amount(field_name):
+    """
+    Decimal view of an integer minor-unit column, converted with the row's currency.
+    Assign the currency before the amount; Model.__init__ already sets fields before properties.
+    """
+    def getter(self):
+        return from_minor_units(getattr(self, field_name), self.currency)
+
+    def setter(self, value):
+        setattr(self, field_name, None if value is None else to_minor_units(value, self.currency))
+
+    return property(getter, setter)
+
+
+class PaymentLinkQuerySet(models.QuerySet):
+    def live(self):
+        """
+        Links that can still be paid. Checks the date as well as the stored status,
+        so links the sweeper hasn't reached yet are excluded too.
+        """
+        return self.filter(status='active').exclude(expiration_date__lt=timezone.localdate())
+
 
 class PaymentLink(models.Model):
     STATUS_CHOICES = [
@@ -13,18 +39,40 @@ class PaymentLink(models.Model):
     
     unique_id = models.CharField(max_length=100, unique=True)
     user = models.ForeignKey(User, on_delete=models.CASCADE)
-    amount = models.DecimalField(max_digits=10, decimal_places=2)
+    # Integer minor units of `currency` (cents, or yen for JPY)
+    amount_minor = models.BigIntegerField()
     currency = models.CharField(max_length=3, default='USD')
     description = models.TextField(blank=True)
-    # Dynamic status field
-    #status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='active')
+    # Moved to 'expired' by the expire_payment_links sweeper after expiration_date
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='active')
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     expiration_date = models.DateField(blank=True, null=True)
+    # Counters over the link's payments, kept by upsert_payment and recomputed by
+    # reconcile_payment_link_counters; failed_count counts payments currently failed
+    success_count = models.PositiveIntegerField(default=0)
+    failed_count = models.PositiveIntegerField(default=0)
+    # Sum of successful payments, in minor units of `currency`
+    collected_amount_minor = models.BigIntegerField(default=0)
+    # created_at of the newest successful payment
+    last_payment_at = models.DateTimeField(blank=True, null=True)
+
+    amount = minor_unit_amount('amount_minor')
+    collected_amount = minor_unit_amount('collected_amount_minor')
+
+    objects = PaymentLinkQuerySet.as_manager()
 
     def __str__(self):
         return f"{self.amount} {self.currency} - {self.unique_id}"
 
+    def is_live(self):
+        """
+        Instance counterpart of PaymentLinkQuerySet.live(); a link is payable through its expiration date
+        """
+        return self.status == 'active' and (
+            self.expiration_date is None or self.expiration_date >= timezone.localdate()
+        )
+
     def save(self, *args, **kwargs):
         if not self.unique_id:
             self.unique_id = get_random_string(20)
@@ -33,6 +81,24 @@ class PaymentLink(models.Model):
     def get_absolute_url(self):
         return reverse('payment-page', args=[self.unique_id])
 
+    class Meta:
+        indexes = [
+            # Keyset pagination of the changes feed
+            models.Index(fields=['user', 'updated_at', 'id'], name='paymentlink_changes_idx'),
+            # Live links only: listings filtered to active links, and the sweeper's scan for
+            # links past their expiration date, never touch expired rows
+            models.Index(
+                fields=['user', '-created_at'],
+                condition=models.Q(status='active'),
+                name='paymentlink_active_idx',
+            ),
+            models.Index(
+                fields=['expiration_date'],
+                condition=models.Q(status='active', expiration_date__isnull=False),
+                name='paymentlink_active_expiry_idx',
+            ),
+        ]
+
 
 class Payment(models.Model):
     STATUS_CHOICES = [
@@ -43,7 +109,8 @@ class Payment(models.Model):
     
     payment_link = models.ForeignKey(PaymentLink, on_delete=models.CASCADE, related_name='payments')
     stripe_payment_id = models.CharField(max_length=100, unique=True)
-    amount = models.DecimalField(max_digits=10, decimal_places=2)
+    # Integer minor units of `currency`, exactly as Stripe reports them
+    amount_minor = models.BigIntegerField()
     currency = models.CharField(max_length=3)
     status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending')
     payment_method = models.CharField(max_length=50)
@@ -52,13 +119,179 @@ class Payment(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     metadata = models.JSONField(default=dict, blank=True)
+    # Promoted from metadata so analytics can filter and group on them
+    card_brand = models.CharField(max_length=32, blank=True, null=True, db_index=True)
+    card_last4 = models.CharField(max_length=4, blank=True, null=True, db_index=True)
+    failure_code = models.CharField(max_length=64, blank=True, null=True)
+    decline_code = models.CharField(max_length=64, blank=True, null=True)
     is_disputed = models.BooleanField(default=False)
     dispute_reason = models.CharField(max_length=255, blank=True, null=True)
-    dispute_amount = models.DecimalField(max_digits=10, decimal_places=2, blank=True, null=True)
+    dispute_status = models.CharField(max_length=32, blank=True, null=True)
+    dispute_amount_minor = models.BigIntegerField(blank=True, null=True)
     dispute_created_at = models.DateTimeField(blank=True, null=True)
 
+    amount = minor_unit_amount('amount_minor')
+    dispute_amount = minor_unit_amount('dispute_amount_minor')
+
     def __str__(self):
         return f"{self.stripe_payment_id} - {self.status}"
 
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            models.Index(
+                fields=['payment_link', 'decline_code', 'failure_code', 'card_brand'],
+                condition=models.Q(status='failed'),
+                name='payment_failure_idx',
+            ),
+            # Disputes are a tiny fraction of payments; keep their index to just those rows
+            models.Index(
+                fields=['payment_link', 'dispute_created_at'],
+                condition=models.Q(is_disputed=True),
+                name='payment_disputed_idx',
+            ),
+            # Keyset pagination of the changes feed: reads only the merchant's links' changed rows
+            models.Index(fields=['payment_link', 'updated_at', 'id'], name='payment_changes_by_link_idx'),
+        ]
+
+
+class PaymentLinkFunnel(models.Model):
+    """
+    Checkout funnel totals per link, written in batches by payments.funnel
+    """
+    payment_link = models.OneToOneField(
+        PaymentLink, on_delete=models.CASCADE, primary_key=True, related_name='funnel'
+    )
+    page_views = models.PositiveBigIntegerField(default=0)
+    intents_created = models.PositiveBigIntegerField(default=0)
+    successes = models.PositiveBigIntegerField(default=0)
+    failures = models.PositiveBigIntegerField(default=0)
+    updated_at = models.DateTimeField()
+
+    def __str__(self):
+        return f"Funnel for {self.payment_link_id}"
+
+
+class NotificationOutbox(models.Model):
+    """
+    Notifications to send, written in the same transaction as the change that
+    triggers them and sent by the send_notifications worker
+    """
+    KIND_CHOICES = [
+        ('payment_succeeded', 'Payment succeeded'),
+    ]
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('sent', 'Sent'),
+        ('skipped', 'Skipped'),
+        ('failed', 'Failed'),
+    ]
+
+    kind = models.CharField(max_length=32, choices=KIND_CHOICES)
+    payment = models.ForeignKey(Payment, on_delete=models.CASCADE, related_name='notifications')
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending')
+    attempts = models.PositiveIntegerField(default=0)
+    # Also pushed forward while a worker holds the row, so a crashed worker's rows are retried
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(blank=True, null=True)
+
+    def __str__(self):
+        return f"{self.kind} for {self.payment_id} - {self.status}"
+
+    class Meta:
+        indexes = [
+            # The worker only ever scans rows still waiting to be sent
+            models.Index(
+                fields=['next_attempt_at', 'id'],
+                condition=models.Q(status='pending'),
+                name='notification_pending_idx',
+            ),
+        ]
+
+
+class WebhookEndpoint(models.Model):
+    """
+    A merchant URL that receives signed payment events
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='webhook_endpoints')
+    url = models.URLField(max_length=500)
+    description = models.CharField(max_length=255, blank=True)
+    # HMAC key for the Dealflow-Signature header; shown to the merchant once, on creation
+    secret = models.CharField(max_length=64)
+    is_active = models.BooleanField(default=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.url} - {self.user_id}"
+
+    def save(self, *args, **kwargs):
+        if not self.secret:
+            self.secret = f"whsec_{get_random_string(32)}"
+        super().save(*args, **kwargs)
+
+
+class WebhookDelivery(models.Model):
+    """
+    One event for one endpoint, queued in the transaction that produced the event
+    and sent by the deliver_webhooks engine
+    """
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('delivered', 'Delivered'),
+        # Dead letters: gave up after WEBHOOK_MAX_ATTEMPTS, kept for inspection and manual retry
+        ('dead', 'Dead'),
+    ]
+
+    endpoint = models.ForeignKey(WebhookEndpoint, on_delete=models.CASCADE, related_name='deliveries')
+    # Shared by the deliveries of one event to different endpoints; receivers dedupe on it
+    event_id = models.CharField(max_length=40)
+    event_type = models.CharField(max_length=50)
+    payload = models.JSONField()
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending')
+    attempts = models.PositiveIntegerField(default=0)
+    # Also pushed forward while the engine holds the row, so a crashed engine's rows are retried
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    last_status_code = models.PositiveSmallIntegerField(blank=True, null=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    delivered_at = models.DateTimeField(blank=True, null=True)
+
+    def __str__(self):
+        return f"{self.event_type} {self.event_id} to {self.endpoint_id} - {self.status}"
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=['next_attempt_at', 'id'],
+                condition=models.Q(status='pending'),
+                name='webhook_delivery_pending_idx',
+            ),
+            models.Index(fields=['endpoint', '-created_at'], name='webhook_delivery_endpoint_idx'),
+        ]
+
+
+class IdempotencyKey(models.Model):
+    """
+    A client's Idempotency-Key for a POST, with the response to replay for retries
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='idempotency_keys')
+    key = models.CharField(max_length=255)
+    # SHA-256 of the method, path and body; a key may only be reused for the same request
+    request_hash = models.CharField(max_length=64)
+    # Set while the first request runs; duplicates that arrive meanwhile get a 409
+    locked_at = models.DateTimeField(blank=True, null=True)
+    response_status = models.PositiveSmallIntegerField(blank=True, null=True)
+    response_body = models.JSONField(blank=True, null=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField(db_index=True)
+
+    def __str__(self):
+        return f"{self.key} - {self.user_id}"
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'key'], name='idempotency_key_unique_per_user'),
+        ]
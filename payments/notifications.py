@@ -0,0 +1,131 @@
+"""
+Transactional outbox for notification emails.
+
+Webhook handlers only insert NotificationOutbox rows, inside the transaction that
+changes the payment, so a notification exists exactly when the change committed
+and no SMTP round trip is added to the webhook. The send_notifications worker
+claims due rows in batches and sends them over one mail connection. Failed sends
+are retried with jittered exponential backoff until NOTIFICATION_MAX_ATTEMPTS.
+
+Claiming a row pushes its next_attempt_at out by NOTIFICATION_LEASE seconds
+instead of holding a lock while mail is sent. If a worker dies mid-batch, its
+rows come due again once the lease runs out, so delivery is at least once.
+"""
+import logging
+import random
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db import transaction
+from django.db.models import F
+from django.template.loader import render_to_string
+from django.utils import timezone
+
+from payments.currency import from_minor_units
+from payments.models import NotificationOutbox
+
+logger = logging.getLogger(__name__)
+
+
+def enqueue_payment_notifications(payment, previous_status):
+    """
+    Call inside the transaction that changed the payment
+    """
+    if payment.status == 'success' and previous_status != 'success':
+        NotificationOutbox.objects.create(kind='payment_succeeded', payment=payment)
+
+
+def build_message(notification):
+    """
+    The EmailMessage for a notification, or None when there is nobody to send it to
+    """
+    payment = notification.payment
+    payment_link = payment.payment_link
+    recipient = payment_link.user.email
+    if not recipient:
+        return None
+
+    context = {
+        'payment': payment,
+        'payment_link': payment_link,
+        'amount': from_minor_units(payment.amount_minor, payment.currency),
+    }
+    return EmailMessage(
+        subject=f"Payment received: {context['amount']} {payment.currency}",
+        body=render_to_string(f'payments/email/{notification.kind}.txt', context),
+        from_email=settings.DEFAULT_FROM_EMAIL,
+        to=[recipient],
+    )
+
+
+def claim_batch(batch_size):
+    now = timezone.now()
+    with transaction.atomic():
+        # SKIP LOCKED lets several workers claim disjoint batches on PostgreSQL
+        ids = list(
+            NotificationOutbox.objects.select_for_update(skip_locked=True)
+            .filter(status='pending', next_attempt_at__lte=now)
+            .order_by('next_attempt_at', 'id')
+            .values_list('id', flat=True)[:batch_size]
+        )
+        NotificationOutbox.objects.filter(id__in=ids).update(
+            attempts=F('attempts') + 1,
+            next_attempt_at=now + timedelta(seconds=settings.NOTIFICATION_LEASE),
+        )
+    return list(
+        NotificationOutbox.objects.filter(id__in=ids)
+        .select_related('payment__payment_link__user')
+        .order_by('id')
+    )
+
+
+def retry_delay(attempts):
+    # Jitter spreads out retries of a batch that failed together
+    delay = min(settings.NOTIFICATION_RETRY_MAX_DELAY, settings.NOTIFICATION_RETRY_BASE_DELAY * 2 ** (attempts - 1))
+    return timedelta(seconds=delay * random.uniform(0.5, 1.0))
+
+
+def send_batch(notifications):
+    """
+    Send the notifications over one connection and record each outcome
+    """
+    now = timezone.now()
+    connection = get_connection()
+    try:
+        for notification in notifications:
+            try:
+                message = build_message(notification)
+                if message is None:
+                    notification.status = 'skipped'
+                    continue
+                # Opened here so the backend keeps it for the whole batch; a no-op while it's still open
+                connection.open()
+                message.connection = connection
+                message.send()
+                notification.status = 'sent'
+                notification.sent_at = now
+                notification.last_error = ''
+            except Exception as e:
+                logger.error(f"Error sending notification {notification.id}: {str(e)}")
+                notification.last_error = str(e)
+                if notification.attempts >= settings.NOTIFICATION_MAX_ATTEMPTS:
+                    notification.status = 'failed'
+                else:
+                    notification.next_attempt_at = now + retry_delay(notification.attempts)
+                # The connection may be what broke; open a fresh one for the rest of the batch
+                connection.close()
+    finally:
+        connection.close()
+
+    NotificationOutbox.objects.bulk_update(notifications, ['status', 'sent_at', 'last_error', 'next_attempt_at'])
+
+
+def dispatch(batch_size=None):
+    """
+    Send one batch of due notifications; returns how many were claimed
+    """
+    notifications = claim_batch(batch_size or settings.NOTIFICATION_BATCH_SIZE)
+    if notifications:
+        send_batch(notifications)
+    return len(notifications)
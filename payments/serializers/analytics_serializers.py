@@ -1,5 +1,33 @@
 from rest_framework import serializers
 
+from payments.models import PaymentLink
+from payments.serializers.payment_serializers import PaymentLinkSerializer
+
+# Keys of a payment_analytics row; `fields=` picks a subset
+ANALYTICS_FIELDS = ('id', 'amount', 'currency', 'payment_method', 'status', 'created_at', 'payment_link__unique_id')
+
+
+class FieldListField(serializers.CharField):
+    """
+    A comma-separated subset of `allowed`, e.g. ?fields=id,amount. Returned as a
+    tuple in the allow-list's order, so responses keep a stable key order.
+    """
+
+    def __init__(self, allowed, **kwargs):
+        self.allowed = tuple(allowed)
+        super().__init__(**kwargs)
+
+    def to_internal_value(self, data):
+        requested = {name.strip() for name in super().to_internal_value(data).split(',') if name.strip()}
+        if not requested:
+            raise serializers.ValidationError("Name at least one field.")
+        unknown = requested.difference(self.allowed)
+        if unknown:
+            raise serializers.ValidationError(
+                f"Unknown fields: {', '.join(sorted(unknown))}. Choose from {', '.join(self.allowed)}."
+            )
+        return tuple(name for name in self.allowed if name in requested)
+
 
 class AnalyticsQueryParamsSerializer(serializers.Serializer):
     start_date = serializers.DateField(required=False)
@@ -16,10 +44,14 @@ class AnalyticsQueryParamsSerializer(serializers.Serializer):
         return data
 
 
+class PaymentAnalyticsQueryParamsSerializer(AnalyticsQueryParamsSerializer):
+    fields = FieldListField(ANALYTICS_FIELDS, required=False)
+
+
 class PaymentMethodStatsSerializer(serializers.Serializer):
     payment_method = serializers.CharField(allow_blank=True, required=False)
     count = serializers.IntegerField()
-    total_amount = serializers.DecimalField(max_digits=10, decimal_places=2)
+    total_amount = serializers.DecimalField(max_digits=20, decimal_places=2)
     success_count = serializers.IntegerField()
     failed_count = serializers.IntegerField()
 
@@ -27,4 +59,44 @@ class PaymentMethodStatsSerializer(serializers.Serializer):
 class CurrencyStatsSerializer(serializers.Serializer):
     currency = serializers.CharField()
     count = serializers.IntegerField()
-    total_amount = serializers.DecimalField(max_digits=10, decimal_places=2)
+    total_amount = serializers.DecimalField(max_digits=20, decimal_places=2)
+
+
+class FailureStatsSerializer(serializers.Serializer):
+    failure_code = serializers.CharField(allow_null=True)
+    decline_code = serializers.CharField(allow_null=True)
+    card_brand = serializers.CharField(allow_null=True)
+    count = serializers.IntegerField()
+
+
+class DisputeQueryParamsSerializer(serializers.Serializer):
+    start_date = serializers.DateField(required=False)
+    end_date = serializers.DateField(required=False)
+    period = serializers.ChoiceField(choices=['day', 'week', 'month'], default='month')
+
+    def validate(self, data):
+        if data.get('start_date') and data.get('end_date'):
+            if data['start_date'] > data['end_date']:
+                raise serializers.ValidationError("End date must be after start date")
+        return data
+
+
+class FunnelStatsSerializer(serializers.Serializer):
+    payment_link = serializers.CharField()
+    page_views = serializers.IntegerField()
+    intents_created = serializers.IntegerField()
+    successes = serializers.IntegerField()
+    failures = serializers.IntegerField()
+    intent_rate = serializers.FloatField(allow_null=True)
+    conversion_rate = serializers.FloatField(allow_null=True)
+    updated_at = serializers.DateTimeField()
+
+
+class DashboardQueryParamsSerializer(serializers.Serializer):
+    end_date = serializers.DateField(required=False)
+    days = serializers.IntegerField(min_value=1, max_value=366, default=30)
+
+
+class PaymentLinkListQueryParamsSerializer(serializers.Serializer):
+    status = serializers.ChoiceField(choices=PaymentLink.STATUS_CHOICES, required=False)
+    fields = FieldListField(PaymentLinkSerializer.Meta.fields, required=False)
@@ -0,0 +1,44 @@
+import base64
+import json
+from datetime import datetime
+
+from django.conf import settings
+from rest_framework import serializers
+
+CURSOR_KINDS = ('payment', 'payment_link')
+
+
+def encode_cursor(positions):
+    """
+    {'payment': (updated_at, id), 'payment_link': (updated_at, id)} -> opaque string
+    """
+    payload = {kind: [updated_at.isoformat(), pk] for kind, (updated_at, pk) in positions.items()}
+    return base64.urlsafe_b64encode(json.dumps(payload, separators=(',', ':')).encode()).decode()
+
+
+def decode_cursor(cursor):
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return {
+            kind: (datetime.fromisoformat(payload[kind][0]), int(payload[kind][1]))
+            for kind in CURSOR_KINDS if kind in payload
+        }
+    except (ValueError, TypeError, KeyError, IndexError):
+        raise serializers.ValidationError("Invalid cursor")
+
+
+class ChangesQueryParamsSerializer(serializers.Serializer):
+    cursor = serializers.CharField(required=False)
+    limit = serializers.IntegerField(min_value=1, default=1000)
+    # Stream newline-delimited JSON instead of building one JSON document
+    stream = serializers.BooleanField(default=False)
+
+    def validate_cursor(self, value):
+        return decode_cursor(value)
+
+    def validate_limit(self, value):
+        if value > settings.CHANGES_FEED_MAX_LIMIT:
+            raise serializers.ValidationError(
+                f"Ensure this value is less than or equal to {settings.CHANGES_FEED_MAX_LIMIT}."
+            )
+        return value
@@ -1,10 +1,30 @@
 from datetime import datetime
+from payments.currency import SUPPORTED_CURRENCIES, from_minor_units, to_minor_units
 from payments.models import PaymentLink
 from rest_framework import serializers
 
 
+class MinorUnitAmountField(serializers.Field):
+    """
+    Read-only decimal string for an integer minor-unit column, using the
+    object's currency exponent (e.g. "12.34" USD, "1200" JPY)
+    """
+
+    def __init__(self, minor_field='amount_minor', **kwargs):
+        self.minor_field = minor_field
+        kwargs['source'] = '*'
+        kwargs['read_only'] = True
+        super().__init__(**kwargs)
+
+    def to_representation(self, obj):
+        amount = from_minor_units(getattr(obj, self.minor_field), obj.currency)
+        return None if amount is None else str(amount)
+
+
 class PaymentLinkSerializer(serializers.ModelSerializer):
     payment_url = serializers.SerializerMethodField()
+    amount = MinorUnitAmountField()
+    collected_amount = MinorUnitAmountField('collected_amount_minor')
     # Dynamic status field
     status = serializers.CharField(read_only=True)
 
@@ -21,14 +41,43 @@ class PaymentLinkSerializer(serializers.ModelSerializer):
             'updated_at',
             'expiration_date',
             'payment_url',
+            'success_count',
+            'failed_count',
+            'collected_amount',
+            'last_payment_at',
         ]
-        read_only_fields = ['unique_id', 'status', 'payment_url','status']
+        read_only_fields = ['unique_id', 'status', 'payment_url','status', 'success_count', 'failed_count', 'last_payment_at']
+
+    URL_PLACEHOLDER = '__unique_id__'
+
+    # Model columns each field reads, for loading only what a sparse fieldset needs
+    SOURCE_COLUMNS = {
+        'amount': ('amount_minor', 'currency'),
+        'collected_amount': ('collected_amount_minor', 'currency'),
+        'payment_url': ('unique_id',),
+    }
+
+    def __init__(self, *args, fields=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        if fields is not None:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
+
+    @classmethod
+    def columns_for(cls, fields):
+        return list(dict.fromkeys(
+            column for name in fields for column in cls.SOURCE_COLUMNS.get(name, (name,))
+        ))
 
     def get_payment_url(self, obj):
-        request = self.context.get('request')
-        if request is not None:
-            return request.build_absolute_uri(obj.get_absolute_url())
-        return obj.get_absolute_url()
+        # Resolve the URL once per serializer, not once per row of a list
+        if not hasattr(self, '_payment_url_template'):
+            template = PaymentLink(unique_id=self.URL_PLACEHOLDER).get_absolute_url()
+            request = self.context.get('request')
+            if request is not None:
+                template = request.build_absolute_uri(template)
+            self._payment_url_template = template
+        return self._payment_url_template.replace(self.URL_PLACEHOLDER, obj.unique_id)
 
 
 class PaymentLinkCreateSerializer(serializers.Serializer):
@@ -37,9 +86,8 @@ class PaymentLinkCreateSerializer(serializers.Serializer):
     description = serializers.CharField(max_length=255)
     expiration_date = serializers.DateField(required=False, allow_null=True)
     def validate_currency(self, value):
-        valid_currencies = ['USD', 'EUR', 'GBP', 'INR', 'AUD', 'CAD', 'CHF', 'JPY', 'NZD', 'SGD']  # Add more as needed
-        if value.upper() not in valid_currencies:
-            raise serializers.ValidationError(f"Currency must be one of {valid_currencies}")
+        if value.upper() not in SUPPORTED_CURRENCIES:
+            raise serializers.ValidationError(f"Currency must be one of {SUPPORTED_CURRENCIES}")
         return value.upper()
 
     def validate_amount(self, value):
@@ -51,3 +99,11 @@ class PaymentLinkCreateSerializer(serializers.Serializer):
         if value and value < datetime.now().date():
             raise serializers.ValidationError("Expiration date cannot be in the past")
         return value
+
+    def validate(self, data):
+        try:
+            data['amount_minor'] = to_minor_units(data['amount'], data['currency'])
+        except ValueError as e:
+            raise serializers.ValidationError({'amount': str(e)})
+        return data
+
@@ -0,0 +1,19 @@
+from django.conf import settings
+from rest_framework import serializers
+
+SEARCH_TYPES = ('payment_link', 'payment')
+
+
+class SearchQueryParamsSerializer(serializers.Serializer):
+    # Trigram indexes can't narrow down anything shorter
+    q = serializers.CharField(min_length=3, max_length=100)
+    type = serializers.ChoiceField(choices=('all',) + SEARCH_TYPES, default='all')
+    page = serializers.IntegerField(min_value=1, default=1)
+    page_size = serializers.IntegerField(min_value=1, max_value=100, default=20)
+
+    def validate(self, data):
+        if data['page'] * data['page_size'] > settings.SEARCH_MAX_RESULTS:
+            raise serializers.ValidationError({
+                'page': f"Only the first {settings.SEARCH_MAX_RESULTS} results can be paged through, refine the query."
+            })
+        return data
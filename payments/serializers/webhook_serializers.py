@@ -0,0 +1,43 @@
+from urllib.parse import urlsplit
+
+from django.conf import settings
+from rest_framework import serializers
+
+from payments.merchant_webhooks import is_allowed_destination
+from payments.models import WebhookDelivery, WebhookEndpoint
+
+
+class WebhookEndpointSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = WebhookEndpoint
+        fields = ['id', 'url', 'description', 'is_active', 'created_at']
+        read_only_fields = ['id', 'created_at']
+
+    def validate_url(self, value):
+        if urlsplit(value).scheme != 'https' and not settings.WEBHOOK_ALLOW_PRIVATE_NETWORKS:
+            raise serializers.ValidationError("Webhook endpoints must use https.")
+        if not is_allowed_destination(value):
+            raise serializers.ValidationError("Webhook endpoints must be publicly reachable.")
+        return value
+
+
+class WebhookEndpointCreateSerializer(WebhookEndpointSerializer):
+    # Only returned when the endpoint is created
+    secret = serializers.CharField(read_only=True)
+
+    class Meta(WebhookEndpointSerializer.Meta):
+        fields = WebhookEndpointSerializer.Meta.fields + ['secret']
+
+
+class WebhookDeliverySerializer(serializers.ModelSerializer):
+    class Meta:
+        model = WebhookDelivery
+        fields = [
+            'id', 'event_id', 'event_type', 'status', 'attempts', 'next_attempt_at',
+            'last_status_code', 'last_error', 'created_at', 'delivered_at', 'payload',
+        ]
+
+
+class WebhookDeliveryListQueryParamsSerializer(serializers.Serializer):
+    status = serializers.ChoiceField(choices=[choice for choice, _ in WebhookDelivery.STATUS_CHOICES], required=False)
+    limit = serializers.IntegerField(min_value=1, max_value=100, default=50)
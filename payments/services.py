@@ -0,0 +1,125 @@
+import logging
+
+from django.db import IntegrityError, transaction
+from django.db.models import Case, F, Value, When
+from django.db.models.functions import Greatest
+
+from payments.models import Payment, PaymentLink
+from payments.merchant_webhooks import enqueue_payment_webhooks
+from payments.notifications import enqueue_payment_notifications
+
+logger = logging.getLogger(__name__)
+
+# A succeeded PaymentIntent never fails or goes back to pending, but Stripe may
+# deliver an older event after the success event
+FINAL_STATUSES = {'success'}
+
+# Describe the attempt an event reports, so they are only taken from events whose status is applied
+ATTEMPT_FIELDS = {'payment_method', 'card_brand', 'card_last4', 'failure_code', 'decline_code'}
+ATTEMPT_METADATA = {'error'}
+
+
+def upsert_payment(stripe_payment_id, payment_link_unique_id=None, status=None, fields=None, metadata=None):
+    """
+    Create or update the Payment for a Stripe PaymentIntent in one short transaction.
+
+    The existing row is locked with SELECT ... FOR UPDATE and changed in place,
+    with its PaymentLink's id, user_id and unique_id loaded alongside. The
+    PaymentLink is only looked up (by unique_id) when a new row has to be
+    inserted. If `payment_link_unique_id` is None the call only updates and returns
+    (None, None) when the payment doesn't exist yet. The link's payment counters
+    are updated, and notifications and merchant webhooks for the change are
+    queued, in the same transaction. A status change away from a final status
+    is refused, and the event's card and failure details are ignored with it.
+
+    Returns (payment, previous_status); previous_status is None for new rows.
+    """
+    fields = fields or {}
+    metadata = metadata or {}
+
+    # Lock only the payment row; the link is joined so callers can read it without another query
+    locked = Payment.objects.select_for_update(of=('self',)).select_related('payment_link')
+    with transaction.atomic():
+        payment = locked.filter(stripe_payment_id=stripe_payment_id).first()
+
+        if payment is None:
+            if payment_link_unique_id is None:
+                return None, None
+            payment = _create_payment(stripe_payment_id, payment_link_unique_id, status, fields, metadata)
+            if payment is not None:
+                update_link_counters(payment, None)
+                enqueue_payment_notifications(payment, None)
+                enqueue_payment_webhooks(payment, None)
+                return payment, None
+            # Lost an insert race with a concurrent delivery of another event
+            payment = locked.get(stripe_payment_id=stripe_payment_id)
+
+        previous_status = payment.status
+        if status is not None and previous_status not in FINAL_STATUSES:
+            payment.status = status
+        elif status is not None and status != previous_status:
+            # A stale event for an earlier attempt; keep the final attempt's details
+            fields = {field: value for field, value in fields.items() if field not in ATTEMPT_FIELDS}
+            metadata = {key: value for key, value in metadata.items() if key not in ATTEMPT_METADATA}
+        for field, value in fields.items():
+            setattr(payment, field, value)
+        payment.metadata = {**(payment.metadata or {}), **metadata}
+        payment.save()
+        update_link_counters(payment, previous_status)
+        enqueue_payment_notifications(payment, previous_status)
+        enqueue_payment_webhooks(payment, previous_status)
+
+    return payment, previous_status
+
+
+def update_link_counters(payment, previous_status):
+    """
+    Move the payment between its link's success/failed counters when its status
+    changes, with one UPDATE of F() expressions so concurrent webhooks for other
+    payments of the link don't overwrite each other
+    """
+    if payment.status == previous_status:
+        return
+
+    changes = {}
+    for status, sign in ((previous_status, -1), (payment.status, 1)):
+        if status == 'success':
+            changes['success_count'] = _counter_change('success_count', sign)
+            changes['collected_amount_minor'] = _counter_change('collected_amount_minor', sign * (payment.amount_minor or 0))
+        elif status == 'failed':
+            changes['failed_count'] = _counter_change('failed_count', sign)
+    if payment.status == 'success':
+        # Webhooks can arrive out of order; keep the newest successful payment's time
+        changes['last_payment_at'] = Case(
+            When(last_payment_at__gt=payment.created_at, then=F('last_payment_at')),
+            default=Value(payment.created_at),
+        )
+    if changes:
+        PaymentLink.objects.filter(id=payment.payment_link_id).update(**changes)
+
+
+def _counter_change(field, delta):
+    if delta >= 0:
+        return F(field) + delta
+    # A counter that drifted low must never fail the webhook; reconcile puts it right
+    return Greatest(F(field) + delta, 0)
+
+
+def _create_payment(stripe_payment_id, payment_link_unique_id, status, fields, metadata):
+    try:
+        payment_link = PaymentLink.objects.only('id', 'user_id', 'unique_id').get(unique_id=payment_link_unique_id)
+    except PaymentLink.DoesNotExist:
+        logger.error(f"Payment link not found: {payment_link_unique_id}")
+        raise
+
+    try:
+        with transaction.atomic():
+            return Payment.objects.create(
+                payment_link=payment_link,
+                stripe_payment_id=stripe_payment_id,
+                status=status or 'pending',
+                metadata=metadata,
+                **fields
+            )
+    except IntegrityError:
+        return None
@@ -0,0 +1,102 @@
+from datetime import datetime, timedelta
+from decimal import Decimal
+from unittest.mock import patch, MagicMock
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase, Client
+from django.urls import reverse
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from payments.currency import from_minor_units, to_minor_units
+from payments.models import Payment, PaymentLink
+
+User = get_user_model()
+
+
+class CurrencyConversionTest(TestCase):
+    def test_two_decimal_currency(self):
+        self.assertEqual(to_minor_units(Decimal('12.34'), 'USD'), 1234)
+        self.assertEqual(from_minor_units(1234, 'usd'), Decimal('12.34'))
+
+    def test_zero_decimal_currency(self):
+        self.assertEqual(to_minor_units(Decimal('1200'), 'JPY'), 1200)
+        self.assertEqual(from_minor_units(1200, 'JPY'), Decimal('1200'))
+
+    def test_rejects_excess_precision(self):
+        with self.assertRaises(ValueError):
+            to_minor_units(Decimal('10.5'), 'JPY')
+        with self.assertRaises(ValueError):
+            to_minor_units(Decimal('10.001'), 'USD')
+
+
+class MinorUnitAmountsTest(TestCase):
+    def setUp(self):
+        self.client = Client()
+        self.user = User.objects.create_user(username='testuser', password='testpass123')
+        self.auth_header = f'Bearer {RefreshToken.for_user(self.user).access_token}'
+        self.expiration_date = (datetime.now() + timedelta(days=7)).date()
+
+    def create_link(self, amount, currency):
+        return self.client.post(
+            reverse('create-payment-link'),
+            data={
+                'amount': amount,
+                'currency': currency,
+                'description': 'Test payment',
+                'expiration_date': self.expiration_date.isoformat(),
+            },
+            content_type='application/json',
+            HTTP_AUTHORIZATION=self.auth_header,
+        )
+
+    def test_create_link_stores_minor_units(self):
+        response = self.create_link('19.99', 'USD')
+        self.assertEqual(response.status_code, 200)
+        link = PaymentLink.objects.get(unique_id=response.json()['payment_id'])
+        self.assertEqual(link.amount_minor, 1999)
+        self.assertEqual(link.amount, Decimal('19.99'))
+
+    def test_create_jpy_link(self):
+        response = self.create_link('1500', 'jpy')
+        self.assertEqual(response.status_code, 200)
+        link = PaymentLink.objects.get(unique_id=response.json()['payment_id'])
+        self.assertEqual((link.amount_minor, link.currency), (1500, 'JPY'))
+
+    def test_rejects_fractional_jpy(self):
+        response = self.create_link('1500.50', 'JPY')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('amount', response.json()['errors'])
+
+    @patch('payments.gateway.StripeGateway.create_payment_intent')
+    def test_payment_intent_uses_minor_units(self, mock_create):
+        mock_create.return_value = MagicMock(client_secret='secret')
+        link = PaymentLink.objects.create(
+            user=self.user, currency='JPY', amount_minor=1500, expiration_date=self.expiration_date
+        )
+        response = self.client.post(reverse('create-payment-intent', args=[link.unique_id]))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(mock_create.call_args.kwargs['amount'], 1500)
+
+    def test_analytics_present_decimal_amounts(self):
+        for index, (currency, minor) in enumerate([('USD', 1050), ('JPY', 1200), ('USD', 99)]):
+            link = PaymentLink.objects.create(user=self.user, currency=currency, amount_minor=minor)
+            Payment.objects.create(
+                payment_link=link,
+                stripe_payment_id=f'pi_{index}',
+                amount_minor=minor,
+                currency=currency,
+                status='success',
+                payment_method='card',
+            )
+
+        response = self.client.get(
+            reverse('payment-analytics'), {'start_amount': '10.00'}, HTTP_AUTHORIZATION=self.auth_header
+        )
+        self.assertEqual(sorted(row['amount'] for row in response.json()), [10.5, 1200])
+
+        response = self.client.get(reverse('currency-summary'), HTTP_AUTHORIZATION=self.auth_header)
+        totals = {row['currency']: row['total_amount'] for row in response.json()}
+        self.assertEqual(totals, {'JPY': 1200.0, 'USD': 11.49})
+
+        response = self.client.get(reverse('list-payment-links'), HTTP_AUTHORIZATION=self.auth_header)
+        self.assertEqual(sorted(row['amount'] for row in response.json()), ['0.99', '10.50', '1200'])
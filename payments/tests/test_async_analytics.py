@@ -0,0 +1,78 @@
+from datetime import datetime, timedelta
+from unittest.mock import patch
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import TestCase, AsyncClient, Client
+from django.urls import reverse
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from payments.models import Payment, PaymentLink
+
+User = get_user_model()
+
+
+class AsyncAnalyticsViewsTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='testuser', password='testpass123')
+        self.auth_header = f'Bearer {RefreshToken.for_user(self.user).access_token}'
+        self.payment_link = PaymentLink.objects.create(
+            user=self.user,
+            amount='25.00',
+            currency='USD',
+            description='Test link',
+            expiration_date=(datetime.now() + timedelta(days=7)).date(),
+        )
+        for index, status in enumerate(['success', 'success', 'failed']):
+            Payment.objects.create(
+                payment_link=self.payment_link,
+                stripe_payment_id=f'pi_{index}',
+                amount='25.00',
+                currency='USD',
+                status=status,
+                payment_method='card',
+            )
+
+    def assert_matches_sync(self, sync_name, async_name):
+        sync_response = Client().get(reverse(sync_name), HTTP_AUTHORIZATION=self.auth_header)
+        async_response = Client().get(reverse(async_name), HTTP_AUTHORIZATION=self.auth_header)
+        self.assertEqual(async_response.status_code, 200)
+        self.assertEqual(async_response.json(), sync_response.json())
+
+    def test_payment_analytics_matches_sync(self):
+        self.assert_matches_sync('payment-analytics', 'payment-analytics-async')
+
+    def test_payment_methods_summary_matches_sync(self):
+        self.assert_matches_sync('payment-methods-summary', 'payment-methods-summary-async')
+
+    def test_currency_summary_matches_sync(self):
+        self.assert_matches_sync('currency-summary', 'currency-summary-async')
+
+    def test_payment_link_list_matches_sync(self):
+        self.assert_matches_sync('list-payment-links', 'list-payment-links-async')
+
+    async def test_async_client_filters(self):
+        response = await AsyncClient().get(
+            reverse('payment-analytics-async'),
+            {'currency': 'EUR'},
+            headers={'Authorization': self.auth_header},
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), [])
+
+    def test_unauthenticated(self):
+        response = Client().get(reverse('payment-analytics-async'))
+        self.assertEqual(response.status_code, 401)
+        self.assertTrue(response.has_header('WWW-Authenticate'))
+
+    def test_invalid_token(self):
+        response = Client().get(reverse('payment-analytics-async'), HTTP_AUTHORIZATION='Bearer nope')
+        self.assertEqual(response.status_code, 401)
+
+    def test_throttled(self):
+        with patch('dealflow.throttlers.AnalyticsUserThrottle.rate', '1/hour'):
+            Client().get(reverse('currency-summary-async'), HTTP_AUTHORIZATION=self.auth_header)
+            response = Client().get(reverse('currency-summary-async'), HTTP_AUTHORIZATION=self.auth_header)
+        self.assertEqual(response.status_code, 429)
+        self.assertTrue(response.has_header('Retry-After'))
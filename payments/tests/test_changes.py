@@ -0,0 +1,107 @@
+import json
+from datetime import timedelta
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase, AsyncClient, Client, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from payments.models import Payment, PaymentLink
+
+User = get_user_model()
+
+
+@override_settings(CHANGES_FEED_LAG=0)
+class ChangesFeedTest(TestCase):
+    def setUp(self):
+        self.client = Client()
+        self.user = User.objects.create_user(username='testuser', password='testpass123')
+        self.auth_header = f'Bearer {RefreshToken.for_user(self.user).access_token}'
+        self.payment_link = PaymentLink.objects.create(user=self.user, amount_minor=1000, currency='USD')
+        self.payments = [self.create_payment(f'pi_{index}') for index in range(3)]
+
+    def create_payment(self, stripe_payment_id):
+        return Payment.objects.create(
+            payment_link=self.payment_link,
+            stripe_payment_id=stripe_payment_id,
+            amount_minor=1000,
+            currency='USD',
+            status='pending',
+            payment_method='card',
+        )
+
+    def get_changes(self, **params):
+        return self.client.get(reverse('changes-feed'), params, HTTP_AUTHORIZATION=self.auth_header)
+
+    def test_pages_through_all_changes_in_order(self):
+        first = self.get_changes(limit=3).json()
+        self.assertEqual(
+            [(change['type'], change.get('stripe_payment_id')) for change in first['results']],
+            [('payment_link', None), ('payment', 'pi_0'), ('payment', 'pi_1')],
+        )
+        self.assertTrue(first['has_more'])
+
+        second = self.get_changes(limit=3, cursor=first['next_cursor']).json()
+        self.assertEqual([change['stripe_payment_id'] for change in second['results']], ['pi_2'])
+        self.assertFalse(second['has_more'])
+
+        empty = self.get_changes(cursor=second['next_cursor']).json()
+        self.assertEqual(empty['results'], [])
+        self.assertEqual(empty['next_cursor'], second['next_cursor'])
+
+    def test_updated_rows_reappear_after_cursor(self):
+        cursor = self.get_changes().json()['next_cursor']
+
+        payment = self.payments[0]
+        payment.status = 'success'
+        payment.save()
+
+        results = self.get_changes(cursor=cursor).json()['results']
+        self.assertEqual(len(results), 1)
+        self.assertEqual(results[0]['stripe_payment_id'], 'pi_0')
+        self.assertEqual(results[0]['status'], 'success')
+        self.assertEqual(results[0]['amount'], 10.0)
+        self.assertEqual(results[0]['payment_link'], self.payment_link.unique_id)
+
+    async def test_streams_ndjson(self):
+        response = await AsyncClient().get(
+            reverse('changes-feed'), {'stream': 'true', 'limit': 3}, headers={'Authorization': self.auth_header}
+        )
+
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        # Sent as it is read, one change per chunk
+        chunks = [chunk async for chunk in response.streaming_content]
+        lines = [json.loads(chunk) for chunk in chunks]
+        self.assertEqual(len(lines), 4)
+        self.assertEqual(
+            [(change['type'], change.get('stripe_payment_id')) for change in lines[:-1]],
+            [('payment_link', None), ('payment', 'pi_0'), ('payment', 'pi_1')],
+        )
+        self.assertTrue(lines[-1]['has_more'])
+
+        response = await AsyncClient().get(
+            reverse('changes-feed'), {'stream': 'true', 'cursor': lines[-1]['next_cursor']},
+            headers={'Authorization': self.auth_header},
+        )
+        lines = [json.loads(chunk) async for chunk in response.streaming_content]
+        self.assertEqual([change.get('stripe_payment_id') for change in lines[:-1]], ['pi_2'])
+        self.assertFalse(lines[-1]['has_more'])
+
+    @override_settings(CHANGES_FEED_LAG=60)
+    def test_recent_changes_held_back(self):
+        Payment.objects.filter(pk=self.payments[0].pk).update(updated_at=timezone.now() - timedelta(minutes=5))
+
+        results = self.get_changes().json()['results']
+        self.assertEqual([change['stripe_payment_id'] for change in results], ['pi_0'])
+
+    def test_other_users_rows_excluded(self):
+        other = User.objects.create_user(username='other', password='testpass123')
+        PaymentLink.objects.create(user=other, amount_minor=500, currency='USD')
+
+        self.assertEqual(len(self.get_changes().json()['results']), 4)
+
+    def test_invalid_cursor(self):
+        response = self.get_changes(cursor='not-a-cursor')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('cursor', response.json())
@@ -0,0 +1,160 @@
+from datetime import date, datetime, timedelta, timezone as dt_timezone
+from decimal import Decimal
+from unittest import mock, skipUnless
+
+from django.contrib.auth import get_user_model
+from django.db import DatabaseError
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from rest_framework.test import APIClient
+
+from payments.models import Payment, PaymentLink
+from payments.services import upsert_payment
+from payments.views import analytics_views
+
+try:
+    import numpy
+    from payments.columnar import ColumnarCache, MerchantColumns, columnar_cache
+except ImportError:
+    numpy = None
+
+User = get_user_model()
+
+FILTERS = [
+    {},
+    {'currency': 'USD'},
+    {'currency': 'XYZ'},
+    {'payment_method': 'card'},
+    {'start_date': date(2026, 3, 2), 'end_date': date(2026, 3, 4)},
+    {'start_amount': Decimal('10'), 'end_amount': Decimal('25.50')},
+    {'start_amount': Decimal('1000')},
+    {'end_amount': Decimal('20'), 'currency': 'JPY'},
+    {'start_amount': Decimal('0'), 'end_amount': Decimal('0')},
+    {'fields': ('id', 'amount'), 'payment_method': 'amazon_pay', 'start_date': date(2026, 3, 3)},
+]
+
+
+@skipUnless(numpy, "NumPy is not installed")
+class ColumnarCacheTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='merchant', password='testpass123')
+        self.other = User.objects.create_user(username='other', password='testpass123')
+        self.links = [PaymentLink.objects.create(user=self.user, amount_minor=1000, currency='USD') for _ in range(2)]
+        Payment.objects.create(
+            payment_link=PaymentLink.objects.create(user=self.other, amount_minor=1000, currency='USD'),
+            stripe_payment_id='pi_other', amount_minor=2000, currency='USD', status='success',
+        )
+        currencies = ['USD', 'EUR', 'JPY']
+        methods = ['card', 'amazon_pay', 'card', 'link']
+        statuses = ['success', 'failed', 'pending', 'success', 'success']
+        for index in range(30):
+            currency = currencies[index % 3]
+            payment = Payment.objects.create(
+                payment_link=self.links[index % 2],
+                stripe_payment_id=f'pi_{index}',
+                amount_minor=(index * 337) % 5000 if currency != 'JPY' else index * 3,
+                currency=currency,
+                status=statuses[index % 5],
+                payment_method=methods[index % 4],
+            )
+            # Spread over a few days, with some at exactly midnight
+            created_at = datetime(2026, 3, 1, tzinfo=dt_timezone.utc) + timedelta(hours=index * 5 if index % 7 else index * 24)
+            Payment.objects.filter(pk=payment.pk).update(created_at=created_at)
+
+        columnar_cache.clear()
+        self.addCleanup(columnar_cache.clear)
+
+    def sql_and_columnar(self, compute):
+        sql = compute()
+        with override_settings(COLUMNAR_CACHE_USER_IDS=[self.user.pk]):
+            columnar = compute()
+        return sql, columnar
+
+    def test_matches_sql(self):
+        for params in FILTERS:
+            with self.subTest(params=params):
+                sql, columnar = self.sql_and_columnar(lambda: analytics_views.payment_analytics_data(self.user, params))
+                self.assertEqual(sorted(columnar, key=repr), sorted(sql, key=repr))
+                # Newest first, like the queryset
+                if 'created_at' in (params.get('fields') or analytics_views.ANALYTICS_FIELDS):
+                    self.assertEqual([row['created_at'] for row in columnar], [row['created_at'] for row in sql])
+
+        self.assertEqual(*self.sql_and_columnar(lambda: analytics_views.payment_methods_data(self.user)))
+        self.assertEqual(*self.sql_and_columnar(lambda: analytics_views.currency_totals_data(self.user)))
+        self.assertEqual(columnar_cache.stats()['merchants'][self.user.pk]['payments'], 30)
+
+    def test_refreshes_at_most_once_per_interval(self):
+        cache = ColumnarCache()
+        cache.query(self.user.pk, 'currency_total_rows')
+
+        with self.assertNumQueries(0):
+            cache.query(self.user.pk, 'payment_method_rows')
+
+    def test_failed_load_is_not_served(self):
+        apply = MerchantColumns.apply
+
+        def fail_midway(columns, chunk):
+            apply(columns, chunk[:10])
+            raise DatabaseError("connection lost")
+
+        with override_settings(COLUMNAR_CACHE_USER_IDS=[self.user.pk]):
+            with mock.patch.object(MerchantColumns, 'apply', fail_midway):
+                with self.assertRaises(DatabaseError):
+                    analytics_views.currency_totals_data(self.user)
+            self.assertEqual(columnar_cache.stats()['merchants'][self.user.pk]['payments'], 0)
+
+            # Loaded again from scratch within the refresh interval, not answered from the first ten rows
+            columnar = analytics_views.currency_totals_data(self.user)
+        self.assertEqual(columnar, analytics_views.currency_totals_data(self.user))
+        self.assertEqual(columnar_cache.stats()['merchants'][self.user.pk]['payments'], 30)
+
+    @override_settings(COLUMNAR_CACHE_REFRESH_INTERVAL=0)
+    def test_picks_up_writes(self):
+        with override_settings(COLUMNAR_CACHE_USER_IDS=[self.user.pk]):
+            before = analytics_views.currency_totals_data(self.user)
+
+            # An update in place, then a new row
+            upsert_payment('pi_2', status='failed')
+            upsert_payment(
+                'pi_new',
+                payment_link_unique_id=self.links[0].unique_id,
+                status='success',
+                fields={'amount_minor': 999, 'currency': 'GBP', 'payment_method': 'card'},
+            )
+            columnar = analytics_views.currency_totals_data(self.user)
+            methods = analytics_views.payment_methods_data(self.user)
+            rows = analytics_views.payment_analytics_data(self.user, {'currency': 'GBP'})
+
+        self.assertNotEqual(before, columnar)
+        self.assertEqual(columnar, analytics_views.currency_totals_data(self.user))
+        self.assertEqual(methods, analytics_views.payment_methods_data(self.user))
+        self.assertEqual([(row['amount'], row['status']) for row in rows], [(Decimal('9.99'), 'success')])
+        self.assertEqual(columnar_cache.stats()['loads'], 1)
+
+    def test_evicts_least_recently_used(self):
+        # Each merchant's columns start with room for 1024 rows, 35 bytes each
+        cache = ColumnarCache(max_bytes=50000)
+
+        cache.query(self.user.pk, 'currency_total_rows')
+        cache.query(self.other.pk, 'currency_total_rows')
+        self.assertEqual(list(cache.stats()['merchants']), [self.other.pk])
+        self.assertEqual(cache.stats()['evictions'], 1)
+
+        # Answered once while loading, then left to SQL
+        small = ColumnarCache(max_bytes=100)
+        self.assertTrue(small.query(self.user.pk, 'currency_total_rows'))
+        self.assertIsNone(small.query(self.user.pk, 'currency_total_rows'))
+        self.assertEqual(small.stats()['merchants'], {})
+        self.assertEqual(small.stats()['too_large'], [self.user.pk])
+
+    def test_endpoints(self):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        url = reverse('payment-analytics')
+        params = {'currency': 'EUR', 'start_amount': '5', 'fields': 'id,amount,created_at'}
+
+        sql = client.get(url, params).json()
+        with override_settings(COLUMNAR_CACHE_USER_IDS=[self.user.pk]):
+            columnar = client.get(url, params).json()
+
+        self.assertEqual(columnar, sql)
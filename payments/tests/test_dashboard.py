@@ -0,0 +1,117 @@
+from datetime import date, datetime, timedelta, timezone
+from unittest import skipUnless
+
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import TestCase, Client
+from django.urls import reverse
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from payments.models import Payment, PaymentLink
+from payments.views.dashboard_views import dashboard_rows, dashboard_window, grouping_sets_rows, union_rows
+
+User = get_user_model()
+
+
+class MerchantDashboardTest(TestCase):
+    def setUp(self):
+        self.client = Client()
+        self.user = User.objects.create_user(username='testuser', password='testpass123')
+        self.auth_header = f'Bearer {RefreshToken.for_user(self.user).access_token}'
+        self.usd_link = PaymentLink.objects.create(user=self.user, amount_minor=1000, currency='USD')
+        self.jpy_link = PaymentLink.objects.create(user=self.user, amount_minor=500, currency='JPY')
+        self.end_date = date(2026, 3, 31)
+
+        # Current period: March 2-31, previous period: January 31 - March 1
+        self.create_payment(self.usd_link, 'pi_1', date(2026, 3, 5), 'success', 'card')
+        self.create_payment(self.usd_link, 'pi_2', date(2026, 3, 20), 'success', 'amazon_pay')
+        self.create_payment(self.usd_link, 'pi_3', date(2026, 3, 21), 'failed', 'card')
+        self.create_payment(self.jpy_link, 'pi_4', date(2026, 3, 31), 'success', 'card')
+        self.create_payment(self.usd_link, 'pi_5', date(2026, 2, 10), 'success', 'card')
+        # Outside both periods
+        self.create_payment(self.usd_link, 'pi_6', date(2026, 1, 1), 'success', 'card')
+
+    def create_payment(self, link, stripe_payment_id, created, status, payment_method):
+        payment = Payment.objects.create(
+            payment_link=link,
+            stripe_payment_id=stripe_payment_id,
+            amount_minor=link.amount_minor,
+            currency=link.currency,
+            status=status,
+            payment_method=payment_method,
+        )
+        created_at = datetime.combine(created, datetime.min.time(), tzinfo=timezone.utc) + timedelta(hours=12)
+        Payment.objects.filter(pk=payment.pk).update(created_at=created_at)
+
+    def get_dashboard(self, **params):
+        return self.client.get(
+            reverse('merchant-dashboard'),
+            {'end_date': self.end_date.isoformat(), 'days': 30, **params},
+            HTTP_AUTHORIZATION=self.auth_header,
+        )
+
+    def test_single_query(self):
+        window = dashboard_window({'end_date': self.end_date, 'days': 30})
+        with self.assertNumQueries(1):
+            dashboard_rows(self.user, window)
+
+    def test_totals_with_deltas(self):
+        response = self.get_dashboard()
+
+        self.assertEqual(response.status_code, 200)
+        totals = response.json()['totals']
+        self.assertEqual(totals['count'], 4)
+        self.assertEqual(totals['success_count'], 3)
+        self.assertEqual(totals['failed_count'], 1)
+        self.assertEqual(totals['success_rate'], 0.75)
+        self.assertEqual(totals['previous']['count'], 1)
+        self.assertEqual(totals['count_change'], 3.0)
+
+    def test_currencies_use_their_own_exponent(self):
+        currencies = {row['currency']: row for row in self.get_dashboard().json()['currencies']}
+
+        self.assertEqual(currencies['USD']['total_amount'], 20.0)
+        self.assertEqual(currencies['USD']['previous_total_amount'], 10.0)
+        self.assertEqual(currencies['USD']['total_amount_change'], 1.0)
+        self.assertEqual(currencies['JPY']['total_amount'], 500)
+        self.assertIsNone(currencies['JPY']['total_amount_change'])
+
+    def test_payment_methods_and_links(self):
+        data = self.get_dashboard().json()
+
+        methods = {row['payment_method']: row for row in data['payment_methods']}
+        self.assertEqual(methods['card']['count'], 3)
+        self.assertEqual(methods['card']['failed_count'], 1)
+        self.assertEqual(methods['card']['previous_count'], 1)
+        self.assertEqual(methods['amazon_pay']['count'], 1)
+
+        self.assertEqual(data['payment_links'][0]['unique_id'], self.usd_link.unique_id)
+        self.assertEqual(data['payment_links'][0]['success_count'], 2)
+        self.assertEqual(data['payment_links'][0]['previous_success_count'], 1)
+
+    def test_other_users_payments_excluded(self):
+        other = User.objects.create_user(username='other', password='testpass123')
+        other_link = PaymentLink.objects.create(user=other, amount_minor=1000, currency='USD')
+        self.create_payment(other_link, 'pi_other', date(2026, 3, 10), 'success', 'card')
+
+        self.assertEqual(self.get_dashboard().json()['totals']['count'], 4)
+
+    @skipUnless(connection.vendor == 'postgresql', "GROUPING SETS statement is only run on PostgreSQL")
+    def test_grouping_sets_match_union(self):
+        other = User.objects.create_user(username='other', password='testpass123')
+        other_link = PaymentLink.objects.create(user=other, amount_minor=1000, currency='USD')
+        self.create_payment(other_link, 'pi_other', date(2026, 3, 10), 'success', 'card')
+        self.create_payment(self.usd_link, 'pi_pending', date(2026, 3, 2), 'pending', 'link')
+
+        def group(row):
+            return [str(row[field]) for field in ('grouping', 'is_current', 'currency', 'method', 'link_id')]
+
+        for days in (1, 30, 90):
+            with self.subTest(days=days):
+                window = dashboard_window({'end_date': self.end_date, 'days': days})
+                grouping_sets = grouping_sets_rows(self.user, window)
+                self.assertTrue(grouping_sets)
+                self.assertEqual(sorted(grouping_sets, key=group), sorted(union_rows(self.user, window), key=group))
+
+    def test_invalid_days(self):
+        self.assertEqual(self.get_dashboard(days=0).status_code, 400)
@@ -0,0 +1,105 @@
+from datetime import datetime, timezone
+from unittest.mock import patch, MagicMock
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase, Client
+from django.urls import reverse
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from payments.models import Payment, PaymentLink
+
+User = get_user_model()
+
+
+class DisputeTest(TestCase):
+    def setUp(self):
+        self.client = Client()
+        self.user = User.objects.create_user(username='testuser', password='testpass123')
+        self.auth_header = f'Bearer {RefreshToken.for_user(self.user).access_token}'
+        self.payment_link = PaymentLink.objects.create(user=self.user, amount_minor=1000, currency='USD')
+        self.payments = [
+            Payment.objects.create(
+                payment_link=self.payment_link,
+                stripe_payment_id=f'pi_{index}',
+                amount_minor=1000,
+                currency='USD',
+                status='success',
+                payment_method='card',
+            )
+            for index in range(4)
+        ]
+
+        self.construct_event_patcher = patch('stripe.Webhook.construct_event')
+        self.mock_construct_event = self.construct_event_patcher.start()
+
+    def tearDown(self):
+        self.construct_event_patcher.stop()
+
+    def send_dispute_event(self, event_type, payment_intent, status='needs_response', amount=1000):
+        dispute = MagicMock()
+        dispute.id = 'dp_123'
+        dispute.payment_intent = payment_intent
+        dispute.amount = amount
+        dispute.reason = 'fraudulent'
+        dispute.status = status
+        dispute.created = int(datetime(2026, 3, 14, tzinfo=timezone.utc).timestamp())
+
+        mock_event = MagicMock()
+        mock_event.type = event_type
+        mock_event.data.object = dispute
+        self.mock_construct_event.return_value = mock_event
+
+        return self.client.post(
+            reverse('stripe-webhook'),
+            data={},
+            content_type='application/json',
+            HTTP_STRIPE_SIGNATURE='dummy_sig'
+        )
+
+    def test_dispute_created_marks_payment(self):
+        response = self.send_dispute_event('charge.dispute.created', 'pi_0', amount=750)
+
+        self.assertEqual(response.status_code, 200)
+        payment = Payment.objects.get(stripe_payment_id='pi_0')
+        self.assertTrue(payment.is_disputed)
+        self.assertEqual(payment.dispute_reason, 'fraudulent')
+        self.assertEqual(payment.dispute_status, 'needs_response')
+        self.assertEqual(payment.dispute_amount_minor, 750)
+        self.assertEqual(payment.dispute_created_at, datetime(2026, 3, 14, tzinfo=timezone.utc))
+        self.assertEqual(payment.status, 'success')
+
+    def test_dispute_closed_updates_status(self):
+        self.send_dispute_event('charge.dispute.created', 'pi_0')
+        self.send_dispute_event('charge.dispute.closed', 'pi_0', status='lost')
+        self.assertEqual(Payment.objects.get(stripe_payment_id='pi_0').dispute_status, 'lost')
+
+    def test_dispute_for_unknown_payment_is_ignored(self):
+        response = self.send_dispute_event('charge.dispute.created', 'pi_unknown')
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(Payment.objects.filter(stripe_payment_id='pi_unknown').exists())
+
+    def test_dispute_summary(self):
+        Payment.objects.filter(pk__in=[p.pk for p in self.payments]).update(
+            created_at=datetime(2026, 3, 2, tzinfo=timezone.utc)
+        )
+        self.send_dispute_event('charge.dispute.created', 'pi_0', amount=1000)
+        self.send_dispute_event('charge.dispute.closed', 'pi_0', status='won', amount=1000)
+
+        response = self.client.get(
+            reverse('dispute-summary'), {'period': 'month'}, HTTP_AUTHORIZATION=self.auth_header
+        )
+
+        self.assertEqual(response.status_code, 200)
+        [march] = response.json()
+        self.assertTrue(march['period'].startswith('2026-03-01'))
+        self.assertEqual(march['payment_count'], 4)
+        self.assertEqual(march['dispute_count'], 1)
+        self.assertEqual(march['won_count'], 1)
+        self.assertEqual(march['dispute_rate'], 0.25)
+        self.assertEqual(march['dispute_amounts'], {'USD': 10.0})
+
+    def test_dispute_summary_rejects_unknown_period(self):
+        response = self.client.get(
+            reverse('dispute-summary'), {'period': 'year'}, HTTP_AUTHORIZATION=self.auth_header
+        )
+        self.assertEqual(response.status_code, 400)
@@ -0,0 +1,53 @@
+import gzip
+import json
+import os
+import tempfile
+
+from django.test import TestCase, Client, override_settings
+from django.urls import reverse
+
+from dealflow.docs import precomputed_schema, write_schema
+
+
+class OpenAPISchemaTest(TestCase):
+    def setUp(self):
+        self.client = Client()
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.schema_path = os.path.join(self.tmpdir.name, 'openapi.json')
+        write_schema(json.dumps({'swagger': '2.0', 'paths': {}}).encode(), self.schema_path)
+        self.settings_override = override_settings(OPENAPI_SCHEMA_PATH=self.schema_path)
+        self.settings_override.enable()
+
+    def tearDown(self):
+        self.settings_override.disable()
+        self.tmpdir.cleanup()
+
+    def test_serves_precomputed_schema(self):
+        response = self.client.get(reverse('openapi-schema'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(response.content)['swagger'], '2.0')
+        self.assertTrue(response.has_header('ETag'))
+
+    def test_gzip_variant(self):
+        response = self.client.get(reverse('openapi-schema'), HTTP_ACCEPT_ENCODING='gzip, br')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(json.loads(gzip.decompress(response.content))['paths'], {})
+
+    def test_etag_revalidation(self):
+        etag = self.client.get(reverse('openapi-schema'))['ETag']
+        response = self.client.get(reverse('openapi-schema'), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+    def test_generates_schema_when_missing(self):
+        os.remove(self.schema_path)
+        precomputed_schema.content = None
+        precomputed_schema._mtime = None
+        response = self.client.get(reverse('openapi-schema'))
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('/api/analytics/', json.loads(response.content)['paths'])
+        self.assertTrue(os.path.exists(self.schema_path))
+
+    def test_swagger_ui_page(self):
+        response = self.client.get(reverse('schema-swagger-ui'))
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, reverse('openapi-schema'))
@@ -0,0 +1,115 @@
+import asyncio
+import threading
+from unittest.mock import patch, MagicMock
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import TestCase, AsyncClient, Client, override_settings
+from django.urls import reverse
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from payments.events import OVERFLOW, InProcessBroker, TooManySubscriptions, get_broker
+from payments.models import Payment, PaymentLink
+
+User = get_user_model()
+
+
+class InProcessBrokerTest(TestCase):
+    async def test_publish_from_another_thread(self):
+        broker = InProcessBroker()
+        subscription = broker.subscribe(1)
+        other_user = broker.subscribe(2)
+
+        thread = threading.Thread(target=broker.publish, args=(1, {'type': 'payment.status'}))
+        thread.start()
+        thread.join()
+
+        self.assertEqual(await asyncio.wait_for(subscription.get(), 1), {'type': 'payment.status'})
+        self.assertTrue(other_user._queue.empty())
+
+    @override_settings(EVENT_STREAM_QUEUE_SIZE=2)
+    async def test_slow_subscriber_overflows(self):
+        broker = InProcessBroker()
+        subscription = broker.subscribe(1)
+        for index in range(3):
+            broker.publish(1, {'index': index})
+        await asyncio.sleep(0)
+
+        self.assertIs(await subscription.get(), OVERFLOW)
+        self.assertTrue(subscription.overflowed)
+
+    @override_settings(EVENT_STREAM_MAX_CONNECTIONS_PER_USER=1)
+    async def test_connection_cap(self):
+        broker = InProcessBroker()
+        subscription = broker.subscribe(1)
+        with self.assertRaises(TooManySubscriptions):
+            broker.subscribe(1)
+
+        subscription.close()
+        broker.subscribe(1)
+
+
+class PaymentEventsViewTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='testuser', password='testpass123')
+        self.auth_header = f'Bearer {RefreshToken.for_user(self.user).access_token}'
+        self.payment_link = PaymentLink.objects.create(user=self.user, amount_minor=1000, currency='USD')
+
+    async def open_stream(self):
+        response = await AsyncClient().get(reverse('payment-events'), headers={'Authorization': self.auth_header})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        self.addCleanup(response.close)
+        content = aiter(response.streaming_content)
+        self.assertTrue((await anext(content)).startswith(b'retry:'))
+        return response, content
+
+    async def test_streams_published_events(self):
+        _, content = await self.open_stream()
+        get_broker().publish(self.user.pk, {'type': 'payment.status', 'status': 'success'})
+
+        chunk = await asyncio.wait_for(anext(content), 1)
+        self.assertEqual(chunk, b'event: payment.status\ndata: {"type": "payment.status", "status": "success"}\n\n')
+
+    @override_settings(EVENT_STREAM_MAX_CONNECTIONS_PER_USER=1)
+    async def test_rejects_connections_over_cap(self):
+        stream, _ = await self.open_stream()
+
+        response = await AsyncClient().get(reverse('payment-events'), headers={'Authorization': self.auth_header})
+        self.assertEqual(response.status_code, 429)
+
+        # Closing the response (as Django does on disconnect) frees the slot
+        stream.close()
+        await self.open_stream()
+
+    def test_requires_authentication(self):
+        self.assertEqual(Client().get(reverse('payment-events')).status_code, 401)
+
+    def test_webhook_publishes_status_change_after_commit(self):
+        payment_intent = MagicMock()
+        payment_intent.id = 'pi_123'
+        payment_intent.amount = 1000
+        payment_intent.currency = 'usd'
+        payment_intent.payment_method = 'pm_123'
+        payment_intent.customer = 'cus_123'
+        payment_intent.metadata = {'payment_link_id': self.payment_link.unique_id}
+        mock_event = MagicMock()
+        mock_event.type = 'payment_intent.succeeded'
+        mock_event.data.object = payment_intent
+
+        with patch('stripe.Webhook.construct_event', return_value=mock_event), \
+                patch('payments.views.stripe_webhooks.get_payment_method_details',
+                      return_value={'type': 'card', 'details': {}}), \
+                patch.object(get_broker(), 'publish') as publish, \
+                self.captureOnCommitCallbacks(execute=True):
+            Client().post(reverse('stripe-webhook'), data={}, content_type='application/json',
+                          HTTP_STRIPE_SIGNATURE='dummy_sig')
+
+        publish.assert_called_once()
+        user_id, event = publish.call_args.args
+        self.assertEqual(user_id, self.user.pk)
+        self.assertEqual(event['status'], 'success')
+        self.assertIsNone(event['previous_status'])
+        self.assertEqual(event['payment_link'], self.payment_link.unique_id)
+        self.assertEqual(Payment.objects.get().status, 'success')
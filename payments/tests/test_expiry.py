@@ -0,0 +1,102 @@
+from datetime import date, timedelta
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.test import TestCase, Client
+from django.urls import reverse
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from payments.models import Payment, PaymentLink
+
+User = get_user_model()
+
+
+class ExpirePaymentLinksCommandTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', password='testpass123')
+        self.today = date.today()
+
+    def create_link(self, days, status='active'):
+        expiration_date = None if days is None else self.today + timedelta(days=days)
+        return PaymentLink.objects.create(
+            user=self.user, amount_minor=1000, currency='USD', expiration_date=expiration_date, status=status
+        )
+
+    def sweep(self, *args):
+        call_command('expire_payment_links', *args, stdout=StringIO())
+
+    def test_expires_overdue_links_in_chunks(self):
+        overdue = [self.create_link(-1), self.create_link(-2), self.create_link(-30)]
+        due_today = self.create_link(0)
+        no_expiry = self.create_link(None)
+        updated_at = overdue[0].updated_at
+
+        self.sweep('--chunk-size', '2')
+
+        for link in overdue:
+            link.refresh_from_db()
+            self.assertEqual(link.status, 'expired')
+        self.assertGreater(overdue[0].updated_at, updated_at)
+        self.assertEqual(PaymentLink.objects.get(pk=due_today.pk).status, 'active')
+        self.assertEqual(PaymentLink.objects.get(pk=no_expiry.pk).status, 'active')
+
+    def test_purges_old_unpaid_expired_links(self):
+        old_unpaid = self.create_link(-100, status='expired')
+        old_paid = self.create_link(-100, status='expired')
+        Payment.objects.create(
+            payment_link=old_paid, stripe_payment_id='pi_1', amount_minor=1000, currency='USD', status='success',
+            payment_method='card',
+        )
+        recent_unpaid = self.create_link(-10, status='expired')
+
+        self.sweep('--purge-after-days', '90', '--chunk-size', '1')
+
+        self.assertFalse(PaymentLink.objects.filter(pk=old_unpaid.pk).exists())
+        self.assertTrue(PaymentLink.objects.filter(pk=old_paid.pk).exists())
+        self.assertTrue(PaymentLink.objects.filter(pk=recent_unpaid.pk).exists())
+
+    def test_purge_disabled(self):
+        link = self.create_link(-100)
+
+        self.sweep('--purge-after-days', '0')
+
+        self.assertEqual(PaymentLink.objects.get(pk=link.pk).status, 'expired')
+
+
+class PaymentLinkStatusViewsTest(TestCase):
+    def setUp(self):
+        self.client = Client()
+        self.user = User.objects.create_user(username='testuser', password='testpass123')
+        self.auth_header = f'Bearer {RefreshToken.for_user(self.user).access_token}'
+        self.active = PaymentLink.objects.create(user=self.user, amount_minor=1000, currency='USD')
+        self.expired = PaymentLink.objects.create(
+            user=self.user, amount_minor=1000, currency='USD',
+            expiration_date=date.today() - timedelta(days=1), status='expired',
+        )
+        # Past its date, but the sweeper hasn't run yet
+        self.overdue = PaymentLink.objects.create(
+            user=self.user, amount_minor=1000, currency='USD', expiration_date=date.today() - timedelta(days=1),
+        )
+
+    def test_payment_page_without_expiration_date(self):
+        response = self.client.get(reverse('payment-page', args=[self.active.unique_id]))
+        self.assertTemplateUsed(response, 'payments/payment_page.html')
+
+    def test_payment_page_rejects_expired_links(self):
+        for link in (self.expired, self.overdue):
+            response = self.client.get(reverse('payment-page', args=[link.unique_id]))
+            self.assertTemplateUsed(response, 'payments/error.html')
+
+    def test_create_payment_intent_rejects_expired_links(self):
+        for link in (self.expired, self.overdue):
+            response = self.client.post(reverse('create-payment-intent', args=[link.unique_id]))
+            self.assertEqual(response.status_code, 404)
+
+    def test_list_filters_by_stored_status(self):
+        def list_links(**params):
+            return self.client.get(reverse('list-payment-links'), params, HTTP_AUTHORIZATION=self.auth_header)
+
+        self.assertEqual(len(list_links().json()), 3)
+        self.assertEqual({link['unique_id'] for link in list_links(status='expired').json()}, {self.expired.unique_id})
+        self.assertEqual(list_links(status='bogus').status_code, 400)
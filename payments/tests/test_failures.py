@@ -0,0 +1,66 @@
+import json
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.test import TestCase, Client
+from django.urls import reverse
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from payments.models import Payment, PaymentLink
+
+User = get_user_model()
+
+
+class PaymentFailuresTest(TestCase):
+    def setUp(self):
+        self.client = Client()
+        self.user = User.objects.create_user(username='testuser', password='testpass123')
+        self.auth_header = f'Bearer {RefreshToken.for_user(self.user).access_token}'
+        self.payment_link = PaymentLink.objects.create(user=self.user, amount_minor=1000, currency='USD')
+
+    def create_payment(self, stripe_payment_id, status='failed', metadata=None, **fields):
+        return Payment.objects.create(
+            payment_link=self.payment_link,
+            stripe_payment_id=stripe_payment_id,
+            amount_minor=1000,
+            currency='USD',
+            status=status,
+            payment_method='card',
+            metadata=metadata or {},
+            **fields
+        )
+
+    def test_failures_grouped_by_decline_code_and_brand(self):
+        self.create_payment('pi_1', card_brand='visa', failure_code='card_declined', decline_code='insufficient_funds')
+        self.create_payment('pi_2', card_brand='visa', failure_code='card_declined', decline_code='insufficient_funds')
+        self.create_payment('pi_3', card_brand='amex', failure_code='expired_card')
+        self.create_payment('pi_4', status='success', card_brand='visa')
+
+        response = self.client.get(reverse('payment-failures-summary'), HTTP_AUTHORIZATION=self.auth_header)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), [
+            {'failure_code': 'card_declined', 'decline_code': 'insufficient_funds', 'card_brand': 'visa', 'count': 2},
+            {'failure_code': 'expired_card', 'decline_code': None, 'card_brand': 'amex', 'count': 1},
+        ])
+
+    def test_backfill_parses_legacy_metadata(self):
+        legacy_success = self.create_payment('pi_legacy_success', status='success', metadata={
+            'payment_method_details': json.dumps({'brand': 'mastercard', 'last4': '4444'}),
+        })
+        legacy_failure = self.create_payment('pi_legacy_failure', metadata={
+            'error': {'code': 'card_declined', 'decline_code': 'stolen_card'},
+            'failure_code': 'card_declined',
+        })
+        untouched = self.create_payment('pi_empty', status='pending')
+
+        call_command('backfill_payment_columns', chunk_size=1, stdout=StringIO())
+
+        legacy_success.refresh_from_db()
+        self.assertEqual((legacy_success.card_brand, legacy_success.card_last4), ('mastercard', '4444'))
+        self.assertEqual(legacy_success.metadata['payment_method_details'], {'brand': 'mastercard', 'last4': '4444'})
+        legacy_failure.refresh_from_db()
+        self.assertEqual((legacy_failure.failure_code, legacy_failure.decline_code), ('card_declined', 'stolen_card'))
+        untouched.refresh_from_db()
+        self.assertIsNone(untouched.card_brand)
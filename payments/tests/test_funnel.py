@@ -0,0 +1,137 @@
+import weakref
+from datetime import date, timedelta
+from unittest.mock import patch, MagicMock
+
+from django.contrib.auth import get_user_model
+from django.core.signals import request_finished
+from django.db import close_old_connections
+from django.test import TestCase, Client, override_settings
+from django.urls import reverse
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from payments.funnel import FunnelCounters, funnel_counters
+from payments.models import PaymentLink, PaymentLinkFunnel
+
+User = get_user_model()
+
+
+@override_settings(FUNNEL_ENABLED=True)
+class FunnelCountersTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', password='testpass123')
+        self.payment_link = PaymentLink.objects.create(user=self.user, amount_minor=1000, currency='USD')
+        self.counters = FunnelCounters()
+
+    def test_flush_adds_to_stored_totals(self):
+        self.counters.record(self.payment_link.id, 'page_views', count=3)
+        self.counters.record(self.payment_link.id, 'intents_created')
+        self.counters.flush()
+        self.counters.record(self.payment_link.id, 'page_views')
+        self.counters.flush()
+
+        funnel = PaymentLinkFunnel.objects.get(payment_link=self.payment_link)
+        self.assertEqual(funnel.page_views, 4)
+        self.assertEqual(funnel.intents_created, 1)
+        self.assertEqual(funnel.successes, 0)
+
+    def test_flush_skips_deleted_links(self):
+        other_link = PaymentLink.objects.create(user=self.user, amount_minor=500, currency='USD')
+        self.counters.record(self.payment_link.id, 'page_views')
+        self.counters.record(other_link.id, 'page_views')
+        other_link.delete()
+        self.counters.flush()
+
+        self.assertEqual(PaymentLinkFunnel.objects.get().payment_link, self.payment_link)
+
+    @override_settings(FUNNEL_FLUSH_INTERVAL=3600, FUNNEL_FLUSH_MAX_PENDING=2)
+    def test_flush_due_after_max_pending(self):
+        self.counters.record(self.payment_link.id, 'page_views')
+        self.assertFalse(self.counters.flush_due())
+        self.counters.record(self.payment_link.id, 'page_views')
+        self.assertTrue(self.counters.flush_due())
+
+    def test_unknown_stage(self):
+        with self.assertRaises(ValueError):
+            self.counters.record(self.payment_link.id, 'refunds')
+
+
+@override_settings(FUNNEL_ENABLED=True, FUNNEL_FLUSH_INTERVAL=0)
+class FunnelTrackingTest(TestCase):
+    def setUp(self):
+        self.client = Client()
+        self.user = User.objects.create_user(username='testuser', password='testpass123')
+        self.auth_header = f'Bearer {RefreshToken.for_user(self.user).access_token}'
+        self.payment_link = PaymentLink.objects.create(
+            user=self.user,
+            amount_minor=1000,
+            currency='USD',
+            expiration_date=date.today() + timedelta(days=7),
+        )
+        funnel_counters.clear()
+
+    def tearDown(self):
+        # Nothing left for another test's request, or exit, to flush
+        funnel_counters.clear()
+
+    def send_payment_event(self, event_type, payment_intent_id='pi_123'):
+        payment_intent = MagicMock()
+        payment_intent.id = payment_intent_id
+        payment_intent.amount = 1000
+        payment_intent.currency = 'usd'
+        payment_intent.metadata = {'payment_link_id': self.payment_link.unique_id}
+        payment_intent.payment_method = 'pm_123'
+        payment_intent.customer = 'cus_123'
+        payment_intent.last_payment_error = None
+
+        mock_event = MagicMock()
+        mock_event.type = event_type
+        mock_event.data.object = payment_intent
+        with patch('stripe.Webhook.construct_event', return_value=mock_event), \
+                patch('payments.views.stripe_webhooks.get_payment_method_details',
+                      return_value={'type': 'card', 'details': {}}):
+            return self.client.post(
+                reverse('stripe-webhook'),
+                data={},
+                content_type='application/json',
+                HTTP_STRIPE_SIGNATURE='dummy_sig'
+            )
+
+    def test_page_view_flushed_after_response(self):
+        response = self.client.get(reverse('payment-page', args=[self.payment_link.unique_id]))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(PaymentLinkFunnel.objects.get(payment_link=self.payment_link).page_views, 1)
+
+    def test_flushed_before_connections_are_closed(self):
+        receivers = [
+            receiver() if isinstance(receiver, weakref.ref) else receiver
+            for _, receiver, _ in request_finished.receivers
+        ]
+
+        # Otherwise the flush reopens a connection that stays checked out until the next request
+        self.assertLess(receivers.index(funnel_counters.flush_if_due), receivers.index(close_old_connections))
+
+    def test_redelivered_success_counted_once(self):
+        self.send_payment_event('payment_intent.succeeded')
+        self.send_payment_event('payment_intent.succeeded')
+        # A late failure event can't turn a success into a failure
+        self.send_payment_event('payment_intent.payment_failed')
+
+        funnel = PaymentLinkFunnel.objects.get(payment_link=self.payment_link)
+        self.assertEqual(funnel.successes, 1)
+        self.assertEqual(funnel.failures, 0)
+
+    def test_funnel_summary_rates(self):
+        for _ in range(4):
+            self.client.get(reverse('payment-page', args=[self.payment_link.unique_id]))
+        self.send_payment_event('payment_intent.succeeded')
+
+        response = self.client.get(reverse('funnel-summary'), HTTP_AUTHORIZATION=self.auth_header)
+
+        self.assertEqual(response.status_code, 200)
+        row, = response.json()
+        self.assertEqual(row['payment_link'], self.payment_link.unique_id)
+        self.assertEqual(row['page_views'], 4)
+        self.assertEqual(row['successes'], 1)
+        self.assertEqual(row['intent_rate'], 0.0)
+        self.assertEqual(row['conversion_rate'], 0.25)
@@ -0,0 +1,213 @@
+import json
+import threading
+import time
+from datetime import date, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest.mock import patch
+
+import stripe
+from django.contrib.auth import get_user_model
+from django.test import SimpleTestCase, TestCase, Client, override_settings
+from django.urls import reverse
+
+from payments.gateway import CircuitBreaker, StripeGateway, StripeUnavailable
+from payments.models import PaymentLink
+
+PAYMENT_INTENT = {'id': 'pi_123', 'object': 'payment_intent', 'status': 'succeeded', 'client_secret': 'secret'}
+SERVER_ERROR = (500, {'error': {'type': 'api_error', 'message': "Something went wrong"}})
+CARD_DECLINED = (402, {'error': {'type': 'card_error', 'code': 'card_declined', 'message': "Your card was declined."}})
+
+
+class StubStripeHandler(BaseHTTPRequestHandler):
+    """
+    Answers Stripe API requests from server.faults (status, body, delay) in order,
+    then with a successful PaymentIntent
+    """
+
+    def handle_request(self):
+        self.server.requests.append((self.command, self.path))
+        status, body, delay = self.server.faults.pop(0) if self.server.faults else (200, PAYMENT_INTENT, 0)
+        time.sleep(delay)
+        payload = json.dumps(body).encode()
+        try:
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+        except (BrokenPipeError, ConnectionResetError):
+            # The client already gave up waiting
+            pass
+
+    do_GET = handle_request
+    do_POST = handle_request
+
+    def log_message(self, format, *args):
+        pass
+
+
+class StubStripeMixin:
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.server = ThreadingHTTPServer(('127.0.0.1', 0), StubStripeHandler)
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.addClassCleanup(cls.server.server_close)
+        cls.addClassCleanup(cls.server.shutdown)
+        cls.stub_settings = override_settings(
+            STRIPE_API_BASE=f'http://127.0.0.1:{cls.server.server_port}',
+            STRIPE_RETRIEVE_TIMEOUT=0.2,
+            STRIPE_CREATE_TIMEOUT=0.2,
+            STRIPE_MAX_RETRIES=2,
+            STRIPE_RETRY_BASE_DELAY=0.001,
+        )
+        cls.stub_settings.enable()
+        cls.addClassCleanup(cls.stub_settings.disable)
+
+    def setUp(self):
+        super().setUp()
+        self.server.faults = []
+        self.server.requests = []
+
+    def inject(self, *faults, delay=0):
+        self.server.faults.extend((status, body, delay) for status, body in faults)
+
+
+class StripeGatewayTest(StubStripeMixin, SimpleTestCase):
+    def setUp(self):
+        super().setUp()
+        self.gateway = StripeGateway(failure_threshold=3, reset_timeout=60)
+
+    def test_reads_retry_server_errors(self):
+        self.inject(SERVER_ERROR, SERVER_ERROR)
+
+        intent = self.gateway.retrieve_payment_intent('pi_123')
+
+        self.assertEqual(intent.client_secret, 'secret')
+        self.assertEqual(self.server.requests, [('GET', '/v1/payment_intents/pi_123')] * 3)
+        counters = self.gateway.stats()['operations']['payment_intents.retrieve']
+        self.assertEqual((counters['retries'], counters['failures'], counters['successes']), (2, 2, 1))
+
+    def test_reads_give_up_after_max_retries(self):
+        self.inject(SERVER_ERROR, SERVER_ERROR, SERVER_ERROR)
+
+        with self.assertRaises(StripeUnavailable):
+            self.gateway.retrieve_charge('ch_123')
+        self.assertEqual(len(self.server.requests), 3)
+
+    def test_create_is_not_retried(self):
+        self.inject(SERVER_ERROR)
+
+        with self.assertRaises(StripeUnavailable):
+            self.gateway.create_payment_intent(amount=1000, currency='usd')
+        self.assertEqual(self.server.requests, [('POST', '/v1/payment_intents')])
+
+    def test_timeout(self):
+        self.inject((200, PAYMENT_INTENT), delay=0.5)
+
+        started = time.monotonic()
+        with self.assertRaises(StripeUnavailable):
+            self.gateway.create_payment_intent(amount=1000, currency='usd')
+        self.assertLess(time.monotonic() - started, 0.5)
+
+    def test_declines_pass_through_without_tripping_breaker(self):
+        self.inject(CARD_DECLINED, CARD_DECLINED, CARD_DECLINED)
+
+        for _ in range(3):
+            with self.assertRaises(stripe.CardError):
+                self.gateway.create_payment_intent(amount=1000, currency='usd')
+        self.assertEqual(self.gateway.breaker.state, CircuitBreaker.CLOSED)
+        self.assertEqual(self.gateway.stats()['operations']['payment_intents.create']['errors'], 3)
+
+    def test_breaker_fails_fast_while_open(self):
+        self.inject(SERVER_ERROR, SERVER_ERROR, SERVER_ERROR)
+        with self.assertRaises(StripeUnavailable):
+            self.gateway.retrieve_payment_intent('pi_123')
+        self.assertEqual(self.gateway.breaker.state, CircuitBreaker.OPEN)
+
+        with self.assertRaises(StripeUnavailable):
+            self.gateway.create_payment_intent(amount=1000, currency='usd')
+        self.assertEqual(len(self.server.requests), 3)
+        self.assertEqual(self.gateway.stats()['operations']['payment_intents.create']['short_circuited'], 1)
+
+
+    def test_unexpected_error_in_trial_reopens_breaker(self):
+        now = [0]
+        self.gateway.breaker = CircuitBreaker(failure_threshold=1, reset_timeout=60, clock=lambda: now[0])
+        self.gateway.breaker.record_failure()
+        now[0] = 60
+
+        def broken(client):
+            raise ValueError("Unexpected response")
+
+        with self.assertRaises(ValueError):
+            self.gateway._call('payment_intents.retrieve', 1, False, broken)
+        self.assertEqual(self.gateway.breaker.state, CircuitBreaker.OPEN)
+
+        # Not stuck waiting for that trial: the next one goes through once the timeout passes again
+        now[0] = 120
+        self.assertEqual(self.gateway.retrieve_payment_intent('pi_123').client_secret, 'secret')
+        self.assertEqual(self.gateway.breaker.state, CircuitBreaker.CLOSED)
+
+
+class CircuitBreakerTest(SimpleTestCase):
+    def setUp(self):
+        self.now = 0
+        self.breaker = CircuitBreaker(failure_threshold=2, reset_timeout=30, clock=lambda: self.now)
+
+    def test_half_open_allows_one_trial(self):
+        self.breaker.record_failure()
+        self.breaker.record_failure()
+        self.assertFalse(self.breaker.allow())
+
+        self.now = 30
+        self.assertTrue(self.breaker.allow())
+        self.assertFalse(self.breaker.allow())
+
+        self.breaker.record_success()
+        self.assertEqual(self.breaker.state, CircuitBreaker.CLOSED)
+        self.assertTrue(self.breaker.allow())
+
+    def test_failed_trial_reopens(self):
+        self.breaker.record_failure()
+        self.breaker.record_failure()
+        self.now = 30
+        self.assertTrue(self.breaker.allow())
+
+        self.breaker.record_failure()
+        self.assertEqual(self.breaker.state, CircuitBreaker.OPEN)
+        self.now = 45
+        self.assertFalse(self.breaker.allow())
+
+
+class PaymentViewsStripeUnavailableTest(TestCase):
+    def test_create_payment_intent_returns_503(self):
+        user = get_user_model().objects.create_user(username='testuser', password='testpass123')
+        link = PaymentLink.objects.create(
+            user=user, amount_minor=1000, currency='USD', expiration_date=date.today() + timedelta(days=1)
+        )
+
+        with patch('payments.gateway.StripeGateway.create_payment_intent', side_effect=StripeUnavailable('open')):
+            response = Client().post(reverse('create-payment-intent', args=[link.unique_id]))
+
+        self.assertEqual(response.status_code, 503)
+
+
+class StripeGatewayCoalescingTest(StubStripeMixin, SimpleTestCase):
+    def test_concurrent_retrievals_share_one_request(self):
+        gateway = StripeGateway(failure_threshold=3, reset_timeout=60)
+        self.inject((200, PAYMENT_INTENT), delay=0.1)
+        intents = []
+
+        threads = [
+            threading.Thread(target=lambda: intents.append(gateway.retrieve_payment_intent('pi_123')))
+            for _ in range(5)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(intents), 5)
+        self.assertEqual(self.server.requests, [('GET', '/v1/payment_intents/pi_123')])
+        self.assertEqual(gateway.stats()['operations']['payment_intents.retrieve']['successes'], 1)
@@ -0,0 +1,152 @@
+from datetime import timedelta
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.test import TestCase
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.decorators import api_view
+from rest_framework.response import Response
+from rest_framework.test import APIClient, APIRequestFactory, force_authenticate
+
+from payments.idempotency import idempotent, request_fingerprint
+from payments.models import IdempotencyKey, PaymentLink
+
+User = get_user_model()
+
+LINK = {'amount': '25.00', 'currency': 'USD', 'description': 'Consulting'}
+
+
+class IdempotencyKeyTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='merchant', password='testpass123')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def create(self, key='key-1', data=LINK):
+        return self.client.post(reverse('create-payment-link'), data, format='json', HTTP_IDEMPOTENCY_KEY=key)
+
+    def test_retry_replays_first_response(self):
+        first = self.create()
+        retry = self.create()
+
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual(retry.json(), first.json())
+        self.assertEqual(retry['Idempotent-Replayed'], 'true')
+        self.assertEqual(PaymentLink.objects.count(), 1)
+
+        self.create(key='key-2')
+        self.assertEqual(PaymentLink.objects.count(), 2)
+
+    def test_keys_are_per_user(self):
+        self.create()
+        self.client.force_authenticate(User.objects.create_user(username='other', password='testpass123'))
+        self.create()
+
+        self.assertEqual(PaymentLink.objects.count(), 2)
+
+    def test_without_key_every_request_creates(self):
+        self.client.post(reverse('create-payment-link'), LINK, format='json')
+        self.client.post(reverse('create-payment-link'), LINK, format='json')
+
+        self.assertEqual(PaymentLink.objects.count(), 2)
+        self.assertFalse(IdempotencyKey.objects.exists())
+
+    def test_key_reused_for_different_request(self):
+        self.create()
+        response = self.create(data={**LINK, 'amount': '30.00'})
+
+        self.assertEqual(response.status_code, 422)
+        self.assertEqual(PaymentLink.objects.count(), 1)
+
+    def test_duplicate_while_first_is_running(self):
+        IdempotencyKey.objects.create(
+            user=self.user, key='key-1', request_hash=self.fingerprint(), locked_at=timezone.now(),
+            expires_at=timezone.now() + timedelta(days=1),
+        )
+
+        response = self.create()
+
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response['Retry-After'], '1')
+        self.assertFalse(PaymentLink.objects.exists())
+
+    def test_abandoned_and_expired_keys_are_taken_over(self):
+        for key, locked_at, expires_at in (
+            ('abandoned', timezone.now() - timedelta(minutes=5), timezone.now() + timedelta(days=1)),
+            ('expired', None, timezone.now() - timedelta(seconds=1)),
+        ):
+            IdempotencyKey.objects.create(
+                user=self.user, key=key, request_hash='other', locked_at=locked_at,
+                response_status=None if locked_at else 200, response_body=None if locked_at else {}, expires_at=expires_at,
+            )
+        IdempotencyKey.objects.filter(key='abandoned').update(request_hash=self.fingerprint())
+
+        self.assertEqual(self.create(key='abandoned').status_code, 200)
+        self.assertEqual(self.create(key='expired').status_code, 200)
+        self.assertEqual(PaymentLink.objects.count(), 2)
+        self.assertEqual(set(IdempotencyKey.objects.values_list('response_status', flat=True)), {200})
+
+    def test_server_errors_are_not_stored(self):
+        responses = [Response({'error': 'unavailable'}, status=503), Response({'id': 1}, status=201)]
+
+        @api_view(['POST'])
+        @idempotent
+        def view(request):
+            return responses.pop(0)
+
+        def post():
+            request = APIRequestFactory().post('/things/', {}, format='json', HTTP_IDEMPOTENCY_KEY='key-1')
+            force_authenticate(request, self.user)
+            return view(request)
+
+        self.assertEqual(post().status_code, 503)
+        self.assertFalse(IdempotencyKey.objects.exists())
+        self.assertEqual(post().status_code, 201)
+        self.assertEqual(IdempotencyKey.objects.get().response_body, {'id': 1})
+
+    def test_request_that_lost_its_key_leaves_it_alone(self):
+        outcomes = [Response({'id': 1}, status=201), RuntimeError("failed")]
+
+        @api_view(['POST'])
+        @idempotent
+        def view(request):
+            # Outlived IDEMPOTENCY_LOCK_TIMEOUT, and a retry took the key over meanwhile
+            IdempotencyKey.objects.update(locked_at=timezone.now() + timedelta(seconds=1))
+            outcome = outcomes.pop(0)
+            if isinstance(outcome, Exception):
+                raise outcome
+            return outcome
+
+        def post():
+            request = APIRequestFactory().post('/things/', {}, format='json', HTTP_IDEMPOTENCY_KEY='key-1')
+            force_authenticate(request, self.user)
+            return view(request)
+
+        # The retry's response isn't overwritten
+        post()
+        self.assertIsNone(IdempotencyKey.objects.get().response_status)
+
+        # Nor is its row deleted
+        IdempotencyKey.objects.update(locked_at=timezone.now() - timedelta(minutes=5))
+        with self.assertRaises(RuntimeError):
+            post()
+        self.assertTrue(IdempotencyKey.objects.exists())
+
+    def test_invalid_key(self):
+        self.assertEqual(self.create(key='k' * 256).status_code, 400)
+
+    def test_purge_removes_expired_keys(self):
+        self.create(key='fresh')
+        self.create(key='old')
+        IdempotencyKey.objects.filter(key='old').update(expires_at=timezone.now() - timedelta(seconds=1))
+
+        out = StringIO()
+        call_command('purge_idempotency_keys', '--chunk-size', '1', stdout=out)
+
+        self.assertEqual(list(IdempotencyKey.objects.values_list('key', flat=True)), ['fresh'])
+        self.assertIn("Deleted 1 expired idempotency keys", out.getvalue())
+
+    def fingerprint(self):
+        return request_fingerprint(APIRequestFactory().post(reverse('create-payment-link'), LINK, format='json'))
@@ -0,0 +1,91 @@
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.test import TestCase
+from django.urls import reverse
+from rest_framework.test import APIClient
+
+from payments.models import Payment, PaymentLink
+from payments.services import upsert_payment
+
+User = get_user_model()
+
+
+class PaymentLinkCountersTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='merchant', password='testpass123')
+        self.payment_link = PaymentLink.objects.create(user=self.user, amount_minor=1000, currency='USD')
+
+    def upsert(self, stripe_payment_id, status, amount_minor=1000):
+        payment, _ = upsert_payment(
+            stripe_payment_id,
+            payment_link_unique_id=self.payment_link.unique_id,
+            status=status,
+            fields={'amount_minor': amount_minor, 'currency': 'USD'},
+        )
+        return payment
+
+    def counters(self):
+        self.payment_link.refresh_from_db()
+        return (
+            self.payment_link.success_count,
+            self.payment_link.failed_count,
+            self.payment_link.collected_amount_minor,
+        )
+
+    def test_status_transitions_move_counts(self):
+        self.upsert('pi_1', 'failed')
+        self.assertEqual(self.counters(), (0, 1, 0))
+
+        # A retry on the same PaymentIntent succeeds
+        first = self.upsert('pi_1', 'success')
+        self.assertEqual(self.counters(), (1, 0, 1000))
+
+        # Duplicate and stale events change nothing
+        self.upsert('pi_1', 'success')
+        self.upsert('pi_1', 'failed')
+        self.assertEqual(self.counters(), (1, 0, 1000))
+
+        self.upsert('pi_2', 'pending')
+        second = self.upsert('pi_2', 'success', amount_minor=2500)
+        self.assertEqual(self.counters(), (2, 0, 3500))
+        self.assertEqual(self.payment_link.last_payment_at, max(first.created_at, second.created_at))
+
+    def test_drifted_counters_never_go_negative(self):
+        # Recorded before the counters existed, so they don't include it
+        Payment.objects.create(
+            payment_link=self.payment_link, stripe_payment_id='pi_1', amount_minor=1000, currency='USD', status='failed'
+        )
+
+        payment = self.upsert('pi_1', 'success')
+
+        self.assertEqual(payment.status, 'success')
+        self.assertEqual(self.counters(), (1, 0, 1000))
+
+    def test_reconcile_fixes_drift(self):
+        self.upsert('pi_1', 'success')
+        self.upsert('pi_2', 'failed')
+        # Written around upsert_payment, so the counters miss it
+        Payment.objects.create(
+            payment_link=self.payment_link, stripe_payment_id='pi_3', amount_minor=500, currency='USD', status='success'
+        )
+        empty = PaymentLink.objects.create(user=self.user, amount_minor=1000, currency='USD', success_count=3)
+
+        out = StringIO()
+        call_command('reconcile_payment_link_counters', '--chunk-size', '1', stdout=out)
+
+        self.assertEqual(self.counters(), (2, 1, 1500))
+        self.assertEqual(self.payment_link.last_payment_at, Payment.objects.get(stripe_payment_id='pi_3').created_at)
+        empty.refresh_from_db()
+        self.assertEqual((empty.success_count, empty.last_payment_at), (0, None))
+        self.assertIn("Checked 2 payment links, corrected 2", out.getvalue())
+
+    def test_listed_with_payment_links(self):
+        self.upsert('pi_1', 'success', amount_minor=1250)
+        client = APIClient()
+        client.force_authenticate(self.user)
+
+        response = client.get(reverse('list-payment-links'), {'fields': 'success_count,collected_amount'})
+
+        self.assertEqual(response.data, [{'success_count': 1, 'collected_amount': '12.50'}])
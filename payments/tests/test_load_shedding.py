@@ -0,0 +1,157 @@
+import asyncio
+import json
+
+from asgiref.sync import async_to_sync
+from django.test import SimpleTestCase, override_settings
+
+from dealflow.loadshedding import DEFAULT_PRIORITY, AdaptiveLimiter, LoadSheddingMiddleware, classify
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class StubApp:
+    """
+    ASGI app whose requests hold their slot until gate is set
+    """
+
+    def __init__(self):
+        self.gate = asyncio.Event()
+
+    async def __call__(self, scope, receive, send):
+        await self.gate.wait()
+        await send({'type': 'http.response.start', 'status': 200, 'headers': []})
+        await send({'type': 'http.response.body', 'body': b'ok'})
+
+
+async def call(app, path):
+    messages = []
+    body = [{'type': 'http.request', 'body': b''}]
+
+    async def receive():
+        if body:
+            return body.pop()
+        # The client stays connected
+        await asyncio.Future()
+
+    async def send(message):
+        messages.append(message)
+
+    await app({'type': 'http', 'method': 'GET', 'path': path, 'headers': [(b'host', b'testserver')]}, receive, send)
+    return messages
+
+
+class ClassifyTest(SimpleTestCase):
+    def test_priorities(self):
+        self.assertEqual(classify('/webhooks/stripe/').name, 'critical')
+        self.assertEqual(classify('/payment/abc/').name, 'critical')
+        self.assertEqual(classify('/api/payment/abc/create-intent/').name, 'critical')
+        self.assertEqual(classify('/api/analytics/funnel/').name, 'low')
+        self.assertEqual(classify('/api/async/analytics/').name, 'low')
+        self.assertEqual(classify('/api/payment-links/create/'), DEFAULT_PRIORITY)
+        self.assertIsNone(classify('/api/events/').share)
+        self.assertIsNone(classify('/').share)
+
+
+class AdaptiveLimiterTest(SimpleTestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        self.limiter = AdaptiveLimiter(
+            initial=10, minimum=2, maximum=12, target_latency=0.5, backoff=0.5, window=1.0, clock=self.clock
+        )
+
+    def run_request(self, latency, priority=DEFAULT_PRIORITY):
+        self.assertTrue(self.limiter.try_acquire(priority))
+        self.limiter.release(priority, latency)
+
+    def test_slow_responses_lower_limit_once_per_window(self):
+        self.run_request(1.0)
+        self.run_request(1.0)
+        self.assertEqual(self.limiter.limit, 5)
+
+        self.clock.now = 1.0
+        for _ in range(5):
+            self.run_request(1.0)
+            self.clock.now += 1.0
+        self.assertEqual(self.limiter.limit, 2)
+
+    def test_fast_responses_raise_limit_only_while_it_is_used(self):
+        self.run_request(0.1)
+        self.assertEqual(self.limiter.limit, 10)
+
+        for _ in range(5):
+            self.limiter.try_acquire(DEFAULT_PRIORITY)
+        for _ in range(50):
+            self.run_request(0.1)
+        self.assertEqual(self.limiter.limit, 12)
+
+    def test_analytics_latency_does_not_steer_limit(self):
+        self.run_request(5.0, priority=classify('/api/analytics/'))
+        self.assertEqual(self.limiter.limit, 10)
+
+
+@override_settings(LOAD_SHED_ENABLED=True, LOAD_SHED_RETRY_AFTER=3)
+class LoadSheddingMiddlewareTest(SimpleTestCase):
+    def test_sheds_lower_priorities_first(self):
+        async def scenario():
+            stub = StubApp()
+            middleware = LoadSheddingMiddleware(
+                stub, AdaptiveLimiter(initial=10, minimum=1, maximum=10, target_latency=10)
+            )
+            held = []
+
+            async def fill(path, count):
+                # Requests are admitted or refused before they first yield
+                for _ in range(count):
+                    held.append(asyncio.ensure_future(call(middleware, path)))
+                await asyncio.sleep(0)
+                return await asyncio.wait_for(call(middleware, path), timeout=1)
+
+            # Analytics gets half of the limit, the default class 80% and checkout all of it
+            shed = [
+                await fill('/api/analytics/', 5),
+                await fill('/api/payment-links/create/', 3),
+                await fill('/webhooks/stripe/', 2),
+            ]
+            stats = middleware.limiter.stats()
+
+            stub.gate.set()
+            done = await asyncio.gather(*held)
+            after = await call(middleware, '/api/search/')
+            return shed, stats, done, after
+
+        shed, stats, done, after = async_to_sync(scenario)()
+
+        for response in shed:
+            self.assertEqual(response[0]['status'], 503)
+            self.assertIn((b'retry-after', b'3'), response[0]['headers'])
+        self.assertEqual(json.loads(shed[0][1]['body'])['error'], "Server busy")
+        self.assertEqual(stats['in_flight'], {'low': 5, 'default': 3, 'critical': 2})
+        self.assertEqual(stats['shed'], {'low': 1, 'default': 1, 'critical': 1})
+        self.assertEqual([response[0]['status'] for response in done], [200] * 10)
+        self.assertEqual(after[0]['status'], 200)
+
+    def test_streaming_endpoints_are_not_limited(self):
+        async def scenario():
+            stub = StubApp()
+            stub.gate.set()
+            middleware = LoadSheddingMiddleware(stub, AdaptiveLimiter(initial=0, minimum=0, maximum=0, target_latency=1))
+            return await call(middleware, '/api/events/'), await call(middleware, '/api/analytics/')
+
+        events, analytics = async_to_sync(scenario)()
+
+        self.assertEqual(events[0]['status'], 200)
+        self.assertEqual(analytics[0]['status'], 503)
+
+    def test_wraps_the_asgi_application(self):
+        from dealflow.asgi import application
+
+        messages = async_to_sync(call)(application, '/')
+
+        self.assertIsInstance(application, LoadSheddingMiddleware)
+        self.assertEqual(messages[0]['status'], 200)
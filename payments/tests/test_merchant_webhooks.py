@@ -0,0 +1,281 @@
+import json
+import socket
+import threading
+from datetime import timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import StringIO
+from unittest.mock import patch
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from payments.merchant_webhooks import SIGNATURE_HEADER, DeliveryEngine, is_allowed_destination, verify_signature
+from payments.models import PaymentLink, WebhookDelivery, WebhookEndpoint
+from payments.services import upsert_payment
+
+User = get_user_model()
+
+
+class ReceiverHandler(BaseHTTPRequestHandler):
+    """
+    /ok answers 200, /fail answers 500 and /slow waits for server.release before answering 200
+    """
+    protocol_version = 'HTTP/1.1'
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers['Content-Length']))
+        self.server.received.append((self.path, dict(self.headers), body, self.client_address))
+        if self.path == '/slow':
+            self.server.release.wait(5)
+        status = 500 if self.path == '/fail' else 200
+        try:
+            self.send_response(status)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+    def log_message(self, format, *args):
+        pass
+
+
+@override_settings(WEBHOOK_ALLOW_PRIVATE_NETWORKS=True, WEBHOOK_TIMEOUT=5)
+class MerchantWebhookTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.server = ThreadingHTTPServer(('127.0.0.1', 0), ReceiverHandler)
+        cls.server.daemon_threads = True
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.addClassCleanup(cls.server.server_close)
+        cls.addClassCleanup(cls.server.shutdown)
+
+    def setUp(self):
+        self.server.received = []
+        self.server.release = threading.Event()
+        self.addCleanup(self.server.release.set)
+        self.user = User.objects.create_user(username='merchant', password='testpass123')
+        self.payment_link = PaymentLink.objects.create(user=self.user, amount_minor=1000, currency='USD')
+
+    def endpoint(self, path, user=None, **kwargs):
+        return WebhookEndpoint.objects.create(
+            user=user or self.user, url=f'http://127.0.0.1:{self.server.server_port}{path}', **kwargs
+        )
+
+    def upsert(self, stripe_payment_id, status='success'):
+        return upsert_payment(
+            stripe_payment_id,
+            payment_link_unique_id=self.payment_link.unique_id,
+            status=status,
+            fields={'amount_minor': 1000, 'currency': 'USD'},
+        )
+
+    def run_engine(self, **kwargs):
+        engine = DeliveryEngine(**kwargs)
+        while engine.poll() or engine.busy:
+            engine.wait()
+        engine.shutdown()
+        return engine
+
+    def test_event_fans_out_to_active_endpoints(self):
+        first = self.endpoint('/ok')
+        second = self.endpoint('/ok')
+        self.endpoint('/ok', is_active=False)
+        self.endpoint('/ok', user=User.objects.create_user(username='other', password='testpass123'))
+
+        self.upsert('pi_1', status='pending')
+        self.upsert('pi_1')
+        self.upsert('pi_1')
+
+        deliveries = WebhookDelivery.objects.filter(event_type='payment.succeeded')
+        self.assertEqual({delivery.endpoint_id for delivery in deliveries}, {first.id, second.id})
+        self.assertEqual(len({delivery.event_id for delivery in deliveries}), 1)
+        self.assertEqual(WebhookDelivery.objects.count(), 4)
+        payload = deliveries[0].payload
+        self.assertEqual(payload['data']['previous_status'], 'pending')
+        self.assertEqual(payload['data']['amount'], '10.00')
+
+    def test_delivers_signed_events_over_one_connection(self):
+        endpoint = self.endpoint('/ok')
+        for index in range(3):
+            self.upsert(f'pi_{index}')
+
+        engine = self.run_engine()
+
+        self.assertEqual(set(WebhookDelivery.objects.values_list('status', flat=True)), {'delivered'})
+        self.assertEqual(engine.stats()['delivered'], 3)
+        self.assertEqual(len(self.server.received), 3)
+        # Keep-alive: every request came in on the same client socket
+        self.assertEqual(len({client for *_, client in self.server.received}), 1)
+        _, headers, body, _ = self.server.received[0]
+        self.assertTrue(verify_signature(endpoint.secret, body, headers[SIGNATURE_HEADER]))
+        self.assertFalse(verify_signature('whsec_wrong', body, headers[SIGNATURE_HEADER]))
+        event = json.loads(body)
+        self.assertEqual(headers['Dealflow-Event-Id'], event['id'])
+        self.assertEqual(event['data']['stripe_payment_id'], 'pi_0')
+
+    def test_slow_endpoint_does_not_hold_up_others(self):
+        self.endpoint('/slow')
+        fast = self.endpoint('/ok')
+        self.upsert('pi_1')
+
+        engine = DeliveryEngine(workers=2)
+        self.addCleanup(engine.shutdown)
+        self.assertEqual(engine.poll(), 2)
+        deadline = timezone.now() + timedelta(seconds=3)
+        while not WebhookDelivery.objects.filter(endpoint=fast, status='delivered').exists():
+            self.assertLess(timezone.now(), deadline)
+            engine.wait(timeout=0.05)
+
+        # The slow endpoint is still in flight and isn't claimed for again meanwhile
+        self.assertTrue(engine.busy)
+        self.assertEqual(engine.poll(), 0)
+        self.server.release.set()
+        engine.wait()
+        self.assertEqual(set(WebhookDelivery.objects.values_list('status', flat=True)), {'delivered'})
+
+    def test_endpoint_deleted_mid_batch(self):
+        deleted = self.endpoint('/slow')
+        kept = self.endpoint('/ok')
+        self.upsert('pi_1')
+        self.upsert('pi_2', status='failed')
+
+        engine = DeliveryEngine(workers=2)
+        self.addCleanup(engine.shutdown)
+        self.assertEqual(engine.poll(), 4)
+        deleted.delete()
+        self.server.release.set()
+        engine.wait()
+
+        self.assertFalse(WebhookDelivery.objects.filter(endpoint_id=deleted.id).exists())
+        self.assertEqual(list(kept.deliveries.values_list('status', flat=True)), ['delivered', 'delivered'])
+
+    def test_failure_backs_off_and_holds_the_endpoint_queue(self):
+        self.endpoint('/fail')
+        for index in range(3):
+            self.upsert(f'pi_{index}')
+
+        self.run_engine()
+
+        self.assertEqual(len(self.server.received), 1)
+        failed, *held = WebhookDelivery.objects.order_by('id')
+        self.assertEqual((failed.status, failed.attempts, failed.last_status_code), ('pending', 1, 500))
+        self.assertEqual(failed.last_error, 'HTTP 500')
+        self.assertGreater(failed.next_attempt_at, timezone.now())
+        for delivery in held:
+            self.assertEqual((delivery.attempts, delivery.next_attempt_at), (0, failed.next_attempt_at))
+
+    @override_settings(WEBHOOK_MAX_ATTEMPTS=2)
+    def test_dead_letters_after_max_attempts_and_can_be_retried(self):
+        endpoint = self.endpoint('/fail')
+        self.upsert('pi_1')
+
+        self.run_engine()
+        WebhookDelivery.objects.update(next_attempt_at=timezone.now())
+        engine = self.run_engine()
+
+        delivery = WebhookDelivery.objects.get()
+        self.assertEqual((delivery.status, delivery.attempts), ('dead', 2))
+        self.assertEqual(engine.stats()['dead'], 1)
+
+        client = APIClient()
+        client.force_authenticate(self.user)
+        response = client.post(reverse('retry-webhook-delivery', args=[delivery.id]))
+        self.assertEqual(response.status_code, 202)
+        delivery.refresh_from_db()
+        self.assertEqual((delivery.status, delivery.attempts), ('pending', 0))
+
+        endpoint.url = endpoint.url.replace('/fail', '/ok')
+        endpoint.save()
+        self.run_engine()
+        self.assertEqual(WebhookDelivery.objects.get().status, 'delivered')
+
+    @override_settings(WEBHOOK_ALLOW_PRIVATE_NETWORKS=False)
+    def test_private_destinations_are_refused(self):
+        self.endpoint('/ok')
+        self.upsert('pi_1')
+
+        self.run_engine()
+
+        self.assertEqual(WebhookDelivery.objects.get().status, 'dead')
+        self.assertEqual(self.server.received, [])
+
+    @override_settings(WEBHOOK_ALLOW_PRIVATE_NETWORKS=False)
+    def test_address_is_checked_on_connect(self):
+        self.endpoint('/ok')
+        self.upsert('pi_1')
+
+        # DNS answered with a public address when checked, then rebound to loopback
+        with patch('payments.merchant_webhooks.is_allowed_destination', return_value=True):
+            self.run_engine()
+
+        delivery = WebhookDelivery.objects.get()
+        self.assertEqual((delivery.status, delivery.attempts), ('pending', 1))
+        self.assertIn("non-public address 127.0.0.1", delivery.last_error)
+        self.assertEqual(self.server.received, [])
+
+    @override_settings(WEBHOOK_ALLOW_PRIVATE_NETWORKS=False)
+    def test_unresolvable_destination_is_refused(self):
+        with patch('socket.getaddrinfo', side_effect=socket.gaierror):
+            self.assertFalse(is_allowed_destination('https://hooks.example.com/'))
+
+    def test_command_drains_queue(self):
+        self.endpoint('/ok')
+        self.upsert('pi_1')
+        self.upsert('pi_2')
+
+        out = StringIO()
+        call_command('deliver_webhooks', '--once', stdout=out)
+
+        self.assertEqual(len(self.server.received), 2)
+        self.assertIn("Delivered 2 webhooks", out.getvalue())
+
+
+@override_settings(WEBHOOK_ALLOW_PRIVATE_NETWORKS=False)
+class WebhookEndpointApiTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='merchant', password='testpass123')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_create_and_list(self):
+        response = self.client.post(
+            reverse('webhook-endpoints'), {'url': 'https://93.184.215.14/hooks', 'description': 'ERP'}
+        )
+        self.assertEqual(response.status_code, 201)
+        self.assertTrue(response.data['secret'].startswith('whsec_'))
+
+        response = self.client.get(reverse('webhook-endpoints'))
+        self.assertEqual(len(response.data), 1)
+        self.assertEqual(response.data[0]['description'], 'ERP')
+        self.assertNotIn('secret', response.data[0])
+
+    def test_rejects_insecure_and_private_urls(self):
+        for url in ('http://93.184.215.14/hooks', 'https://127.0.0.1/hooks', 'https://10.0.0.5/hooks'):
+            response = self.client.post(reverse('webhook-endpoints'), {'url': url})
+            self.assertEqual(response.status_code, 400, url)
+        self.assertFalse(WebhookEndpoint.objects.exists())
+
+    @override_settings(WEBHOOK_MAX_ENDPOINTS_PER_USER=1)
+    def test_endpoint_limit(self):
+        WebhookEndpoint.objects.create(user=self.user, url='https://93.184.215.14/a')
+        response = self.client.post(reverse('webhook-endpoints'), {'url': 'https://93.184.215.14/b'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_deliveries_and_delete_are_scoped_to_the_owner(self):
+        other = User.objects.create_user(username='other', password='testpass123')
+        endpoint = WebhookEndpoint.objects.create(user=other, url='https://93.184.215.14/a')
+        WebhookDelivery.objects.create(endpoint=endpoint, event_id='evt_1', event_type='payment.succeeded', payload={})
+
+        self.assertEqual(self.client.get(reverse('webhook-deliveries', args=[endpoint.id])).status_code, 404)
+        self.assertEqual(self.client.delete(reverse('webhook-endpoint-detail', args=[endpoint.id])).status_code, 404)
+
+        self.client.force_authenticate(other)
+        response = self.client.get(reverse('webhook-deliveries', args=[endpoint.id]), {'status': 'pending'})
+        self.assertEqual([delivery['event_id'] for delivery in response.data], ['evt_1'])
+        self.assertEqual(self.client.delete(reverse('webhook-endpoint-detail', args=[endpoint.id])).status_code, 204)
+        self.assertFalse(WebhookDelivery.objects.exists())
@@ -0,0 +1,111 @@
+from io import StringIO
+from smtplib import SMTPServerDisconnected
+from unittest.mock import patch
+
+from django.contrib.auth import get_user_model
+from django.core import mail
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from payments import notifications
+from payments.models import NotificationOutbox, PaymentLink
+from payments.services import upsert_payment
+
+User = get_user_model()
+
+
+class NotificationOutboxTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='merchant', email='merchant@example.com', password='testpass123')
+        self.payment_link = PaymentLink.objects.create(
+            user=self.user, amount_minor=1000, currency='USD', description='Consulting'
+        )
+
+    def upsert(self, stripe_payment_id, status='success'):
+        return upsert_payment(
+            stripe_payment_id,
+            payment_link_unique_id=self.payment_link.unique_id,
+            status=status,
+            fields={'amount_minor': 1000, 'currency': 'USD', 'payment_method': 'card'},
+        )
+
+    def test_queued_once_per_successful_payment(self):
+        self.upsert('pi_1', status='failed')
+        self.assertFalse(NotificationOutbox.objects.exists())
+
+        self.upsert('pi_1')
+        self.upsert('pi_1')
+
+        notification = NotificationOutbox.objects.get()
+        self.assertEqual((notification.kind, notification.status), ('payment_succeeded', 'pending'))
+
+    def test_sends_batch_over_one_connection(self):
+        for index in range(3):
+            self.upsert(f'pi_{index}')
+
+        with patch('payments.notifications.get_connection', wraps=mail.get_connection) as get_connection:
+            self.assertEqual(notifications.dispatch(), 3)
+
+        get_connection.assert_called_once()
+        self.assertEqual(len(mail.outbox), 3)
+        self.assertEqual(mail.outbox[0].to, ['merchant@example.com'])
+        self.assertEqual(mail.outbox[0].subject, 'Payment received: 10.00 USD')
+        self.assertIn('Consulting', mail.outbox[0].body)
+        self.assertEqual(set(NotificationOutbox.objects.values_list('status', flat=True)), {'sent'})
+        self.assertEqual(notifications.dispatch(), 0)
+
+    def test_body_is_not_html_escaped(self):
+        self.payment_link.description = "Tom & Jerry's <b>setup</b>"
+        self.payment_link.save()
+        self.upsert('pi_1')
+
+        notifications.dispatch()
+
+        self.assertIn("(Tom & Jerry's <b>setup</b>)", mail.outbox[0].body)
+        self.assertTrue(mail.outbox[0].body.endswith('Stripe payment: pi_1\n'))
+
+    def test_failed_send_is_retried_later(self):
+        self.upsert('pi_1')
+
+        with patch('django.core.mail.EmailMessage.send', side_effect=SMTPServerDisconnected('gone')):
+            notifications.dispatch()
+
+        notification = NotificationOutbox.objects.get()
+        self.assertEqual((notification.status, notification.attempts), ('pending', 1))
+        self.assertEqual(notification.last_error, 'gone')
+        self.assertGreater(notification.next_attempt_at, timezone.now())
+        # Not due yet
+        self.assertEqual(notifications.dispatch(), 0)
+
+        NotificationOutbox.objects.update(next_attempt_at=timezone.now())
+        notifications.dispatch()
+        self.assertEqual(NotificationOutbox.objects.get().status, 'sent')
+        self.assertEqual(len(mail.outbox), 1)
+
+    @override_settings(NOTIFICATION_MAX_ATTEMPTS=1)
+    def test_gives_up_after_max_attempts(self):
+        self.upsert('pi_1')
+
+        with patch('django.core.mail.EmailMessage.send', side_effect=SMTPServerDisconnected('gone')):
+            notifications.dispatch()
+
+        self.assertEqual(NotificationOutbox.objects.get().status, 'failed')
+
+    def test_skips_merchants_without_email(self):
+        self.user.email = ''
+        self.user.save()
+        self.upsert('pi_1')
+
+        notifications.dispatch()
+
+        self.assertEqual(NotificationOutbox.objects.get().status, 'skipped')
+        self.assertEqual(len(mail.outbox), 0)
+
+    def test_command_drains_outbox(self):
+        self.upsert('pi_1')
+        self.upsert('pi_2')
+
+        call_command('send_notifications', '--once', '--batch-size', '1', stdout=StringIO())
+
+        self.assertEqual(len(mail.outbox), 2)
@@ -0,0 +1,112 @@
+import json
+import marshal
+import os
+import tempfile
+
+from asgiref.sync import async_to_sync
+from django.contrib.auth import get_user_model
+from django.test import AsyncClient, Client, TestCase, override_settings
+from django.urls import reverse
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from payments.models import Payment, PaymentLink
+
+User = get_user_model()
+
+
+class RequestProfilingTest(TestCase):
+    def setUp(self):
+        profile_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(profile_dir.cleanup)
+        self.profile_dir = profile_dir.name
+        settings_override = override_settings(PROFILE_DIR=self.profile_dir, PROFILE_KEEP=2)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        self.client = Client()
+        self.staff = User.objects.create_user(username='staff', password='testpass123', is_staff=True)
+        self.merchant = User.objects.create_user(username='merchant', password='testpass123')
+        link = PaymentLink.objects.create(user=self.staff, amount_minor=1000, currency='USD')
+        Payment.objects.create(
+            payment_link=link, stripe_payment_id='pi_1', amount_minor=1000, currency='USD', status='success'
+        )
+
+    def auth(self, user):
+        return {'HTTP_AUTHORIZATION': f'Bearer {RefreshToken.for_user(user).access_token}'}
+
+    def test_staff_request_is_profiled(self):
+        response = self.client.get(
+            reverse('payment-analytics'), HTTP_X_DEALFLOW_PROFILE='1', **self.auth(self.staff)
+        )
+
+        self.assertEqual(response.status_code, 200)
+        profile_id = response['X-Profile-Id']
+
+        report_response = self.client.get(reverse('profile-report', args=[profile_id]), **self.auth(self.staff))
+        self.assertEqual(report_response['Content-Disposition'], f'attachment; filename="{profile_id}.json"')
+        report = json.loads(b''.join(report_response.streaming_content))
+        self.assertEqual((report['path'], report['user_id'], report['status']), ('/api/analytics/', self.staff.pk, 200))
+        self.assertGreaterEqual(report['sql']['count'], 1)
+        self.assertIn('payments_payment', report['sql']['queries'][-1]['sql'])
+        self.assertTrue(report['sql']['by_statement'])
+        self.assertTrue(any('payment_analytics' in row['function'] for row in report['functions']))
+
+        pstats_response = self.client.get(reverse('profile-pstats', args=[profile_id]), **self.auth(self.staff))
+        self.assertTrue(marshal.loads(b''.join(pstats_response.streaming_content)))
+
+        listed = self.client.get(reverse('profile-list'), **self.auth(self.staff)).json()
+        self.assertEqual([profile['id'] for profile in listed], [profile_id])
+        self.assertEqual(listed[0]['query_count'], report['sql']['count'])
+
+    def test_flag_is_ignored_without_staff(self):
+        response = self.client.get(
+            reverse('payment-analytics'), {'_profile': '1'}, **self.auth(self.merchant)
+        )
+        unflagged = self.client.get(reverse('payment-analytics'), **self.auth(self.staff))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('X-Profile-Id', response)
+        self.assertNotIn('X-Profile-Id', unflagged)
+        self.assertFalse(os.path.exists(self.profile_dir) and os.listdir(self.profile_dir))
+
+    def test_profiles_are_staff_only_and_pruned(self):
+        ids = [
+            self.client.get(reverse('payment-analytics'), {'_profile': '1'}, **self.auth(self.staff))['X-Profile-Id']
+            for _ in range(3)
+        ]
+
+        self.assertEqual(len(os.listdir(self.profile_dir)), 4)
+        self.assertEqual(self.client.get(reverse('profile-report', args=[ids[0]]), **self.auth(self.staff)).status_code, 404)
+        self.assertEqual(self.client.get(reverse('profile-report', args=['..x']), **self.auth(self.staff)).status_code, 404)
+        self.assertEqual(self.client.get(reverse('profile-list'), **self.auth(self.merchant)).status_code, 403)
+        self.assertEqual(
+            self.client.get(reverse('profile-report', args=[ids[2]]), **self.auth(self.merchant)).status_code, 403
+        )
+
+    def test_sync_view_is_profiled_under_asgi(self):
+        async def fetch():
+            return await AsyncClient().get(
+                reverse('payment-analytics'), {'_profile': '1'},
+                headers={'Authorization': self.auth(self.staff)['HTTP_AUTHORIZATION']},
+            )
+
+        response = async_to_sync(fetch)()
+
+        self.assertEqual(response.status_code, 200)
+        with open(os.path.join(self.profile_dir, f"{response['X-Profile-Id']}.json")) as report_file:
+            report = json.load(report_file)
+        # The view ran in a sync_to_async thread, not on the event loop
+        self.assertTrue(any('payment_analytics' in row['function'] for row in report['functions']))
+        self.assertGreaterEqual(report['sql']['count'], 1)
+
+    def test_async_view_is_profiled(self):
+        async def fetch():
+            return await AsyncClient().get(
+                reverse('payment-analytics-async'),
+                headers={'Authorization': self.auth(self.staff)['HTTP_AUTHORIZATION'], 'X-Dealflow-Profile': '1'},
+            )
+
+        response = async_to_sync(fetch)()
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(os.path.exists(os.path.join(self.profile_dir, f"{response['X-Profile-Id']}.json")))
@@ -0,0 +1,164 @@
+from datetime import date, timedelta
+from types import SimpleNamespace
+from unittest.mock import patch, MagicMock
+
+from django.contrib.auth import get_user_model
+from django.http import HttpResponse
+from django.test import TestCase, Client, RequestFactory
+from django.urls import URLPattern, URLResolver, get_resolver, reverse
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from dealflow.querycount import QueryBudgetTestMixin, QueryTrackingMiddleware, get_query_budget, normalize_sql, query_budget
+from payments.models import Payment, PaymentLink
+
+User = get_user_model()
+
+
+def url_callbacks(patterns):
+    for pattern in patterns:
+        if isinstance(pattern, URLResolver):
+            yield from url_callbacks(pattern.url_patterns)
+        elif isinstance(pattern, URLPattern):
+            yield pattern.name, pattern.callback
+
+
+class QueryBudgetTest(QueryBudgetTestMixin, TestCase):
+    """
+    Budgets hold with enough rows that a per-row query would blow them
+    """
+
+    def setUp(self):
+        self.client = Client()
+        self.user = User.objects.create_user(username='testuser', password='testpass123')
+        self.auth_header = f'Bearer {RefreshToken.for_user(self.user).access_token}'
+        self.links = [
+            PaymentLink.objects.create(
+                user=self.user,
+                amount_minor=1000 + index,
+                currency=('USD', 'EUR')[index % 2],
+                expiration_date=date.today() + timedelta(days=7),
+            )
+            for index in range(20)
+        ]
+        for index, link in enumerate(self.links):
+            for attempt, status in enumerate(('success', 'failed', 'pending')):
+                Payment.objects.create(
+                    payment_link=link,
+                    stripe_payment_id=f'pi_{index}_{attempt}',
+                    amount_minor=link.amount_minor,
+                    currency=link.currency,
+                    status=status,
+                    payment_method=('card', 'amazon_pay')[attempt % 2],
+                    failure_code='card_declined' if status == 'failed' else None,
+                )
+
+    def get(self, name, *args, **kwargs):
+        return self.client.get(reverse(name, args=args), kwargs, HTTP_AUTHORIZATION=self.auth_header)
+
+    def test_every_payments_view_declares_a_budget(self):
+        for name, callback in url_callbacks(get_resolver().url_patterns):
+            if callback.__module__.startswith('payments.'):
+                self.assertIsNotNone(get_query_budget(callback), f"{name} has no @query_budget")
+
+    def test_analytics_endpoints(self):
+        for name in (
+            'payment-analytics',
+            'payment-methods-summary',
+            'currency-summary',
+            'list-payment-links',
+            'payment-failures-summary',
+            'dispute-summary',
+            'funnel-summary',
+            'merchant-dashboard',
+            'changes-feed',
+            'payment-analytics-async',
+            'payment-methods-summary-async',
+            'currency-summary-async',
+            'list-payment-links-async',
+        ):
+            with self.subTest(name=name):
+                response = self.assertWithinQueryBudget(lambda: self.get(name))
+                self.assertEqual(response.status_code, 200)
+
+    def test_payment_page(self):
+        response = self.assertWithinQueryBudget(lambda: self.client.get(reverse('payment-page', args=[self.links[0].unique_id])))
+        self.assertEqual(response.status_code, 200)
+
+    @patch('payments.gateway.StripeGateway.create_payment_intent')
+    def test_create_payment_intent(self, mock_create):
+        mock_create.return_value = MagicMock(client_secret='secret')
+        response = self.assertWithinQueryBudget(
+            lambda: self.client.post(reverse('create-payment-intent', args=[self.links[0].unique_id]))
+        )
+        self.assertEqual(response.status_code, 200)
+
+    def test_webhook_updating_existing_payment(self):
+        payment_intent = MagicMock()
+        payment_intent.id = 'pi_0_2'
+        payment_intent.amount = 1000
+        payment_intent.currency = 'usd'
+        payment_intent.payment_method = 'pm_123'
+        payment_intent.customer = 'cus_123'
+        payment_intent.metadata = {'payment_link_id': self.links[0].unique_id}
+        mock_event = MagicMock()
+        mock_event.type = 'payment_intent.succeeded'
+        mock_event.data.object = payment_intent
+
+        with patch('stripe.Webhook.construct_event', return_value=mock_event), \
+                patch('payments.views.stripe_webhooks.get_payment_method_details',
+                      return_value={'type': 'card', 'details': {}}):
+            response = self.assertWithinQueryBudget(lambda: self.client.post(
+                reverse('stripe-webhook'), data={}, content_type='application/json', HTTP_STRIPE_SIGNATURE='dummy_sig'
+            ))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(Payment.objects.get(stripe_payment_id='pi_0_2').status, 'success')
+
+
+class QueryTrackingMiddlewareTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', password='testpass123')
+
+    def run_middleware(self, view):
+        def get_response(request):
+            request.resolver_match = SimpleNamespace(func=view)
+            view(request)
+            return HttpResponse()
+        return QueryTrackingMiddleware(get_response)(RequestFactory().get('/api/analytics/'))
+
+    def test_normalize_sql(self):
+        self.assertEqual(
+            normalize_sql("SELECT * FROM t WHERE id IN (%s, %s, %s) AND name = 'x' LIMIT 21"),
+            "SELECT * FROM t WHERE id IN (...) AND name = ? LIMIT ?",
+        )
+        self.assertEqual(normalize_sql('WHERE id IN (%s)'), normalize_sql('WHERE id IN (%s, %s)'))
+
+    def test_logs_repeated_queries_with_stack(self):
+        def view(request):
+            for _ in range(5):
+                User.objects.get(pk=self.user.pk)
+
+        with self.assertLogs('dealflow.querycount', 'WARNING') as logs:
+            self.run_middleware(view)
+
+        self.assertEqual(len(logs.records), 1)
+        self.assertIn('repeated 5 times', logs.output[0])
+        self.assertIn('test_query_budgets.py', logs.output[0])
+
+    def test_logs_views_over_budget(self):
+        @query_budget(1)
+        def view(request):
+            User.objects.count()
+            User.objects.exists()
+
+        with self.assertLogs('dealflow.querycount', 'WARNING') as logs:
+            self.run_middleware(view)
+
+        self.assertIn('ran 2 queries, over its budget of 1', logs.output[0])
+
+    def test_quiet_within_budget(self):
+        @query_budget(1)
+        def view(request):
+            User.objects.count()
+
+        with self.assertNoLogs('dealflow.querycount', 'WARNING'):
+            self.run_middleware(view)
@@ -0,0 +1,73 @@
+from django.contrib.auth import get_user_model
+from django.test import TestCase, Client, override_settings
+from django.urls import reverse
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from payments.models import Payment, PaymentLink
+
+User = get_user_model()
+
+
+class SearchTest(TestCase):
+    def setUp(self):
+        self.client = Client()
+        self.user = User.objects.create_user(username='testuser', password='testpass123')
+        self.auth_header = f'Bearer {RefreshToken.for_user(self.user).access_token}'
+        self.link = PaymentLink.objects.create(
+            user=self.user, unique_id='link_invoice', amount_minor=1000, currency='USD',
+            description='Annual invoice for ACME',
+        )
+        self.create_payment('pi_1', 'invoice@example.com', 'Jane Doe')
+        self.create_payment('pi_2', 'jane@example.com', 'Invoice Team')
+        self.create_payment('pi_3', 'bob@example.com', 'Bob')
+
+        other = User.objects.create_user(username='other', password='testpass123')
+        PaymentLink.objects.create(user=other, amount_minor=500, currency='USD', description='Invoice')
+
+    def create_payment(self, stripe_payment_id, customer_email, customer_name):
+        return Payment.objects.create(
+            payment_link=self.link,
+            stripe_payment_id=stripe_payment_id,
+            amount_minor=1000,
+            currency='USD',
+            status='success',
+            payment_method='card',
+            customer_email=customer_email,
+            customer_name=customer_name,
+        )
+
+    def search(self, **params):
+        return self.client.get(reverse('search'), params, HTTP_AUTHORIZATION=self.auth_header)
+
+    def test_ranks_exact_then_prefix_then_substring(self):
+        results = self.search(q='invoice').json()['results']
+
+        self.assertEqual(
+            [(result['type'], result['score']) for result in results],
+            [('payment', 0.75), ('payment', 0.75), ('payment_link', 0.5)],
+        )
+        self.assertEqual([result['stripe_payment_id'] for result in results[:2]], ['pi_2', 'pi_1'])
+        self.assertEqual(results[2]['unique_id'], 'link_invoice')
+        self.assertEqual(results[0]['payment_link'], 'link_invoice')
+        self.assertEqual(results[0]['amount'], 10.0)
+
+        exact = self.search(q='bob@example.com').json()['results']
+        self.assertEqual([(result['stripe_payment_id'], result['score']) for result in exact], [('pi_3', 1.0)])
+
+    def test_filters_by_type(self):
+        results = self.search(q='invoice', type='payment_link').json()['results']
+        self.assertEqual([result['type'] for result in results], ['payment_link'])
+
+    def test_paginates_across_types(self):
+        first = self.search(q='invoice', page_size=2).json()
+        self.assertEqual([result['stripe_payment_id'] for result in first['results']], ['pi_2', 'pi_1'])
+        self.assertTrue(first['has_more'])
+
+        second = self.search(q='invoice', page_size=2, page=2).json()
+        self.assertEqual([result['type'] for result in second['results']], ['payment_link'])
+        self.assertFalse(second['has_more'])
+
+    @override_settings(SEARCH_MAX_RESULTS=10)
+    def test_validates_params(self):
+        self.assertIn('q', self.search(q='ab').json())
+        self.assertIn('page', self.search(q='invoice', page=3, page_size=5).json())
@@ -0,0 +1,218 @@
+import asyncio
+import threading
+from unittest.mock import patch
+
+from asgiref.sync import async_to_sync
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import SimpleTestCase, TestCase, override_settings
+
+from dealflow.singleflight import Group, single_flight
+from payments.views import analytics_views
+
+User = get_user_model()
+
+
+def run_threads(count, target):
+    threads = [threading.Thread(target=target) for _ in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(timeout=5)
+
+
+class GroupTest(SimpleTestCase):
+    def setUp(self):
+        self.group = Group('test.group', shared=False)
+        self.calls = 0
+        self.release = threading.Event()
+
+    def slow(self, value):
+        self.calls += 1
+        self.release.wait(timeout=5)
+        return value
+
+    def test_concurrent_callers_share_one_call(self):
+        results = []
+        waiting = threading.Barrier(5, action=lambda: threading.Timer(0.05, self.release.set).start())
+
+        def call():
+            waiting.wait()
+            results.append(self.group.do('key', self.slow, ['rows']))
+
+        run_threads(5, call)
+
+        self.assertEqual(self.calls, 1)
+        self.assertEqual(len(results), 5)
+        self.assertTrue(all(result is results[0] for result in results))
+        stats = self.group.stats()
+        self.assertEqual((stats['executions'], stats['coalesced'], stats['in_flight']), (1, 4, 0))
+
+        # Nothing is kept once the call is over
+        self.assertEqual(self.group.do('key', self.slow, 'again'), 'again')
+        self.assertEqual(self.calls, 2)
+
+    def test_errors_reach_every_waiter(self):
+        errors = []
+        waiting = threading.Barrier(3, action=lambda: threading.Timer(0.05, self.release.set).start())
+
+        def fail():
+            self.calls += 1
+            self.release.wait(timeout=5)
+            raise ValueError("Stripe is down")
+
+        def call():
+            waiting.wait()
+            try:
+                self.group.do('key', fail)
+            except ValueError as e:
+                errors.append(e)
+
+        run_threads(3, call)
+
+        self.assertEqual(self.calls, 1)
+        self.assertEqual(len(errors), 3)
+
+    def test_async_tasks_share_one_call(self):
+        async def scenario():
+            release = asyncio.Event()
+
+            async def slow(value):
+                self.calls += 1
+                await release.wait()
+                return value
+
+            tasks = [asyncio.ensure_future(self.group.ado('key', slow, 'rows')) for _ in range(4)]
+            await asyncio.sleep(0)
+            release.set()
+            return await asyncio.gather(*tasks)
+
+        self.assertEqual(async_to_sync(scenario)(), ['rows'] * 4)
+        self.assertEqual(self.calls, 1)
+
+    def test_cancelled_leader_leaves_the_call_to_waiters(self):
+        async def scenario():
+            started, release = asyncio.Event(), asyncio.Event()
+
+            async def slow(value):
+                self.calls += 1
+                started.set()
+                await release.wait()
+                return value
+
+            leader = asyncio.ensure_future(self.group.ado('key', slow, 'rows'))
+            await started.wait()
+            waiter = asyncio.ensure_future(self.group.ado('key', slow, 'rows'))
+            await asyncio.sleep(0)
+            # The leader's client disconnects
+            leader.cancel()
+            await asyncio.sleep(0)
+            release.set()
+            return leader, await waiter
+
+        leader, result = async_to_sync(scenario)()
+        self.assertTrue(leader.cancelled())
+        self.assertEqual(result, 'rows')
+        self.assertEqual(self.calls, 1)
+
+    def test_call_cancelled_once_every_caller_is(self):
+        async def scenario():
+            started, cancelled = asyncio.Event(), asyncio.Event()
+
+            async def slow():
+                started.set()
+                try:
+                    await asyncio.sleep(5)
+                except asyncio.CancelledError:
+                    cancelled.set()
+                    raise
+
+            callers = [asyncio.ensure_future(self.group.ado('key', slow)) for _ in range(2)]
+            await started.wait()
+            for caller in callers:
+                caller.cancel()
+            await asyncio.wait_for(cancelled.wait(), timeout=5)
+
+        async_to_sync(scenario)()
+        self.assertEqual(self.group.stats()['in_flight'], 0)
+
+    def test_decorator_skips_calls_without_a_key(self):
+        @single_flight(key=lambda value: value or None, shared=False)
+        def echo(value):
+            self.calls += 1
+            return value
+
+        self.assertEqual(echo('rows'), 'rows')
+        self.assertEqual(echo(''), '')
+        self.assertEqual(echo.single_flight.stats()['calls'], 1)
+
+
+@override_settings(SINGLEFLIGHT_SHARED_TIMEOUT=5, SINGLEFLIGHT_POLL_INTERVAL=0.01)
+class SharedGroupTest(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+        self.group = Group('test.shared', shared=True)
+
+    def test_waiters_in_other_workers_take_the_leaders_result(self):
+        # _run_shared skips the in-process map, as a second worker process would
+        started = threading.Event()
+        release = threading.Event()
+        calls = []
+        results = []
+
+        def leader_fn():
+            calls.append('leader')
+            started.set()
+            release.wait(timeout=5)
+            return ['rows']
+
+        leader = threading.Thread(target=lambda: results.append(self.group._run_shared('key', leader_fn, (), {})))
+        leader.start()
+        started.wait(timeout=5)
+        follower = threading.Thread(
+            target=lambda: results.append(self.group._run_shared('key', lambda: calls.append('follower'), (), {}))
+        )
+        follower.start()
+        threading.Timer(0.05, release.set).start()
+        leader.join(timeout=5)
+        follower.join(timeout=5)
+
+        self.assertEqual(calls, ['leader'])
+        self.assertEqual(results, [['rows'], ['rows']])
+        self.assertEqual(self.group.stats()['shared_hits'], 1)
+
+
+class AnalyticsSingleFlightTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='merchant', password='testpass123')
+        self.other = User.objects.create_user(username='other', password='testpass123')
+
+    def test_identical_requests_share_rows(self):
+        release = threading.Event()
+        queries = []
+
+        def rows(user, validated_data):
+            queries.append((user.pk, validated_data.get('currency')))
+            release.wait(timeout=5)
+            return []
+
+        waiting = threading.Barrier(6, action=lambda: threading.Timer(0.05, release.set).start())
+
+        def call(user, params):
+            def run():
+                waiting.wait()
+                analytics_views.payment_analytics_data(user, params)
+            return run
+
+        targets = [call(self.user, {'currency': 'USD'})] * 3 + [call(self.user, {'currency': 'EUR'})] * 2
+        targets.append(call(self.other, {'currency': 'USD'}))
+        with patch.object(analytics_views, 'analytics_rows', rows):
+            threads = [threading.Thread(target=target) for target in targets]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join(timeout=5)
+
+        self.assertEqual(
+            sorted(queries), sorted([(self.user.pk, 'USD'), (self.user.pk, 'EUR'), (self.other.pk, 'USD')])
+        )
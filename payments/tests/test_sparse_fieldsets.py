@@ -0,0 +1,75 @@
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from payments.models import Payment, PaymentLink
+
+User = get_user_model()
+
+
+class SparseFieldsetTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='merchant', password='testpass123')
+        self.client = APIClient()
+        # The async views authenticate the JWT themselves
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {RefreshToken.for_user(self.user).access_token}')
+        self.payment_link = PaymentLink.objects.create(
+            user=self.user, amount_minor=2500, currency='USD', description='A long description'
+        )
+        Payment.objects.create(
+            payment_link=self.payment_link, stripe_payment_id='pi_1', amount_minor=2500,
+            currency='USD', status='success', payment_method='card',
+        )
+        other = User.objects.create_user(username='other', password='testpass123')
+        Payment.objects.create(
+            payment_link=PaymentLink.objects.create(user=other, amount_minor=100, currency='USD'),
+            stripe_payment_id='pi_2', amount_minor=100, currency='USD', status='success',
+        )
+
+    def get(self, name, **params):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse(name), params)
+        return response, queries[-1]['sql']
+
+    def test_analytics_selects_only_requested_columns(self):
+        response, sql = self.get('payment-analytics', fields='status,amount')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data, [{'amount': 25, 'status': 'success'}])
+        self.assertNotIn('JOIN', sql)
+        self.assertNotIn('payment_method', sql)
+
+    def test_analytics_defaults_to_every_field(self):
+        response, sql = self.get('payment-analytics')
+
+        self.assertEqual(list(response.data[0]), [
+            'id', 'amount', 'currency', 'payment_method', 'status', 'created_at', 'payment_link__unique_id',
+        ])
+        self.assertEqual(response.data[0]['payment_link__unique_id'], self.payment_link.unique_id)
+        self.assertIn('JOIN', sql)
+
+    def test_payment_link_list_loads_only_requested_columns(self):
+        response, sql = self.get('list-payment-links', fields='unique_id,payment_url')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(list(response.data[0]), ['unique_id', 'payment_url'])
+        self.assertTrue(response.data[0]['payment_url'].endswith(f'{self.payment_link.unique_id}/'))
+        self.assertNotIn('description', sql)
+
+    def test_async_endpoints_take_fields(self):
+        response = self.client.get(reverse('payment-analytics-async'), {'fields': 'id'})
+        self.assertEqual(response.json(), [{'id': Payment.objects.get(stripe_payment_id='pi_1').id}])
+
+        response = self.client.get(reverse('list-payment-links-async'), {'fields': 'amount'})
+        self.assertEqual(response.json(), [{'amount': '25.00'}])
+
+    def test_unknown_fields_are_rejected(self):
+        for name in ('payment-analytics', 'list-payment-links', 'payment-analytics-async'):
+            with self.subTest(name=name):
+                response = self.client.get(reverse(name), {'fields': 'id,secret'})
+                self.assertEqual(response.status_code, 400)
+                self.assertIn('secret', str(response.json()['fields']))
@@ -125,4 +125,90 @@ class StripeWebhookTest(TestCase):
         payment = Payment.objects.get(stripe_payment_id='pi_123_pending')
         self.assertEqual(payment.status, 'pending')
         self.assertEqual(payment.amount, 10.00)
-        self.assertEqual(payment.currency, 'USD')
\ No newline at end of file
+        self.assertEqual(payment.currency, 'USD')
+
+    def test_payment_failed_fills_failure_columns(self):
+        self.mock_get_payment_details.return_value = {
+            'type': 'card',
+            'details': {'brand': 'visa', 'last4': '0002'},
+            'brand': 'visa',
+            'last4': '0002',
+        }
+
+        mock_payment_intent = MagicMock()
+        mock_payment_intent.id = 'pi_123_failed'
+        mock_payment_intent.amount = 1000
+        mock_payment_intent.currency = 'usd'
+        mock_payment_intent.metadata = {'payment_link_id': self.payment_link.unique_id}
+        mock_payment_intent.last_payment_error = {
+            'code': 'card_declined',
+            'decline_code': 'insufficient_funds',
+            'type': 'card_error',
+            'message': 'Your card has insufficient funds.',
+        }
+
+        mock_event = MagicMock()
+        mock_event.type = 'payment_intent.payment_failed'
+        mock_event.data.object = mock_payment_intent
+        self.mock_construct_event.return_value = mock_event
+
+        response = self.client.post(
+            self.webhook_url,
+            data={},
+            content_type='application/json',
+            HTTP_STRIPE_SIGNATURE='dummy_sig'
+        )
+
+        self.assertEqual(response.status_code, 200)
+        payment = Payment.objects.get(stripe_payment_id='pi_123_failed')
+        self.assertEqual(payment.status, 'failed')
+        self.assertEqual(payment.card_brand, 'visa')
+        self.assertEqual(payment.card_last4, '0002')
+        self.assertEqual(payment.failure_code, 'card_declined')
+        self.assertEqual(payment.decline_code, 'insufficient_funds')
+        self.assertEqual(payment.metadata['error']['decline_code'], 'insufficient_funds')
+
+    def test_stale_failure_keeps_success_details(self):
+        Payment.objects.create(
+            payment_link=self.payment_link,
+            stripe_payment_id='pi_123_retried',
+            amount_minor=1000,
+            currency='USD',
+            status='success',
+            payment_method='card',
+            card_brand='visa',
+            card_last4='4242',
+        )
+        self.mock_get_payment_details.return_value = {
+            'type': 'card',
+            'details': {'brand': 'mastercard', 'last4': '0002'},
+            'brand': 'mastercard',
+            'last4': '0002',
+        }
+
+        mock_payment_intent = MagicMock()
+        mock_payment_intent.id = 'pi_123_retried'
+        mock_payment_intent.amount = 1000
+        mock_payment_intent.currency = 'usd'
+        mock_payment_intent.metadata = {'payment_link_id': self.payment_link.unique_id}
+        mock_payment_intent.last_payment_error = {'code': 'card_declined', 'decline_code': 'insufficient_funds'}
+
+        mock_event = MagicMock()
+        mock_event.type = 'payment_intent.payment_failed'
+        mock_event.data.object = mock_payment_intent
+        self.mock_construct_event.return_value = mock_event
+
+        response = self.client.post(
+            self.webhook_url,
+            data={},
+            content_type='application/json',
+            HTTP_STRIPE_SIGNATURE='dummy_sig'
+        )
+
+        self.assertEqual(response.status_code, 200)
+        payment = Payment.objects.get(stripe_payment_id='pi_123_retried')
+        self.assertEqual(payment.status, 'success')
+        self.assertEqual((payment.card_brand, payment.card_last4), ('visa', '4242'))
+        self.assertIsNone(payment.failure_code)
+        self.assertIsNone(payment.decline_code)
+        self.assertNotIn('error', payment.metadata)
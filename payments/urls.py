@@ -1,5 +1,5 @@
 from django.urls import path
-from .views import payment_views, analytics_views
+from .views import payment_views, analytics_views, async_analytics_views, changes_views, dashboard_views, event_views, search_views, webhook_endpoint_views
 
 urlpatterns = [
     path('payment-links/create/', payment_views.create_payment_link, name='create-payment-link'),
@@ -11,5 +11,30 @@ urlpatterns = [
          name='currency-summary'),
     path('analytics/payment-links/', analytics_views.payment_link_list, 
          name='list-payment-links'),
+    path('analytics/failures/', analytics_views.payment_failures_summary,
+         name='payment-failures-summary'),
+    path('analytics/disputes/', analytics_views.dispute_summary,
+         name='dispute-summary'),
+    path('analytics/funnel/', analytics_views.funnel_summary,
+         name='funnel-summary'),
+    path('analytics/dashboard/', dashboard_views.merchant_dashboard,
+         name='merchant-dashboard'),
+    path('changes/', changes_views.changes_feed, name='changes-feed'),
+    path('events/', event_views.payment_events, name='payment-events'),
+    path('search/', search_views.search, name='search'),
+    path('webhooks/endpoints/', webhook_endpoint_views.webhook_endpoints, name='webhook-endpoints'),
+    path('webhooks/endpoints/<int:endpoint_id>/', webhook_endpoint_views.webhook_endpoint_detail,
+         name='webhook-endpoint-detail'),
+    path('webhooks/endpoints/<int:endpoint_id>/deliveries/', webhook_endpoint_views.webhook_deliveries,
+         name='webhook-deliveries'),
+    path('webhooks/deliveries/<int:delivery_id>/retry/', webhook_endpoint_views.retry_webhook_delivery,
+         name='retry-webhook-delivery'),
+    path('async/analytics/', async_analytics_views.payment_analytics, name='payment-analytics-async'),
+    path('async/analytics/payment-methods/', async_analytics_views.payment_methods_summary,
+         name='payment-methods-summary-async'),
+    path('async/analytics/payments/total/', async_analytics_views.calculate_total_payments,
+         name='currency-summary-async'),
+    path('async/analytics/payment-links/', async_analytics_views.payment_link_list,
+         name='list-payment-links-async'),
    
 ]
\ No newline at end of file
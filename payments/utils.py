@@ -1,14 +1,22 @@
-import requests
-
 from decimal import Decimal
 
 from django.conf import settings
-import stripe
 
-stripe.api_key = settings.STRIPE_SECRET_KEY
+
+def get_stripe():
+    """
+    Import the Stripe SDK on first use and configure it.
+    The SDK alone adds over 100ms to a cold start, so nothing imports it at module level.
+    """
+    import stripe
+
+    stripe.api_key = settings.STRIPE_SECRET_KEY
+    return stripe
+
 
 def convert_to_usd(amount, currency):
     """Static method to convert amount to USD"""
+    import requests
 
     api_url = f'https://api.api-ninjas.com/v1/convertcurrency?have={currency}&want=USD&amount={amount}'
     response = requests.get(api_url, headers={'X-Api-Key': settings.API_NINJA_KEY})
@@ -29,7 +37,9 @@ def get_payment_method_details(payment_intent):
     try:
         # Get the payment method details
         if payment_intent.latest_charge:
-            charge = stripe.Charge.retrieve(payment_intent.latest_charge)
+            from payments.gateway import get_gateway
+
+            charge = get_gateway().retrieve_charge(payment_intent.latest_charge)
             payment_method = charge.payment_method_details.type
             
             # Get additional details based on payment method type
@@ -38,8 +48,8 @@ def get_payment_method_details(payment_intent):
             return {
                 'type': payment_method,
                 'details': details,
-                'brand': getattr(details, 'brand', None),
-                'last4': getattr(details, 'last4', None),
+                'brand': details.get('brand'),
+                'last4': details.get('last4'),
             }
     except Exception as e:
         print("error getting payment method details", e)
@@ -48,4 +58,19 @@ def get_payment_method_details(payment_intent):
     return {
         'type': 'unknown',
         'details': {}
-    }
\ No newline at end of file
+    }
+
+
+def get_payment_error_details(payment_intent):
+    """
+    Extract the fields we keep from payment_intent.last_payment_error
+    """
+    error = payment_intent.last_payment_error
+    if not error:
+        return None
+    return {
+        'code': error.get('code'),
+        'decline_code': error.get('decline_code'),
+        'type': error.get('type'),
+        'message': error.get('message'),
+    }
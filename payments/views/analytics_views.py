@@ -1,24 +1,216 @@
 import logging
+from decimal import Decimal, ROUND_CEILING, ROUND_FLOOR
 
-from django.db.models import Sum, Count, Q, Case, When, CharField, When, Value, F
+from django.conf import settings
+from django.db.models import Sum, Count, Q, F
+from django.db.models.functions import TruncDay, TruncMonth, TruncWeek
 from rest_framework import status
 from rest_framework.decorators import api_view, permission_classes, throttle_classes
 from rest_framework.permissions import IsAuthenticated, AllowAny
 from rest_framework.response import Response
-from datetime import datetime
 
-from payments.models import Payment, PaymentLink as PaymentLinkModel
+from payments.currency import from_minor_units, minor_units_by_exponent
+from payments.models import Payment, PaymentLink as PaymentLinkModel, PaymentLinkFunnel
 from payments.serializers.analytics_serializers import (
+    ANALYTICS_FIELDS,
     AnalyticsQueryParamsSerializer,
+    PaymentAnalyticsQueryParamsSerializer,
     PaymentMethodStatsSerializer,
-    CurrencyStatsSerializer
+    CurrencyStatsSerializer,
+    DisputeQueryParamsSerializer,
+    FailureStatsSerializer,
+    FunnelStatsSerializer,
+    PaymentLinkListQueryParamsSerializer,
 )
 from payments.serializers.payment_serializers import PaymentLinkSerializer
+from dealflow.querycount import query_budget
+from dealflow.singleflight import freeze, single_flight
 from dealflow.throttlers import AnalyticsUserThrottle
 
 
 logger = logging.getLogger(__name__)
 
+# Columns behind each analytics field; amounts are converted with the row's currency
+ANALYTICS_COLUMNS = {'amount': ('amount_minor', 'currency')}
+
+
+def by_user(user, validated_data=None):
+    """
+    Single-flight key: identical concurrent analytics requests from one merchant share a query
+    """
+    return (user.pk, freeze(validated_data or {}))
+
+
+def amount_range_q(start_amount=None, end_amount=None, currencies=None):
+    """
+    Match payments whose major-unit amount is within [start_amount, end_amount].
+    Amounts are stored in minor units, so the bounds are scaled once per currency exponent.
+    """
+    condition = Q()
+    for exponent, codes in minor_units_by_exponent(currencies).items():
+        bounds = Q(currency__in=codes)
+        if start_amount is not None:
+            bounds &= Q(amount_minor__gte=start_amount.scaleb(exponent).to_integral_value(ROUND_CEILING))
+        if end_amount is not None:
+            bounds &= Q(amount_minor__lte=end_amount.scaleb(exponent).to_integral_value(ROUND_FLOOR))
+        condition |= bounds
+    return condition
+
+
+def filter_payments(payments, validated_data):
+    """
+    Apply validated AnalyticsQueryParamsSerializer filters to a Payment queryset
+    """
+    if validated_data.get('start_date'):
+        payments = payments.filter(created_at__gte=validated_data['start_date'])
+    if validated_data.get('end_date'):
+        payments = payments.filter(created_at__lte=validated_data['end_date'])
+    if validated_data.get('currency'):
+        payments = payments.filter(currency=validated_data['currency'])
+    if validated_data.get('payment_method'):
+        payments = payments.filter(payment_method=validated_data['payment_method'])
+    if validated_data.get('start_amount') or validated_data.get('end_amount'):
+        payments = payments.filter(amount_range_q(
+            validated_data.get('start_amount') or None,
+            validated_data.get('end_amount') or None,
+            [validated_data['currency']] if validated_data.get('currency') else None,
+        ))
+    return payments
+
+
+def analytics_rows(user, validated_data):
+    """
+    Lazy queryset of the rows returned by payment_analytics, selecting only the
+    columns behind validated_data['fields']; pass each row through present_analytics_row.
+    Ownership is checked against the user's link ids, so the payment link table is
+    only joined when payment_link__unique_id is requested.
+    """
+    fields = validated_data.get('fields') or ANALYTICS_FIELDS
+    payments = filter_payments(
+        Payment.objects.filter(payment_link__in=PaymentLinkModel.objects.filter(user=user).values('id')),
+        validated_data,
+    )
+    columns = dict.fromkeys(column for field in fields for column in ANALYTICS_COLUMNS.get(field, (field,)))
+    return payments.values(*columns)
+
+
+def present_analytics_row(row, fields=ANALYTICS_FIELDS):
+    """
+    Pick `fields` from a row, replacing the stored minor units with the decimal amount clients expect
+    """
+    presented = {}
+    for field in fields:
+        if field == 'amount':
+            presented['amount'] = from_minor_units(row['amount_minor'], row['currency'])
+        else:
+            presented[field] = row[field]
+    return presented
+
+
+def from_columns(user, query, *args):
+    """
+    Answer from the in-memory columns (payments.columnar) for the merchants in
+    COLUMNAR_CACHE_USER_IDS, with MerchantColumns.<query>(*args). None means use SQL.
+    """
+    if user.pk not in settings.COLUMNAR_CACHE_USER_IDS:
+        return None
+    try:
+        # NumPy only has to be installed where the cache is used
+        from payments.columnar import columnar_cache
+    except ImportError as e:
+        logger.error(f"Columnar analytics cache unavailable: {str(e)}")
+        return None
+    return columnar_cache.query(user.pk, query, *args)
+
+
+@single_flight(key=by_user)
+def payment_analytics_data(user, validated_data):
+    fields = validated_data.get('fields') or ANALYTICS_FIELDS
+    rows = from_columns(user, 'analytics', validated_data, fields)
+    if rows is not None:
+        return rows
+    return [present_analytics_row(row, fields) for row in analytics_rows(user, validated_data)]
+
+
+def payment_methods_queryset(user):
+    """
+    Per (payment_method, currency) sums in minor units; fold with summarize_payment_methods
+    """
+    return Payment.objects.filter(payment_link__user=user).values('payment_method', 'currency').annotate(
+        count=Count('id'),
+        total_amount_minor=Sum('amount_minor'),
+        success_count=Count('id', filter=Q(status='success')),
+        failed_count=Count('id', filter=Q(status='failed'))
+    ).order_by()
+
+
+def summarize_payment_methods(rows):
+    """
+    Fold per-currency rows into one row per payment method, converting each
+    currency's integer sum with its own exponent
+    """
+    summary = {}
+    for row in rows:
+        method = summary.setdefault(row['payment_method'], {
+            'payment_method': row['payment_method'],
+            'count': 0,
+            'total_amount': Decimal('0'),
+            'success_count': 0,
+            'failed_count': 0,
+        })
+        method['count'] += row['count']
+        method['total_amount'] += from_minor_units(row['total_amount_minor'] or 0, row['currency'])
+        method['success_count'] += row['success_count']
+        method['failed_count'] += row['failed_count']
+    return sorted(summary.values(), key=lambda method: method['total_amount'], reverse=True)
+
+
+@single_flight(key=by_user)
+def payment_methods_data(user):
+    rows = from_columns(user, 'payment_method_rows')
+    return summarize_payment_methods(payment_methods_queryset(user) if rows is None else rows)
+
+
+def currency_totals_queryset(user):
+    """
+    Successful payment sums per currency in minor units; convert with summarize_currency_totals
+    """
+    return Payment.objects.filter(payment_link__user=user, status='success').values('currency').annotate(
+        count=Count('id'),
+        total_amount_minor=Sum('amount_minor')
+    ).order_by()
+
+
+def summarize_currency_totals(rows):
+    summary = [
+        {
+            'currency': row['currency'],
+            'count': row['count'],
+            'total_amount': from_minor_units(row['total_amount_minor'] or 0, row['currency']),
+        }
+        for row in rows
+    ]
+    return sorted(summary, key=lambda currency: currency['total_amount'], reverse=True)
+
+
+@single_flight(key=by_user)
+def currency_totals_data(user):
+    rows = from_columns(user, 'currency_total_rows')
+    return summarize_currency_totals(currency_totals_queryset(user) if rows is None else rows)
+
+
+def payment_links_queryset(user, status=None, fields=None):
+    """
+    The user's links, newest first; with `fields`, only the columns those serializer fields read are loaded
+    """
+    payment_links = PaymentLinkModel.objects.filter(user=user)
+    if status is not None:
+        payment_links = payment_links.filter(status=status)
+    if fields is not None:
+        payment_links = payment_links.only(*PaymentLinkSerializer.columns_for(fields))
+    return payment_links.order_by('-created_at')
+
+@query_budget(3)
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 @throttle_classes([AnalyticsUserThrottle])
@@ -28,32 +220,12 @@ def payment_analytics(request):
     """
     # Validate query parameters
     logger.info(f"Received request for payment analytics: {request.GET}")
-    query_serializer = AnalyticsQueryParamsSerializer(data=request.GET)
+    query_serializer = PaymentAnalyticsQueryParamsSerializer(data=request.GET)
     if not query_serializer.is_valid():
         return Response(query_serializer.errors, status=status.HTTP_400_BAD_REQUEST)
     
     try:
-        # Base queryset
-        payments = Payment.objects.filter(payment_link__user=request.user)
-        # Apply validated filters
-        validated_data = query_serializer.validated_data
-        
-        if validated_data.get('start_date'):
-            payments = payments.filter(created_at__gte=validated_data['start_date'])
-        if validated_data.get('end_date'):
-            payments = payments.filter(created_at__lte=validated_data['end_date'])
-        if validated_data.get('currency'):
-            payments = payments.filter(currency=validated_data['currency'])
-        if validated_data.get('payment_method'):
-            payments = payments.filter(payment_method=validated_data['payment_method'])
-        if validated_data.get('start_amount'):
-            print(validated_data['start_amount'])
-            payments = payments.filter(amount__gte=validated_data['start_amount'])
-        if validated_data.get('end_amount'):
-            payments = payments.filter(amount__lte=validated_data['end_amount'])
-       
-        analytics_data = payments.values('id','amount','currency','payment_method','status','created_at','payment_link__unique_id')
-        return Response(analytics_data)
+        return Response(payment_analytics_data(request.user, query_serializer.validated_data))
 
     except Exception as e:
         logger.error(f"Error fetching payment analytics: {str(e)}")
@@ -64,6 +236,7 @@ def payment_analytics(request):
     
 
 
+@query_budget(2)
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 @throttle_classes([AnalyticsUserThrottle])
@@ -73,17 +246,10 @@ def payment_methods_summary(request):
     """
     try:
         logger.info(f"Received request for payment methods summary: {request.user}")
-        payments = Payment.objects.filter(payment_link__user=request.user)
-        
-        summary = payments.values('payment_method').annotate(
-            count=Count('id'),
-            total_amount=Sum('amount'),
-            success_count=Count('id', filter=Q(status='success')),
-            failed_count=Count('id', filter=Q(status='failed'))
-        ).order_by('-total_amount')
+        summary = payment_methods_data(request.user)
 
         # Validate response
-        serializer = PaymentMethodStatsSerializer(data=list(summary), many=True)
+        serializer = PaymentMethodStatsSerializer(data=summary, many=True)
         serializer.is_valid(raise_exception=True)
         
         return Response(serializer.validated_data)
@@ -96,6 +262,7 @@ def payment_methods_summary(request):
         }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 
+@query_budget(2)
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 @throttle_classes([AnalyticsUserThrottle])
@@ -105,15 +272,10 @@ def calculate_total_payments(request):
     """
     try:
         logger.info(f"Received request for total payments: {request.user}")
-        payments = Payment.objects.filter(payment_link__user=request.user, status='success')
-        
-        summary = payments.values('currency').annotate(
-            count=Count('id'),
-            total_amount=Sum('amount')
-        ).order_by('-total_amount')
+        summary = currency_totals_data(request.user)
 
         # Validate response
-        serializer = CurrencyStatsSerializer(data=list(summary), many=True)
+        serializer = CurrencyStatsSerializer(data=summary, many=True)
         serializer.is_valid(raise_exception=True)
         
         return Response(serializer.validated_data)
@@ -126,6 +288,7 @@ def calculate_total_payments(request):
         }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
     
 
+@query_budget(2)
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 @throttle_classes([AnalyticsUserThrottle])
@@ -135,28 +298,16 @@ def payment_link_list(request):
     """
     try:
         logger.info(f"Received request for payment links: {request.user}")
-        
-        # Get current datetime for comparison
-        current_date = datetime.now().date()
-        
-        payment_links = PaymentLinkModel.objects.filter(user=request.user).annotate(
-            is_expired=Case(
-                When(expiration_date__lt=current_date, then=True),
-            default=False,
-            output_field=CharField(),
-        )
-        ).annotate(
-            status=Case(
-                When(is_expired=True, then=Value('expired')),
-            default=Value('active'),
-            output_field=CharField(),
-            )
-        ).order_by('-created_at')
-
+        query_serializer = PaymentLinkListQueryParamsSerializer(data=request.GET)
+        if not query_serializer.is_valid():
+            return Response(query_serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        params = query_serializer.validated_data
+        payment_links = payment_links_queryset(request.user, params.get('status'), params.get('fields'))
 
         serializer = PaymentLinkSerializer(
             payment_links,
             many=True,
+            fields=params.get('fields'),
             context={'request': request}
         )
 
@@ -172,6 +323,168 @@ def payment_link_list(request):
         }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 
+@single_flight(key=by_user)
+def failure_stats(user, validated_data):
+    payments = filter_payments(Payment.objects.filter(payment_link__user=user, status='failed'), validated_data)
+    return list(payments.values('failure_code', 'decline_code', 'card_brand').annotate(
+        count=Count('id')
+    ).order_by('-count', 'failure_code', 'decline_code', 'card_brand'))
+
+
+@query_budget(2)
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+@throttle_classes([AnalyticsUserThrottle])
+def payment_failures_summary(request):
+    """
+    Break down failed payments by decline code and card brand
+    """
+    query_serializer = AnalyticsQueryParamsSerializer(data=request.GET)
+    if not query_serializer.is_valid():
+        return Response(query_serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+    try:
+        logger.info(f"Received request for payment failures summary: {request.user}")
+        summary = failure_stats(request.user, query_serializer.validated_data)
+
+        serializer = FailureStatsSerializer(data=summary, many=True)
+        serializer.is_valid(raise_exception=True)
+
+        return Response(serializer.validated_data)
+
+    except Exception as e:
+        logger.error(f"Error fetching payment failures summary: {str(e)}")
+        return Response({
+            "error": "Failed to fetch payment failures summary",
+            "detail": str(e)
+        }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+@single_flight(key=by_user)
+def dispute_stats(user, validated_data):
+    """
+    Dispute count, amount per currency and rate for each period.
+    Disputed rows are read through the partial payment_disputed_idx index;
+    the rate's denominator counts successful payments created in the same period.
+    """
+    trunc = {'day': TruncDay, 'week': TruncWeek, 'month': TruncMonth}[validated_data['period']]
+    disputes = Payment.objects.filter(payment_link__user=user, is_disputed=True)
+    payments = Payment.objects.filter(payment_link__user=user, status='success')
+    if validated_data.get('start_date'):
+        disputes = disputes.filter(dispute_created_at__date__gte=validated_data['start_date'])
+        payments = payments.filter(created_at__date__gte=validated_data['start_date'])
+    if validated_data.get('end_date'):
+        disputes = disputes.filter(dispute_created_at__date__lte=validated_data['end_date'])
+        payments = payments.filter(created_at__date__lte=validated_data['end_date'])
+
+    periods = {}
+
+    def period_row(period):
+        return periods.setdefault(period, {
+            'period': period,
+            'payment_count': 0,
+            'dispute_count': 0,
+            'won_count': 0,
+            'lost_count': 0,
+            'dispute_amounts': {},
+        })
+
+    dispute_rows = disputes.annotate(period=trunc('dispute_created_at')).values('period', 'currency').annotate(
+        count=Count('id'),
+        amount_minor=Sum('dispute_amount_minor'),
+        won_count=Count('id', filter=Q(dispute_status='won')),
+        lost_count=Count('id', filter=Q(dispute_status='lost')),
+    ).order_by()
+    for row in dispute_rows:
+        stats = period_row(row['period'])
+        stats['dispute_count'] += row['count']
+        stats['won_count'] += row['won_count']
+        stats['lost_count'] += row['lost_count']
+        stats['dispute_amounts'][row['currency']] = from_minor_units(row['amount_minor'] or 0, row['currency'])
+
+    payment_rows = payments.annotate(period=trunc('created_at')).values('period').annotate(
+        count=Count('id')
+    ).order_by()
+    for row in payment_rows:
+        period_row(row['period'])['payment_count'] = row['count']
+
+    for stats in periods.values():
+        stats['dispute_rate'] = (
+            round(stats['dispute_count'] / stats['payment_count'], 4) if stats['payment_count'] else None
+        )
+    return sorted(periods.values(), key=lambda stats: stats['period'])
+
+
+@query_budget(3)
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+@throttle_classes([AnalyticsUserThrottle])
+def dispute_summary(request):
+    """
+    Dispute rate and disputed amounts per period
+    """
+    query_serializer = DisputeQueryParamsSerializer(data=request.GET)
+    if not query_serializer.is_valid():
+        return Response(query_serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+    try:
+        logger.info(f"Received request for dispute summary: {request.user}")
+        return Response(dispute_stats(request.user, query_serializer.validated_data))
+
+    except Exception as e:
+        logger.error(f"Error fetching dispute summary: {str(e)}")
+        return Response({
+            "error": "Failed to fetch dispute summary",
+            "detail": str(e)
+        }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+def _rate(numerator, denominator):
+    return round(numerator / denominator, 4) if denominator else None
+
+
+@single_flight(key=by_user)
+def funnel_stats(user):
+    funnels = PaymentLinkFunnel.objects.filter(payment_link__user=user).values(
+        'payment_link__unique_id', 'page_views', 'intents_created', 'successes', 'failures', 'updated_at',
+    ).order_by('-page_views', 'payment_link__unique_id')
+    return [
+        {
+            **row,
+            'payment_link': row['payment_link__unique_id'],
+            'intent_rate': _rate(row['intents_created'], row['page_views']),
+            'conversion_rate': _rate(row['successes'], row['page_views']),
+        }
+        for row in funnels
+    ]
+
+
+@query_budget(2)
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+@throttle_classes([AnalyticsUserThrottle])
+def funnel_summary(request):
+    """
+    Checkout funnel and conversion rates per payment link.
+    Counts are flushed by each worker every few seconds, so the latest events may be missing.
+    """
+    try:
+        logger.info(f"Received request for funnel summary: {request.user}")
+        summary = funnel_stats(request.user)
+        serializer = FunnelStatsSerializer(data=summary, many=True)
+        serializer.is_valid(raise_exception=True)
+
+        return Response(serializer.validated_data)
+
+    except Exception as e:
+        logger.error(f"Error fetching funnel summary: {str(e)}")
+        return Response({
+            "error": "Failed to fetch funnel summary",
+            "detail": str(e)
+        }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+@query_budget(0)
 @api_view(['GET'])
 @permission_classes([AllowAny])
 def health_check(request):
@@ -0,0 +1,160 @@
+"""
+Native async versions of the analytics endpoints.
+
+Under the uvicorn workers these run on the event loop instead of being pushed
+through a thread per request. Querysets are shared with analytics_views so both
+variants always return the same data.
+"""
+import logging
+
+from asgiref.sync import sync_to_async
+
+from dealflow.async_api import api_response, async_api_view
+from dealflow.querycount import query_budget
+from dealflow.singleflight import single_flight
+from dealflow.throttlers import AnalyticsUserThrottle
+from payments.serializers.analytics_serializers import (
+    ANALYTICS_FIELDS,
+    PaymentAnalyticsQueryParamsSerializer,
+    PaymentMethodStatsSerializer,
+    CurrencyStatsSerializer,
+    PaymentLinkListQueryParamsSerializer,
+)
+from payments.serializers.payment_serializers import PaymentLinkSerializer
+from payments.views.analytics_views import (
+    analytics_rows,
+    by_user,
+    currency_totals_queryset,
+    from_columns,
+    payment_links_queryset,
+    payment_methods_queryset,
+    present_analytics_row,
+    summarize_currency_totals,
+    summarize_payment_methods,
+)
+
+logger = logging.getLogger(__name__)
+
+
+@single_flight(key=by_user)
+async def payment_analytics_data(user, validated_data):
+    fields = validated_data.get('fields') or ANALYTICS_FIELDS
+    rows = await sync_to_async(from_columns)(user, 'analytics', validated_data, fields)
+    if rows is not None:
+        return rows
+    return [present_analytics_row(row, fields) async for row in analytics_rows(user, validated_data).aiterator()]
+
+
+@single_flight(key=by_user)
+async def payment_methods_data(user):
+    rows = await sync_to_async(from_columns)(user, 'payment_method_rows')
+    if rows is None:
+        rows = [row async for row in payment_methods_queryset(user).aiterator()]
+    return summarize_payment_methods(rows)
+
+
+@single_flight(key=by_user)
+async def currency_totals_data(user):
+    rows = await sync_to_async(from_columns)(user, 'currency_total_rows')
+    if rows is None:
+        rows = [row async for row in currency_totals_queryset(user).aiterator()]
+    return summarize_currency_totals(rows)
+
+
+@query_budget(2)
+@async_api_view(throttle_classes=[AnalyticsUserThrottle])
+async def payment_analytics(request):
+    """
+    Get payment analytics with validated filters
+    """
+    logger.info(f"Received async request for payment analytics: {request.GET}")
+    query_serializer = PaymentAnalyticsQueryParamsSerializer(data=request.GET)
+    if not query_serializer.is_valid():
+        return api_response(query_serializer.errors, status=400)
+
+    try:
+        return api_response(await payment_analytics_data(request.user, query_serializer.validated_data))
+
+    except Exception as e:
+        logger.error(f"Error fetching payment analytics: {str(e)}")
+        return api_response({
+            "error": "Failed to fetch analytics",
+            "detail": str(e)
+        }, status=500)
+
+
+@query_budget(2)
+@async_api_view(throttle_classes=[AnalyticsUserThrottle])
+async def payment_methods_summary(request):
+    """
+    Get validated summary of payment methods
+    """
+    try:
+        logger.info(f"Received async request for payment methods summary: {request.user}")
+        summary = await payment_methods_data(request.user)
+
+        serializer = PaymentMethodStatsSerializer(data=summary, many=True)
+        serializer.is_valid(raise_exception=True)
+        return api_response(serializer.validated_data)
+
+    except Exception as e:
+        logger.error(f"Error fetching payment methods summary: {str(e)}")
+        return api_response({
+            "error": "Failed to fetch payment methods summary",
+            "detail": str(e)
+        }, status=500)
+
+
+@query_budget(2)
+@async_api_view(throttle_classes=[AnalyticsUserThrottle])
+async def calculate_total_payments(request):
+    """
+    Get validated currency summary
+    """
+    try:
+        logger.info(f"Received async request for total payments: {request.user}")
+        summary = await currency_totals_data(request.user)
+
+        serializer = CurrencyStatsSerializer(data=summary, many=True)
+        serializer.is_valid(raise_exception=True)
+        return api_response(serializer.validated_data)
+
+    except Exception as e:
+        logger.error(f"Error fetching currency summary: {str(e)}")
+        return api_response({
+            "error": "Failed to fetch currency summary",
+            "detail": str(e)
+        }, status=500)
+
+
+@query_budget(2)
+@async_api_view(throttle_classes=[AnalyticsUserThrottle])
+async def payment_link_list(request):
+    """
+    List all payment links for the authenticated user
+    """
+    try:
+        logger.info(f"Received async request for payment links: {request.user}")
+        query_serializer = PaymentLinkListQueryParamsSerializer(data=request.GET)
+        if not query_serializer.is_valid():
+            return api_response(query_serializer.errors, status=400)
+        params = query_serializer.validated_data
+        payment_links = [
+            link async for link in
+            payment_links_queryset(request.user, params.get('status'), params.get('fields')).aiterator()
+        ]
+
+        serializer = PaymentLinkSerializer(
+            payment_links,
+            many=True,
+            fields=params.get('fields'),
+            context={'request': request}
+        )
+        return api_response(serializer.data)
+
+    except Exception as e:
+        logger.error(f"Error fetching payment links: {str(e)}")
+        return api_response({
+            "error": "Failed to fetch payment links",
+            "detail": str(e)
+        }, status=500)
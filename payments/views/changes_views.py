@@ -0,0 +1,194 @@
+"""
+Incremental changes feed of a user's payments and payment links.
+
+Rows are returned in (updated_at, id) order after an opaque cursor that stores
+the last position reached in each table. Rows changed in the last
+CHANGES_FEED_LAG seconds are held back: updated_at is set before commit, so a
+slow transaction could otherwise commit a row behind a cursor that already
+passed it. Every write to these models must go through save() or set
+updated_at explicitly, or the change will not show up in the feed.
+Deleted rows are not reported.
+"""
+import heapq
+import logging
+from datetime import timedelta
+from itertools import islice
+
+from django.conf import settings
+from django.db.models import Q
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.decorators import api_view, permission_classes, throttle_classes
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
+from rest_framework.utils.encoders import JSONEncoder
+
+from dealflow.querycount import query_budget
+from dealflow.throttlers import AnalyticsUserThrottle
+from payments.currency import from_minor_units
+from payments.models import Payment, PaymentLink
+from payments.serializers.changes_serializers import ChangesQueryParamsSerializer, encode_cursor
+
+logger = logging.getLogger(__name__)
+
+PAYMENT_FIELDS = (
+    'id', 'stripe_payment_id', 'amount_minor', 'currency', 'status', 'payment_method',
+    'customer_email', 'customer_name', 'card_brand', 'card_last4', 'failure_code',
+    'decline_code', 'is_disputed', 'dispute_status', 'created_at', 'updated_at',
+)
+PAYMENT_LINK_FIELDS = (
+    'id', 'unique_id', 'amount_minor', 'currency', 'description', 'status', 'expiration_date',
+    'created_at', 'updated_at',
+)
+ITERATOR_CHUNK_SIZE = 2000
+
+
+def after(position):
+    if position is None:
+        return Q()
+    updated_at, pk = position
+    return Q(updated_at__gt=updated_at) | Q(updated_at=updated_at, id__gt=pk)
+
+
+def present_change(kind, row):
+    change = {'type': kind, **row}
+    change['amount'] = from_minor_units(change.pop('amount_minor'), row['currency'])
+    if 'payment_link__unique_id' in change:
+        change['payment_link'] = change.pop('payment_link__unique_id')
+    return change
+
+
+def change_querysets(user, positions, until):
+    # Payments are read per link of the user, through (payment_link, updated_at, id), and then
+    # sorted, so a sync costs the merchant's own changes rather than every merchant's
+    payments = Payment.objects.filter(
+        after(positions.get('payment')), payment_link__user=user, updated_at__lte=until
+    ).order_by('updated_at', 'id').values(*PAYMENT_FIELDS, 'payment_link__unique_id')
+    payment_links = PaymentLink.objects.filter(
+        after(positions.get('payment_link')), user=user, updated_at__lte=until
+    ).order_by('updated_at', 'id').values(*PAYMENT_LINK_FIELDS)
+    return {'payment': payments, 'payment_link': payment_links}
+
+
+def change_key(change):
+    return change['updated_at'], change['type'], change['id']
+
+
+def change_stream(user, positions, until):
+    """
+    Changed payments and payment links merged into one (updated_at, type, id) ordered iterator
+    """
+    def changes(kind, queryset):
+        for row in queryset.iterator(chunk_size=ITERATOR_CHUNK_SIZE):
+            yield present_change(kind, row)
+
+    querysets = change_querysets(user, positions, until)
+    return heapq.merge(*(changes(kind, queryset) for kind, queryset in querysets.items()), key=change_key)
+
+
+async def achange_stream(user, positions, until):
+    """
+    change_stream over the async ORM
+    """
+    async def changes(kind, queryset):
+        async for row in queryset.aiterator(chunk_size=ITERATOR_CHUNK_SIZE):
+            yield present_change(kind, row)
+
+    payments, payment_links = (
+        changes(kind, queryset) for kind, queryset in change_querysets(user, positions, until).items()
+    )
+    try:
+        payment = await anext(payments, None)
+        payment_link = await anext(payment_links, None)
+        # Two-way merge; like heapq.merge, ties go to the first iterator
+        while payment is not None or payment_link is not None:
+            if payment_link is None or (payment is not None and change_key(payment) <= change_key(payment_link)):
+                yield payment
+                payment = await anext(payments, None)
+            else:
+                yield payment_link
+                payment_link = await anext(payment_links, None)
+    finally:
+        await payments.aclose()
+        await payment_links.aclose()
+
+
+def changes_page(user, positions, limit):
+    """
+    Yield up to `limit` changes, then a final dict with the next cursor and has_more
+    """
+    positions = dict(positions)
+    until = timezone.now() - timedelta(seconds=settings.CHANGES_FEED_LAG)
+    stream = change_stream(user, positions, until)
+    for change in islice(stream, limit):
+        positions[change['type']] = (change['updated_at'], change['id'])
+        yield change
+    yield {
+        'next_cursor': encode_cursor(positions),
+        'has_more': next(stream, None) is not None,
+    }
+
+
+async def achanges_page(user, positions, limit):
+    """
+    changes_page over the async ORM, so a streamed page is sent as it is read
+    """
+    positions = dict(positions)
+    until = timezone.now() - timedelta(seconds=settings.CHANGES_FEED_LAG)
+    stream = achange_stream(user, positions, until)
+    try:
+        for _ in range(limit):
+            change = await anext(stream, None)
+            if change is None:
+                break
+            positions[change['type']] = (change['updated_at'], change['id'])
+            yield change
+        yield {
+            'next_cursor': encode_cursor(positions),
+            'has_more': await anext(stream, None) is not None,
+        }
+    finally:
+        await stream.aclose()
+
+
+async def ndjson(items):
+    encoder = JSONEncoder()
+    async for item in items:
+        yield encoder.encode(item) + '\n'
+
+
+@query_budget(3)
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+@throttle_classes([AnalyticsUserThrottle])
+def changes_feed(request):
+    """
+    Payments and payment links changed since `cursor`, oldest first.
+    Pass the returned next_cursor to get the following changes; with stream=true
+    the changes are streamed as NDJSON, one per line, and the last line holds the cursor.
+    """
+    query_serializer = ChangesQueryParamsSerializer(data=request.GET)
+    if not query_serializer.is_valid():
+        return Response(query_serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+    params = query_serializer.validated_data
+    logger.info(f"Received request for changes feed: {request.user}")
+
+    if params['stream']:
+        # Served under ASGI, where Django would read a sync iterator into memory before sending it
+        return StreamingHttpResponse(
+            ndjson(achanges_page(request.user, params.get('cursor', {}), params['limit'])),
+            content_type='application/x-ndjson',
+        )
+
+    try:
+        *results, page_info = changes_page(request.user, params.get('cursor', {}), params['limit'])
+        return Response({'results': results, **page_info})
+
+    except Exception as e:
+        logger.error(f"Error fetching changes feed: {str(e)}")
+        return Response({
+            "error": "Failed to fetch changes",
+            "detail": str(e)
+        }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
@@ -0,0 +1,283 @@
+"""
+Merchant dashboard: the analytics summaries for a period and the one before it,
+computed from a single SQL statement.
+
+On PostgreSQL the statement groups the scanned payments by GROUPING SETS; other
+backends get the same rows from a UNION ALL of the grouped queries.
+"""
+import logging
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+
+from django.db import connection
+from django.db.models import BooleanField, Case, CharField, Count, F, IntegerField, Q, Sum, Value, When
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.decorators import api_view, permission_classes, throttle_classes
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
+
+from dealflow.querycount import query_budget
+from dealflow.singleflight import single_flight
+from dealflow.throttlers import AnalyticsUserThrottle
+from payments.currency import from_minor_units
+from payments.models import Payment, PaymentLink
+from payments.serializers.analytics_serializers import DashboardQueryParamsSerializer
+from payments.views.analytics_views import by_user, summarize_payment_methods
+
+logger = logging.getLogger(__name__)
+
+TOP_LINKS = 10
+
+ROW_FIELDS = (
+    'grouping', 'is_current', 'currency', 'method', 'link_id', 'link_unique_id',
+    'count', 'success_count', 'failed_count', 'total_amount_minor', 'success_amount_minor',
+)
+
+# GROUPING(payment_method, payment_link_id) is a bitmask of the columns left out of the set
+GROUPING_SETS_SQL = """
+WITH scoped AS (
+    SELECT
+        p.created_at >= %(current_start)s AS is_current,
+        p.currency,
+        p.payment_method,
+        p.payment_link_id,
+        l.unique_id AS link_unique_id,
+        p.status,
+        p.amount_minor
+    FROM {payment_table} p
+    JOIN {link_table} l ON l.id = p.payment_link_id
+    WHERE l.user_id = %(user_id)s
+      AND p.created_at >= %(previous_start)s
+      AND p.created_at < %(end)s
+)
+SELECT
+    CASE GROUPING(payment_method, payment_link_id)
+        WHEN 1 THEN 'method'
+        WHEN 2 THEN 'link'
+        ELSE 'currency'
+    END AS grouping,
+    is_current,
+    currency,
+    payment_method AS method,
+    payment_link_id AS link_id,
+    link_unique_id,
+    COUNT(*) AS count,
+    COUNT(*) FILTER (WHERE status = 'success') AS success_count,
+    COUNT(*) FILTER (WHERE status = 'failed') AS failed_count,
+    COALESCE(SUM(amount_minor), 0) AS total_amount_minor,
+    COALESCE(SUM(amount_minor) FILTER (WHERE status = 'success'), 0) AS success_amount_minor
+FROM scoped
+GROUP BY GROUPING SETS (
+    (is_current, currency),
+    (is_current, currency, payment_method),
+    (is_current, currency, payment_link_id, link_unique_id)
+)
+"""
+
+
+def dashboard_window(validated_data):
+    """
+    The requested period as [current_start, end) and the equally long period before it
+    """
+    days = validated_data['days']
+    end_date = validated_data.get('end_date') or timezone.localdate()
+    end = timezone.make_aware(datetime.combine(end_date + timedelta(days=1), time.min))
+    current_start = end - timedelta(days=days)
+    return {
+        'previous_start': current_start - timedelta(days=days),
+        'current_start': current_start,
+        'end': end,
+    }
+
+
+def grouping_sets_rows(user, window):
+    sql = GROUPING_SETS_SQL.format(
+        payment_table=connection.ops.quote_name(Payment._meta.db_table),
+        link_table=connection.ops.quote_name(PaymentLink._meta.db_table),
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, {'user_id': user.pk, **window})
+        return [dict(zip(ROW_FIELDS, row)) for row in cursor.fetchall()]
+
+
+def union_rows(user, window):
+    """
+    Same rows as grouping_sets_rows, from one UNION ALL statement
+    """
+    scoped = Payment.objects.filter(
+        payment_link__user=user,
+        created_at__gte=window['previous_start'],
+        created_at__lt=window['end'],
+    ).annotate(
+        is_current=Case(
+            When(created_at__gte=window['current_start'], then=Value(True)),
+            default=Value(False),
+            output_field=BooleanField(),
+        ),
+    )
+    aggregates = {
+        'count': Count('id'),
+        'success_count': Count('id', filter=Q(status='success')),
+        'failed_count': Count('id', filter=Q(status='failed')),
+        'total_amount_minor': Coalesce(Sum('amount_minor'), 0),
+        'success_amount_minor': Coalesce(Sum('amount_minor', filter=Q(status='success')), 0),
+    }
+
+    def grouped(grouping, **columns):
+        columns = {
+            'method': Value(None, output_field=CharField()),
+            'link_id': Value(None, output_field=IntegerField()),
+            'link_unique_id': Value(None, output_field=CharField()),
+            **columns,
+        }
+        return scoped.annotate(grouping=Value(grouping), **columns).values(
+            'grouping', 'is_current', 'currency', 'method', 'link_id', 'link_unique_id',
+        ).annotate(**aggregates).order_by()
+
+    by_currency = grouped('currency')
+    by_method = grouped('method', method=F('payment_method'))
+    by_link = grouped('link', link_id=F('payment_link_id'), link_unique_id=F('payment_link__unique_id'))
+    return list(by_currency.union(by_method, by_link, all=True))
+
+
+@single_flight(key=by_user)
+def dashboard_rows(user, window):
+    if connection.vendor == 'postgresql':
+        return grouping_sets_rows(user, window)
+    return union_rows(user, window)
+
+
+def change(current, previous):
+    """
+    Relative change from the previous period, None when there is nothing to compare with
+    """
+    if not previous:
+        return None
+    return round(float((current - previous) / previous), 4)
+
+
+def build_dashboard(rows, window):
+    """
+    Fold the grouped rows into totals, currencies, payment methods and top links,
+    each with the previous period's values and the change between them
+    """
+    periods = {True: {}, False: {}}
+    for row in rows:
+        periods[bool(row['is_current'])].setdefault(row['grouping'], []).append(row)
+    current, previous = periods[True], periods[False]
+
+    def totals(currency_rows):
+        count = sum(row['count'] for row in currency_rows)
+        success_count = sum(row['success_count'] for row in currency_rows)
+        return {
+            'count': count,
+            'success_count': success_count,
+            'failed_count': sum(row['failed_count'] for row in currency_rows),
+            'success_rate': round(success_count / count, 4) if count else None,
+        }
+
+    current_totals = totals(current.get('currency', []))
+    previous_totals = totals(previous.get('currency', []))
+
+    def success_totals(currency_rows):
+        return {
+            row['currency']: (
+                row['success_count'],
+                from_minor_units(row['success_amount_minor'], row['currency']),
+            )
+            for row in currency_rows
+        }
+
+    current_currencies = success_totals(current.get('currency', []))
+    previous_currencies = success_totals(previous.get('currency', []))
+    currencies = []
+    for currency in current_currencies.keys() | previous_currencies.keys():
+        count, total_amount = current_currencies.get(currency, (0, Decimal('0')))
+        previous_count, previous_amount = previous_currencies.get(currency, (0, Decimal('0')))
+        currencies.append({
+            'currency': currency,
+            'count': count,
+            'total_amount': total_amount,
+            'previous_count': previous_count,
+            'previous_total_amount': previous_amount,
+            'total_amount_change': change(total_amount, previous_amount),
+        })
+    currencies.sort(key=lambda row: row['total_amount'], reverse=True)
+
+    method_rows = [
+        {**row, 'payment_method': row['method']} for row in current.get('method', [])
+    ]
+    previous_method_counts = {}
+    for row in previous.get('method', []):
+        previous_method_counts[row['method']] = previous_method_counts.get(row['method'], 0) + row['count']
+    payment_methods = []
+    for method in summarize_payment_methods(method_rows):
+        previous_count = previous_method_counts.get(method['payment_method'], 0)
+        payment_methods.append({
+            **method,
+            'previous_count': previous_count,
+            'count_change': change(method['count'], previous_count),
+        })
+
+    previous_link_counts = {row['link_id']: row['success_count'] for row in previous.get('link', [])}
+    payment_links = sorted(
+        (
+            {
+                'unique_id': row['link_unique_id'],
+                'currency': row['currency'],
+                'count': row['count'],
+                'success_count': row['success_count'],
+                'total_amount': from_minor_units(row['success_amount_minor'], row['currency']),
+                'previous_success_count': previous_link_counts.get(row['link_id'], 0),
+                'success_count_change': change(row['success_count'], previous_link_counts.get(row['link_id'], 0)),
+            }
+            for row in current.get('link', [])
+        ),
+        key=lambda link: (link['success_count'], link['count']),
+        reverse=True,
+    )[:TOP_LINKS]
+
+    return {
+        'period': {
+            'start': window['current_start'],
+            'end': window['end'],
+            'previous_start': window['previous_start'],
+        },
+        'totals': {
+            **current_totals,
+            'previous': previous_totals,
+            'count_change': change(current_totals['count'], previous_totals['count']),
+            'success_count_change': change(current_totals['success_count'], previous_totals['success_count']),
+        },
+        'currencies': currencies,
+        'payment_methods': payment_methods,
+        'payment_links': payment_links,
+    }
+
+
+@query_budget(2)
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+@throttle_classes([AnalyticsUserThrottle])
+def merchant_dashboard(request):
+    """
+    Totals, currencies, payment methods and top links for the last `days` days,
+    compared with the period before
+    """
+    query_serializer = DashboardQueryParamsSerializer(data=request.GET)
+    if not query_serializer.is_valid():
+        return Response(query_serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+    try:
+        logger.info(f"Received request for merchant dashboard: {request.user}")
+        window = dashboard_window(query_serializer.validated_data)
+        return Response(build_dashboard(dashboard_rows(request.user, window), window))
+
+    except Exception as e:
+        logger.error(f"Error fetching merchant dashboard: {str(e)}")
+        return Response({
+            "error": "Failed to fetch dashboard",
+            "detail": str(e)
+        }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
@@ -0,0 +1,76 @@
+"""
+Server-Sent Events stream of the authenticated merchant's payment status changes
+"""
+import asyncio
+import logging
+
+from django.conf import settings
+from django.http import StreamingHttpResponse
+from rest_framework.utils.encoders import JSONEncoder
+
+from dealflow.async_api import api_response, async_api_view
+from dealflow.querycount import query_budget
+from dealflow.throttlers import AnalyticsUserThrottle
+from payments.events import OVERFLOW, TooManySubscriptions, get_broker
+
+logger = logging.getLogger(__name__)
+
+
+def format_event(name, data):
+    return f"event: {name}\ndata: {JSONEncoder().encode(data)}\n\n"
+
+
+async def event_stream(subscription):
+    try:
+        # Ask EventSource clients to wait a little before reconnecting
+        yield f"retry: {settings.EVENT_STREAM_RETRY_MS}\n\n"
+        while True:
+            try:
+                event = await asyncio.wait_for(subscription.get(), timeout=settings.EVENT_STREAM_HEARTBEAT)
+            except asyncio.TimeoutError:
+                # Comment line; keeps proxies from closing an idle connection
+                yield ": keep-alive\n\n"
+                continue
+
+            if event is OVERFLOW:
+                yield format_event('overflow', {'detail': "Too many pending events, reload and reconnect"})
+                return
+            yield format_event(event['type'], event)
+    finally:
+        subscription.close()
+
+
+class EventStream:
+    """
+    Streaming content that also releases the subscription from response.close(),
+    which Django calls even if iteration never started
+    """
+
+    def __init__(self, subscription):
+        self.subscription = subscription
+
+    def __aiter__(self):
+        return event_stream(self.subscription)
+
+    def close(self):
+        self.subscription.close()
+
+
+@query_budget(1)
+@async_api_view(throttle_classes=[AnalyticsUserThrottle])
+async def payment_events(request):
+    """
+    Stream payment status changes as they are committed
+    """
+    try:
+        subscription = get_broker().subscribe(request.user.pk)
+    except TooManySubscriptions as e:
+        logger.info(f"Rejected event stream: {str(e)}")
+        return api_response({'detail': "Too many open event streams."}, status=429)
+
+    logger.info(f"Opened event stream for {request.user}")
+    response = StreamingHttpResponse(EventStream(subscription), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    # Stop nginx-style proxies from buffering the stream
+    response['X-Accel-Buffering'] = 'no'
+    return response
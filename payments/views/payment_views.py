@@ -1,7 +1,5 @@
 import logging
-import stripe
 
-from datetime import datetime
 from django.conf import settings
 from django.http import  JsonResponse
 from django.shortcuts import render, get_object_or_404
@@ -9,28 +7,30 @@ from django.views.decorators.http import require_http_methods
 from rest_framework.decorators import api_view, permission_classes, throttle_classes
 from rest_framework.permissions import AllowAny, IsAuthenticated
 
+from dealflow.querycount import query_budget
 from dealflow.throttlers import PaymentAnonThrottle, PaymentUserThrottle
+from payments import funnel
+from payments.currency import from_minor_units
+from payments.gateway import StripeUnavailable, get_gateway
+from payments.idempotency import idempotent
 from payments.models import Payment, PaymentLink
 from payments.serializers.payment_serializers import PaymentLinkCreateSerializer
-
-stripe.api_key = settings.STRIPE_SECRET_KEY
+from payments.utils import get_stripe
 
 logger = logging.getLogger(__name__)
 
 
+@query_budget(8)
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
 @throttle_classes([PaymentUserThrottle])
+@idempotent
 def create_payment_link(request):
     """
-    Create a payment link
+    Create a payment link. Retries sent with the same Idempotency-Key get the first response back.
     """
     try:
         logger.info(f"Received request to create payment link: {request.data}")
-        amount = request.data.get('amount')
-        currency = request.data.get('currency', 'USD')
-        description = request.data.get('description', '')
-        expiration_date = request.data.get('expiration_date')
 
         serializer = PaymentLinkCreateSerializer(data=request.data)
         if not serializer.is_valid():
@@ -38,13 +38,14 @@ def create_payment_link(request):
                 'status': 'error',
                 'errors': serializer.errors
             }, status=400)
-        
+
+        validated_data = serializer.validated_data
         payment_link = PaymentLink.objects.create(
             user=request.user,
-            amount=amount,
-            currency=currency,
-            description=description,
-            expiration_date=expiration_date
+            amount_minor=validated_data['amount_minor'],
+            currency=validated_data['currency'],
+            description=validated_data['description'],
+            expiration_date=validated_data.get('expiration_date')
         )
         
         return JsonResponse({
@@ -61,6 +62,7 @@ def create_payment_link(request):
         }, status=400)
 
 
+@query_budget(2)
 @permission_classes([AllowAny])
 @require_http_methods(["GET"])
 @throttle_classes([PaymentAnonThrottle])
@@ -72,11 +74,12 @@ def payment_page(request, payment_id):
         logger.info(f"Received request to render payment page: {payment_id}")
         payment_link = get_object_or_404(PaymentLink, unique_id=payment_id)
 
-        if  payment_link.expiration_date <= datetime.now().date():
+        if not payment_link.is_live():
             logger.info(f"Payment link expired: {payment_id}")
             return render(request, 'payments/error.html', {'error': 'Payment link expired'})
         else:
             logger.info(f"Payment link active: {payment_id}")
+            funnel.record(payment_link.id, 'page_views')
             return render(request, 'payments/payment_page.html', {
                 'payment': payment_link,
                 'stripe_public_key': settings.STRIPE_PUBLISHABLE_KEY
@@ -89,6 +92,7 @@ def payment_page(request, payment_id):
         return render(request, 'payments/broken_link.html')
 
 
+@query_budget(2)
 @api_view(['POST'])
 @permission_classes([AllowAny])
 @throttle_classes([PaymentAnonThrottle])
@@ -96,14 +100,15 @@ def create_payment_intent(request, payment_id):
     """
     Create a payment intent
     """
+    stripe = get_stripe()
     try:
         logger.info(f"Received request to create payment intent: {payment_id}")
         # Find payment link
-        payment_link = get_object_or_404(PaymentLink, unique_id=payment_id, expiration_date__gte=datetime.now().date())
+        payment_link = PaymentLink.objects.live().get(unique_id=payment_id)
         
         # Create payment intent
-        intent =stripe.PaymentIntent.create(
-            amount=int(float(payment_link.amount) * 100),  # Convert to cents
+        intent = get_gateway().create_payment_intent(
+            amount=payment_link.amount_minor,
             currency=payment_link.currency.lower(),
             # automatic_payment_methods={
             #     'enabled': True,
@@ -116,7 +121,8 @@ def create_payment_intent(request, payment_id):
                 'payment_link_id': payment_link.unique_id
             },
         )
-        
+        funnel.record(payment_link.id, 'intents_created')
+
         return JsonResponse({
             'clientSecret': intent.client_secret
         })
@@ -127,6 +133,12 @@ def create_payment_intent(request, payment_id):
             'error': 'Payment link not found'
         }, status=404)
         
+    except StripeUnavailable as e:
+        logger.error(f"Stripe unavailable while creating payment intent: {str(e)}")
+        return JsonResponse({
+            'error': 'Payment provider unavailable, please try again shortly'
+        }, status=503)
+
     except stripe.error.StripeError as e:
         logger.error(f"Error creating payment intent: {str(e)}")
         return JsonResponse({
@@ -140,6 +152,7 @@ def create_payment_intent(request, payment_id):
         }, status=500)
     
 
+@query_budget(2)
 @permission_classes([AllowAny])
 @throttle_classes([PaymentAnonThrottle])
 def payment_completed(request):
@@ -149,22 +162,23 @@ def payment_completed(request):
     logger.info(f"Received request to handle payment completed: {request.GET}")
     payment_intent_id = request.GET.get('payment_intent')
     status = request.GET.get('redirect_status')
+    stripe = get_stripe()
     
     try:
         # Retrieve the payment intent from Stripe
-        payment_intent = stripe.PaymentIntent.retrieve(payment_intent_id)
+        payment_intent = get_gateway().retrieve_payment_intent(payment_intent_id)
         logger.info(f"Payment intent status: {payment_intent.status}")
 
         # Get the payment link ID from metadata
         payment_link_id = payment_intent.metadata.get('payment_link_id')
         
         if payment_link_id:
-            payment_link = PaymentLink.objects.get(unique_id=payment_link_id,expiration_date__gte=datetime.now().date())
+            payment_link = PaymentLink.objects.live().get(unique_id=payment_link_id)
 
             if status == 'succeeded':  
                 logger.info(f"Payment succeeded: {payment_link_id}")
                 return render(request, 'payments/success.html', {
-                    'amount': payment_intent.amount / 100,
+                    'amount': from_minor_units(payment_intent.amount, payment_intent.currency),
                     'currency': payment_intent.currency.upper(),
                 })
             elif status == 'failed':
@@ -176,6 +190,9 @@ def payment_completed(request):
             else:
                 logger.info(f"Payment status unknown: {payment_link_id}")
                 return render(request, 'payments/error.html', {'error': 'Payment status unknown'})
+    except StripeUnavailable as e:
+        logger.error(f"Stripe unavailable while handling payment completed: {str(e)}")
+        return render(request, 'payments/error.html', {'error': 'Payment provider unavailable, please refresh shortly'})
     except stripe.error.StripeError as e:
         logger.error(f"Error handling payment completed: {str(e)}")
         return render(request, 'payments/error.html', {'error': str(e)})
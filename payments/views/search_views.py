@@ -0,0 +1,143 @@
+"""
+Ranked search over a user's payment links and payments.
+
+On PostgreSQL both matching and ranking use pg_trgm word similarity (how well the
+query matches the closest stretch of a field), which the GIN trigram indexes from
+migration 0015 serve, so partial ids, emails and misspelt descriptions are found
+without scanning the tables. Other databases fall back to case-insensitive
+substring matching, ranked exact match > prefix > substring.
+"""
+import heapq
+import logging
+from itertools import islice
+
+from django.contrib.postgres.lookups import TrigramWordSimilar
+from django.contrib.postgres.search import TrigramWordSimilarity
+from django.db import connections
+from django.db.models import Case, F, FloatField, Q, Value, When
+from django.db.models.functions import Greatest
+from rest_framework import status
+from rest_framework.decorators import api_view, permission_classes, throttle_classes
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
+
+from dealflow.querycount import query_budget
+from dealflow.throttlers import AnalyticsUserThrottle
+from payments.currency import from_minor_units
+from payments.models import Payment, PaymentLink
+from payments.serializers.search_serializers import SEARCH_TYPES, SearchQueryParamsSerializer
+
+logger = logging.getLogger(__name__)
+
+SEARCH_FIELDS = {
+    'payment_link': ('unique_id', 'description'),
+    'payment': ('stripe_payment_id', 'customer_email', 'customer_name'),
+}
+RESULT_FIELDS = {
+    'payment_link': ('id', 'unique_id', 'description', 'amount_minor', 'currency', 'status', 'expiration_date', 'created_at'),
+    'payment': (
+        'id', 'stripe_payment_id', 'customer_email', 'customer_name', 'amount_minor', 'currency',
+        'status', 'created_at', 'payment_link__unique_id',
+    ),
+}
+
+
+def trigram_match(fields, query):
+    condition = Q()
+    for field in fields:
+        # field %> query: some stretch of the field is similar to the query
+        condition |= TrigramWordSimilar(F(field), Value(query))
+    return condition, Greatest(*(TrigramWordSimilarity(query, field) for field in fields))
+
+
+def substring_match(fields, query):
+    condition = Q()
+    scores = []
+    for field in fields:
+        condition |= Q(**{f'{field}__icontains': query})
+        scores.append(Case(
+            When(**{f'{field}__iexact': query}, then=Value(1.0)),
+            When(**{f'{field}__istartswith': query}, then=Value(0.75)),
+            When(**{f'{field}__icontains': query}, then=Value(0.5)),
+            default=Value(0.0),
+            output_field=FloatField(),
+        ))
+    return condition, Greatest(*scores)
+
+
+def ranked_rows(queryset, kind, query, limit):
+    match = trigram_match if connections[queryset.db].vendor == 'postgresql' else substring_match
+    condition, score = match(SEARCH_FIELDS[kind], query)
+    return (
+        queryset.filter(condition)
+        .annotate(score=score)
+        .order_by('-score', '-id')
+        .values(*RESULT_FIELDS[kind], 'score')[:limit]
+    )
+
+
+def present_result(kind, row):
+    result = {'type': kind, **row}
+    result['score'] = round(result['score'], 4)
+    result['amount'] = from_minor_units(result.pop('amount_minor'), result['currency'])
+    if kind == 'payment':
+        result['payment_link'] = result.pop('payment_link__unique_id')
+    return result
+
+
+def search_results(user, query, kinds, offset, limit):
+    """
+    One page of results across `kinds`, best first. Each kind contributes at most
+    offset + limit + 1 rows, which is all a page can need, and the sorted lists
+    are merged here.
+    """
+    querysets = {
+        'payment_link': PaymentLink.objects.filter(user=user),
+        'payment': Payment.objects.filter(payment_link__user=user),
+    }
+    ranked = [
+        [present_result(kind, row) for row in ranked_rows(querysets[kind], kind, query, offset + limit + 1)]
+        for kind in kinds
+    ]
+    merged = heapq.merge(*ranked, key=lambda result: (-result['score'], -result['id']))
+    page = list(islice(merged, offset, offset + limit + 1))
+    return page[:limit], len(page) > limit
+
+
+@query_budget(3)
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+@throttle_classes([AnalyticsUserThrottle])
+def search(request):
+    """
+    Search the user's payment links (unique_id, description) and payments
+    (stripe_payment_id, customer_email, customer_name), best matches first
+    """
+    query_serializer = SearchQueryParamsSerializer(data=request.GET)
+    if not query_serializer.is_valid():
+        return Response(query_serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+    params = query_serializer.validated_data
+    try:
+        logger.info(f"Received search request from {request.user}")
+        kinds = SEARCH_TYPES if params['type'] == 'all' else (params['type'],)
+        results, has_more = search_results(
+            request.user,
+            params['q'],
+            kinds,
+            (params['page'] - 1) * params['page_size'],
+            params['page_size'],
+        )
+        return Response({
+            'results': results,
+            'page': params['page'],
+            'page_size': params['page_size'],
+            'has_more': has_more,
+        })
+
+    except Exception as e:
+        logger.error(f"Error searching payments: {str(e)}")
+        return Response({
+            "error": "Failed to search",
+            "detail": str(e)
+        }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
@@ -1,6 +1,5 @@
-import json
 import logging
-import stripe
+from datetime import datetime, timezone
 
 from django.conf import settings
 from django.http import HttpResponse
@@ -8,13 +7,25 @@ from django.views.decorators.csrf import csrf_exempt
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.permissions import AllowAny
 
-from payments.models import Payment
+from dealflow.querycount import query_budget
+from payments import funnel
+from payments.events import publish_payment_event
 from payments.models import PaymentLink
-from payments.utils import get_payment_method_details
+from payments.services import upsert_payment
+from payments.utils import get_payment_error_details, get_payment_method_details, get_stripe
 
 logger = logging.getLogger(__name__)
 
+DISPUTE_EVENTS = {
+    'charge.dispute.created',
+    'charge.dispute.updated',
+    'charge.dispute.closed',
+    'charge.dispute.funds_withdrawn',
+    'charge.dispute.funds_reinstated',
+}
 
+
+@query_budget(10)
 @csrf_exempt
 @api_view(['POST'])
 @permission_classes([AllowAny])
@@ -23,6 +34,7 @@ def stripe_webhook(request):
     payload = request.body
     sig_header = request.headers.get('stripe-signature')
     webhook_secret = settings.STRIPE_WEBHOOK_SECRET
+    stripe = get_stripe()
 
     try:
         event = stripe.Webhook.construct_event(
@@ -30,14 +42,15 @@ def stripe_webhook(request):
         )
 
         # Handle the event based on its type
-        print("event type", event.type)
+        logger.info(f"Stripe event type: {event.type}")
         if event.type == 'payment_intent.succeeded':
-            print("payment intent succeeded")
             handle_payment_success(event.data.object)
         elif event.type == 'payment_intent.payment_failed':
             handle_payment_failure(event.data.object)
         elif event.type == 'payment_intent.requires_action':
             handle_payment_action_required(event.data.object)
+        elif event.type in DISPUTE_EVENTS:
+            handle_dispute(event.data.object)
         
         logger.info("Webhook processed successfully")
         return HttpResponse(status=200)
@@ -55,91 +68,73 @@ def handle_payment_success(payment_intent):
     try:
         # Get payment details
         payment_link_id = payment_intent.metadata.get('payment_link_id')
-        print("payment_intent", payment_intent)
         if not payment_link_id:
             logger.error("Payment link ID not found in metadata")
-        try:   
-            payment_link = PaymentLink.objects.get(unique_id=payment_link_id)
-        except PaymentLink.DoesNotExist:
-            logger.error("Payment link not found")
-            return HttpResponse(status=400)
-        
-        # Create payment record
+            return
+
         payment_method_info = get_payment_method_details(payment_intent)
-        payment, created = Payment.objects.get_or_create(
-            payment_link=payment_link,
-            stripe_payment_id=payment_intent.id,
-            defaults={
-                'amount': payment_intent.amount / 100,
+        payment, previous_status = upsert_payment(
+            payment_intent.id,
+            payment_link_unique_id=payment_link_id,
+            status='success',
+            fields={
+                'amount_minor': payment_intent.amount,
                 'currency': payment_intent.currency.upper(),
-                'status': 'success',
                 'payment_method': payment_method_info['type'],
-                'metadata': {
-                    'stripe_payment_method': payment_intent.payment_method,
-                    'stripe_customer': payment_intent.customer,
-                    'payment_method_details': json.dumps(payment_method_info['details'])
-                }
-            }
+                'card_brand': payment_method_info.get('brand'),
+                'card_last4': payment_method_info.get('last4'),
+            },
+            metadata={
+                'stripe_payment_method': payment_intent.payment_method,
+                'stripe_customer': payment_intent.customer,
+                'payment_method_details': payment_method_info['details'],
+            },
         )
-        if not created:
-            logger.info("Payment already exists, updating")
-            payment.status = 'success'
-            payment.metadata['stripe_payment_method'] = payment_intent.payment_method
-            payment.metadata['stripe_customer'] = payment_intent.customer
-            payment.metadata['payment_method_details'] = json.dumps(payment_method_info['details'])
-            payment.amount = payment_intent.amount / 100
-            payment.currency = payment_intent.currency.upper()
-            payment.payment_method = payment_method_info['type']
-            payment.save()
-        
-        # Update payment link status
-        
-        # Optional: Send success notification
-        #send_payment_success_notification(payment_link)
-        
+        # Count each payment once, however often Stripe redelivers the event
+        if previous_status != 'success':
+            funnel.record(payment.payment_link_id, 'successes')
+        # The merchant's email was queued by upsert_payment; send_notifications sends it
+        publish_payment_event(payment, previous_status)
+
+    except PaymentLink.DoesNotExist:
+        logger.error("Payment link not found")
     except Exception as e:
         logger.error(f"Error handling payment success: {str(e)}")
-        print("payment success error", e)
         raise
 
 
-
 def handle_payment_failure(payment_intent):
     """Handle failed payment"""
     try:
-        logger.info(f"Received request to handle failed payment: {payment_intent}")
+        logger.info(f"Received request to handle failed payment: {payment_intent.id}")
         payment_link_id = payment_intent.metadata.get('payment_link_id')
-        payment_link = PaymentLink.objects.get(unique_id=payment_link_id)
-        payment_method_info = get_payment_method_details(payment_intent)
-
         if not payment_link_id:
             logger.error("Payment link ID not found in metadata")
-            return HttpResponse(status=400)
-        payment, created = Payment.objects.get_or_create(
-            payment_link=payment_link,
-            stripe_payment_id=payment_intent.id,
-            defaults={
-                'amount': payment_intent.amount / 100,
+            return
+
+        payment_method_info = get_payment_method_details(payment_intent)
+        error = get_payment_error_details(payment_intent) or {}
+        payment, previous_status = upsert_payment(
+            payment_intent.id,
+            payment_link_unique_id=payment_link_id,
+            status='failed',
+            fields={
+                'amount_minor': payment_intent.amount,
                 'currency': payment_intent.currency.upper(),
-                'status': 'failed',
                 'payment_method': payment_method_info['type'],
-                'metadata': {
-                    'error': payment_intent.last_payment_error,
-                    'failure_code': payment_intent.last_payment_error.code if payment_intent.last_payment_error else None,
-                }
-            }
+                'card_brand': payment_method_info.get('brand'),
+                'card_last4': payment_method_info.get('last4'),
+                'failure_code': error.get('code'),
+                'decline_code': error.get('decline_code'),
+            },
+            metadata={
+                'error': error or None,
+            },
         )
+        if payment.status == 'failed' and previous_status != 'failed':
+            funnel.record(payment.payment_link_id, 'failures')
+        publish_payment_event(payment, previous_status)
 
-        if not created:
-            payment.status = 'failed'
-            payment.amount = payment_intent.amount / 100
-            payment.currency = payment_intent.currency.upper()
-            payment.metadata['error'] = payment_intent.last_payment_error
-            payment.metadata['failure_code'] = payment_intent.last_payment_error.code if payment_intent.last_payment_error else None
-            payment.payment_method = payment_method_info['type']
-            payment.save()
-        return HttpResponse(status=200)
-        
     except Exception as e:
         logger.error(f"Error handling payment failure: {str(e)}")
         raise
@@ -148,20 +143,49 @@ def handle_payment_failure(payment_intent):
 def handle_payment_action_required(payment_intent):
     """Handle payments requiring additional action"""
     try:
-        logger.info(f"Received request to handle payment action required: {payment_intent}")
+        logger.info(f"Received request to handle payment action required: {payment_intent.id}")
         payment_link_id = payment_intent.metadata.get('payment_link_id')
         if payment_link_id:
-            payment_link = PaymentLink.objects.get(unique_id=payment_link_id)
-            Payment.objects.create(
-                payment_link=payment_link,
-                stripe_payment_id=payment_intent.id,
-                amount=payment_intent.amount / 100,
-                currency=payment_intent.currency.upper(),
+            payment, previous_status = upsert_payment(
+                payment_intent.id,
+                payment_link_unique_id=payment_link_id,
                 status='pending',
-                
-        )
-            
-        return HttpResponse(status=200)      
+                fields={
+                    'amount_minor': payment_intent.amount,
+                    'currency': payment_intent.currency.upper(),
+                },
+            )
+            publish_payment_event(payment, previous_status)
+
     except Exception as e:
         logger.error(f"Error handling payment action required: {str(e)}")
         raise
+
+
+def handle_dispute(dispute):
+    """Record a dispute opened, updated or closed on a payment's charge"""
+    try:
+        logger.info(f"Received request to handle dispute: {dispute.id} ({dispute.status})")
+        if not dispute.payment_intent:
+            logger.error(f"Dispute {dispute.id} has no payment intent")
+            return
+
+        payment, _ = upsert_payment(
+            dispute.payment_intent,
+            fields={
+                'is_disputed': True,
+                'dispute_reason': dispute.reason,
+                'dispute_status': dispute.status,
+                'dispute_amount_minor': dispute.amount,
+                'dispute_created_at': datetime.fromtimestamp(dispute.created, tz=timezone.utc),
+            },
+            metadata={
+                'stripe_dispute': dispute.id,
+            },
+        )
+        if payment is None:
+            logger.error(f"Payment not found for dispute {dispute.id}: {dispute.payment_intent}")
+
+    except Exception as e:
+        logger.error(f"Error handling dispute: {str(e)}")
+        raise
@@ -0,0 +1,103 @@
+import logging
+
+from django.conf import settings
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.decorators import api_view, permission_classes, throttle_classes
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
+
+from dealflow.querycount import query_budget
+from dealflow.throttlers import PaymentUserThrottle
+from payments.models import WebhookDelivery, WebhookEndpoint
+from payments.serializers.webhook_serializers import (
+    WebhookDeliveryListQueryParamsSerializer,
+    WebhookDeliverySerializer,
+    WebhookEndpointCreateSerializer,
+    WebhookEndpointSerializer,
+)
+
+logger = logging.getLogger(__name__)
+
+
+@query_budget(3)
+@api_view(['GET', 'POST'])
+@permission_classes([IsAuthenticated])
+@throttle_classes([PaymentUserThrottle])
+def webhook_endpoints(request):
+    """
+    List the user's webhook endpoints, or add one. The signing secret is only returned on creation.
+    """
+    if request.method == 'GET':
+        endpoints = WebhookEndpoint.objects.filter(user=request.user).order_by('-created_at')
+        return Response(WebhookEndpointSerializer(endpoints, many=True).data)
+
+    serializer = WebhookEndpointCreateSerializer(data=request.data)
+    if not serializer.is_valid():
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+    try:
+        if WebhookEndpoint.objects.filter(user=request.user).count() >= settings.WEBHOOK_MAX_ENDPOINTS_PER_USER:
+            return Response({
+                "error": "Too many webhook endpoints",
+                "detail": f"At most {settings.WEBHOOK_MAX_ENDPOINTS_PER_USER} endpoints can be configured."
+            }, status=status.HTTP_400_BAD_REQUEST)
+        serializer.save(user=request.user)
+        return Response(serializer.data, status=status.HTTP_201_CREATED)
+
+    except Exception as e:
+        logger.error(f"Error creating webhook endpoint: {str(e)}")
+        return Response({
+            "error": "Failed to create webhook endpoint",
+            "detail": str(e)
+        }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+@query_budget(4)
+@api_view(['DELETE'])
+@permission_classes([IsAuthenticated])
+@throttle_classes([PaymentUserThrottle])
+def webhook_endpoint_detail(request, endpoint_id):
+    """
+    Remove a webhook endpoint along with its delivery history
+    """
+    deleted, _ = WebhookEndpoint.objects.filter(id=endpoint_id, user=request.user).delete()
+    if not deleted:
+        return Response({"error": "Webhook endpoint not found"}, status=status.HTTP_404_NOT_FOUND)
+    return Response(status=status.HTTP_204_NO_CONTENT)
+
+
+@query_budget(3)
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+@throttle_classes([PaymentUserThrottle])
+def webhook_deliveries(request, endpoint_id):
+    """
+    Latest deliveries to one of the user's endpoints, newest first
+    """
+    query_serializer = WebhookDeliveryListQueryParamsSerializer(data=request.GET)
+    if not query_serializer.is_valid():
+        return Response(query_serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+    if not WebhookEndpoint.objects.filter(id=endpoint_id, user=request.user).exists():
+        return Response({"error": "Webhook endpoint not found"}, status=status.HTTP_404_NOT_FOUND)
+
+    params = query_serializer.validated_data
+    deliveries = WebhookDelivery.objects.filter(endpoint_id=endpoint_id).order_by('-created_at')
+    if params.get('status'):
+        deliveries = deliveries.filter(status=params['status'])
+    return Response(WebhookDeliverySerializer(deliveries[:params['limit']], many=True).data)
+
+
+@query_budget(2)
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+@throttle_classes([PaymentUserThrottle])
+def retry_webhook_delivery(request, delivery_id):
+    """
+    Queue a dead-lettered delivery again, with a fresh set of attempts
+    """
+    retried = WebhookDelivery.objects.filter(id=delivery_id, endpoint__user=request.user, status='dead').update(
+        status='pending', attempts=0, next_attempt_at=timezone.now(),
+    )
+    if not retried:
+        return Response({"error": "Dead-lettered delivery not found"}, status=status.HTTP_404_NOT_FOUND)
+    return Response({'status': 'pending'}, status=status.HTTP_202_ACCEPTED)
@@ -0,0 +1,142 @@
+import threading
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.contrib.auth.models import User
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+
+
+class UserStatusCache:
+    """
+    Process-local, short-TTL cache of the user flags needed to authorise a request
+    """
+
+    def __init__(self, ttl=None):
+        self._ttl = ttl
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    @property
+    def ttl(self):
+        if self._ttl is not None:
+            return self._ttl
+        return getattr(settings, 'USER_AUTH_CACHE_TTL', 60)
+
+    def get(self, user_id):
+        entry = self._entries.get(user_id)
+        if entry is None:
+            return None
+        expires_at, status = entry
+        if expires_at < time.monotonic():
+            self.invalidate(user_id)
+            return None
+        return status
+
+    def set(self, user_id, status):
+        with self._lock:
+            self._entries[user_id] = (time.monotonic() + self.ttl, status)
+
+    def invalidate(self, user_id):
+        with self._lock:
+            self._entries.pop(user_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+user_status_cache = UserStatusCache()
+
+USER_STATUS_FIELDS = ('is_active', 'is_staff', 'is_superuser')
+
+
+def build_user(user_id, username, status):
+    """
+    Build an unsaved-looking User instance that behaves like a loaded row.
+    Only the id, username and status flags are populated, so it must never be saved.
+    """
+    user = User(id=user_id, username=username or '', **status)
+    user._state.adding = False
+    user._state.db = 'default'
+    return user
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    """
+    JWT authentication that builds the user from token claims instead of
+    loading the User row on every request.
+
+    Only the active/staff flags are read from the database, and those are cached
+    per process for USER_AUTH_CACHE_TTL seconds. Saving or deleting a user evicts
+    its entry (see users.signals), so changes made in this process apply at once
+    and changes made elsewhere apply within the TTL.
+    """
+
+    def get_user(self, validated_token):
+        if api_settings.CHECK_REVOKE_TOKEN:
+            # Revocation needs the password hash, which we deliberately don't cache
+            return super().get_user(validated_token)
+
+        try:
+            # Claims are serialised as strings, the cache is keyed like the signals
+            user_id = User._meta.pk.to_python(validated_token[api_settings.USER_ID_CLAIM])
+        except (KeyError, ValidationError):
+            raise InvalidToken(_("Token contained no recognizable user identification"))
+
+        status = user_status_cache.get(user_id)
+        if status is None:
+            status = self._status_queryset(user_id).first()
+            if status is None:
+                raise AuthenticationFailed(_("User not found"), code="user_not_found")
+            user_status_cache.set(user_id, status)
+
+        return self._check_user(validated_token, user_id, status)
+
+    async def aauthenticate(self, request):
+        """
+        Async counterpart of authenticate() for native async views.
+        Token validation is CPU-only; a cache miss uses the async ORM.
+        """
+        header = self.get_header(request)
+        if header is None:
+            return None
+
+        raw_token = self.get_raw_token(header)
+        if raw_token is None:
+            return None
+
+        validated_token = self.get_validated_token(raw_token)
+        return await self.aget_user(validated_token), validated_token
+
+    async def aget_user(self, validated_token):
+        if api_settings.CHECK_REVOKE_TOKEN:
+            return await sync_to_async(super().get_user)(validated_token)
+
+        try:
+            user_id = User._meta.pk.to_python(validated_token[api_settings.USER_ID_CLAIM])
+        except (KeyError, ValidationError):
+            raise InvalidToken(_("Token contained no recognizable user identification"))
+
+        status = user_status_cache.get(user_id)
+        if status is None:
+            status = await self._status_queryset(user_id).afirst()
+            if status is None:
+                raise AuthenticationFailed(_("User not found"), code="user_not_found")
+            user_status_cache.set(user_id, status)
+
+        return self._check_user(validated_token, user_id, status)
+
+    def _status_queryset(self, user_id):
+        return User.objects.filter(
+            **{api_settings.USER_ID_FIELD: user_id}
+        ).values(*USER_STATUS_FIELDS)
+
+    def _check_user(self, validated_token, user_id, status):
+        if api_settings.CHECK_USER_IS_ACTIVE and not status['is_active']:
+            raise AuthenticationFailed(_("User is inactive"), code="user_inactive")
+        return build_user(user_id, validated_token.get('username'), status)
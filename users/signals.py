@@ -0,0 +1,14 @@
+from django.contrib.auth.models import User
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from users.authentication import user_status_cache
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def invalidate_user_status(sender, instance, **kwargs):
+    """
+    Drop the cached auth status so the next request re-reads the user flags
+    """
+    user_status_cache.invalidate(instance.pk)
@@ -1,3 +1,56 @@
-from django.test import TestCase
+from unittest.mock import patch
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.test import TestCase, RequestFactory
+from rest_framework_simplejwt.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from users.authentication import CachedJWTAuthentication, user_status_cache
+from users.serilizers import LoginSerializer
+
+
+class CachedJWTAuthenticationTest(TestCase):
+    def setUp(self):
+        user_status_cache.clear()
+        self.user = User.objects.create_user(username='merchant', password='testpass123')
+        self.token = LoginSerializer.get_token(self.user).access_token
+        self.request = RequestFactory().get(
+            '/', HTTP_AUTHORIZATION=f'Bearer {self.token}'
+        )
+        self.auth = CachedJWTAuthentication()
+
+    def tearDown(self):
+        user_status_cache.clear()
+
+    def test_builds_user_from_claims(self):
+        user, _ = self.auth.authenticate(self.request)
+        self.assertEqual(user.pk, self.user.pk)
+        self.assertEqual(user.username, 'merchant')
+        self.assertTrue(user.is_authenticated)
+        self.assertFalse(user.is_staff)
+
+    def test_cached_status_skips_database(self):
+        self.auth.authenticate(self.request)
+        with self.assertNumQueries(0):
+            self.auth.authenticate(self.request)
+
+    def test_user_change_invalidates_cache(self):
+        self.auth.authenticate(self.request)
+        self.user.is_active = False
+        self.user.save()
+        with self.assertRaises(AuthenticationFailed):
+            self.auth.authenticate(self.request)
+
+    def test_cache_entry_expires(self):
+        with patch('users.authentication.time.monotonic', return_value=0):
+            self.auth.authenticate(self.request)
+        with patch('users.authentication.time.monotonic', return_value=10_000):
+            with self.assertNumQueries(1):
+                self.auth.authenticate(self.request)
+
+    def test_deleted_user_rejected(self):
+        token = RefreshToken.for_user(self.user).access_token
+        self.user.delete()
+        request = RequestFactory().get('/', HTTP_AUTHORIZATION=f'Bearer {token}')
+        with self.assertRaises(AuthenticationFailed):
+            self.auth.authenticate(request)